@@ -1,276 +1,104 @@
 import sqlite3
+from database import connect, get_db_path, get_writer
+from migrations import schema_version
+from repositories import GroceriesRepository, HomeRepository, RecipesRepository
 
 
-def add_column_to_table(database_name, table_name, column_name, column_type):
-    conn = sqlite3.connect(database_name)
-    cursor = conn.cursor()
-
+def add_column_to_table(db_path, table_name, column_name, column_type):
     try:
-        # SQL command to add a new column
+        # SQL command to add a new column, run by the database's writer thread
         sql_command = f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}"
-        
-        # Execute the SQL command
-        cursor.execute(sql_command)
-        
-        # Commit the changes
-        conn.commit()
+        get_writer(db_path).submit(lambda conn: conn.execute(sql_command)).result()
         print(f"Column '{column_name}' added successfully to table '{table_name}'")
-    
+
     except sqlite3.Error as e:
         print(f"An error occurred: {e}")
-    
-    finally:
-        # Close the connection
-        conn.close()
-
-def create_groceries_database():
-    # Connect to the database (creates it if it doesn't exist)
-    conn = sqlite3.connect('groceries.db')
-    cursor = conn.cursor()
-
-    # Create the groceries table
-
-    # id: Primary key, auto-incremented
-    # name: Name of the grocery item
-    # category: Category of the grocery item
-    # price: Price of the grocery item
-
-    # Drop existing tables
-  #  cursor.execute("DROP TABLE IF EXISTS groceries")
-   # cursor.execute("DROP TABLE IF EXISTS home")
-   # cursor.execute("DROP TABLE IF EXISTS grocerylist")
-    cursor.execute("DROP TABLE IF EXISTS recipes")
-  #  cursor.execute("DROP TABLE IF EXISTS chosenforrecipe")
-  #  cursor.execute("DROP TABLE IF EXISTS shoppinglist")
-   # cursor.execute("DROP TABLE IF EXISTS cookedrecipes")
-   # cursor.execute("DROP TABLE IF EXISTS nutrition")
-
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS nutrition (
-            id INTEGER PRIMARY KEY,
-            name TEXT NOT NULL,
-            category TEXT NOT NULL,
-            amount TEXT NOT NULL,
-            calories REAL NOT NULL,
-            fat REAL NOT NULL,
-            protein REAL NOT NULL,
-            carbs REAL NOT NULL,
-            sugar REAL NOT NULL,
-            fiber REAL NOT NULL
-            )      
-        ''')
-
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS groceries (
-            id INTEGER PRIMARY KEY,
-            name TEXT NOT NULL,
-            category TEXT NOT NULL,
-            price REAL NOT NULL,
-            amount TEXT NOT NULL
-        )
-    ''')
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS home (
-            id INTEGER PRIMARY KEY,
-            name TEXT NOT NULL,
-            category TEXT NOT NULL,
-            price REAL NOT NULL,
-            amount TEXT NOT NULL
-
-        )
-    ''')
-
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS grocerylist (
-            id INTEGER PRIMARY KEY,
-            name TEXT NOT NULL,
-            category TEXT NOT NULL,
-            price REAL NOT NULL
-        )
-    ''')
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS recipes (
-            id INTEGER PRIMARY KEY,
-            name TEXT NOT NULL,
-            original_ingredients TEXT NOT NULL,
-            ingredients TEXT NOT NULL,
-            amount TEXT NOT NULL,
-            servings REAL NOT NULL,
-            link TEXT NOT NULL,
-            nutrition_values TEXT 
-        )
-    ''')
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS chosenforrecipe (
-            id INTEGER PRIMARY KEY,
-            name TEXT NOT NULL,
-            category TEXT NOT NULL,
-            price REAL NOT NULL,
-            athome BOOL NOT NULL,
-            amount TEXT NOT NULL
-        )
-    ''')
-
-    cursor.execute('''
-            CREATE TABLE IF NOT EXISTS shoppinglist (
-                id INTEGER PRIMARY KEY,
-                name TEXT NOT NULL,
-                category TEXT NOT NULL,
-                price REAL NOT NULL,
-                amount TEXT NOT NULL,
-                quantity REAL NOT NULL
-                   
-        )
-    ''')
-
-    cursor.execute('''
-            CREATE TABLE IF NOT EXISTS cookedrecipes (
-                id INTEGER PRIMARY KEY,
-                name TEXT NOT NULL,
-                quantity REAL NOT NULL
-         )
-    ''')
-
-
-
-    # Commit changes and close connection
-    conn.commit()
-    conn.close()
-
-    print("Database created successfully")
-
-
-def drop_table(database_name, table_name):
-    try:
-        # Connect to the database
-        conn = sqlite3.connect(database_name)
-        cursor = conn.cursor()
 
-        # SQL command to drop the table
-        drop_table_sql = f"DROP TABLE IF EXISTS {table_name}"
+def create_groceries_database(db_path=None):
+    # Opening the shared connection creates the database if it doesn't exist and runs the
+    # versioned migrations; existing tables and their data are never dropped (see migrations.MIGRATIONS)
+    conn = connect(db_path)
+    print(f"Database {get_db_path(db_path)} is up to date (schema version {schema_version(conn)})")
 
-        # Execute the SQL command
-        cursor.execute(drop_table_sql)
 
-        # Commit the changes
-        conn.commit()
+def drop_table(db_path, table_name):
+    try:
+        # SQL command to drop the table, run by the database's writer thread
+        drop_table_sql = f"DROP TABLE IF EXISTS {table_name}"
+        get_writer(db_path).submit(lambda conn: conn.execute(drop_table_sql)).result()
 
-        print(f"Table '{table_name}' has been successfully dropped from '{database_name}'.")
+        print(f"Table '{table_name}' has been successfully dropped from '{get_db_path(db_path)}'.")
 
     except sqlite3.Error as e:
         print(f"An error occurred: {e}")
 
-    finally:
-        # Close the connection
-        if conn:
-            conn.close()
-
-
 
-def insert_sample_data():
-    conn = sqlite3.connect('groceries.db')
-    cursor = conn.cursor()
 
-    # Sample grocery items
+def insert_sample_data(db_path=None):
+    # Sample items at home: (name, category, price, amount)
     groceries = [
-        ('Apple', 'Fruit'),
-        ('Bread', 'Bakery'),
-        ('Milk', 'Dairy'),
-        ('Chicken', 'Meat'),
-        ('Carrot', 'Vegetable')
+        ('Apple', 'Fruit', 0.35, '180g'),
+        ('Bread', 'Bakery', 1.2, '800g'),
+        ('Milk', 'Dairy', 1.1, '1000ml'),
+        ('Chicken', 'Meat', 4.5, '500g'),
+        ('Carrot', 'Vegetable', 0.2, '100g')
     ]
 
     # Insert sample data
-    cursor.executemany('INSERT INTO home (name, category) VALUES (?, ?)', groceries)
-
-    conn.commit()
-    conn.close()
+    get_writer(db_path).submit(
+        lambda conn: HomeRepository(conn).insert_many(['name', 'category', 'price', 'amount'], groceries)).result()
 
     print("Sample data inserted successfully.")
 
-def display_all_groceries():
-    conn = sqlite3.connect('groceries.db')
-    cursor = conn.cursor()
-
+def display_all_groceries(db_path=None):
     # Query and display all groceries
-    cursor.execute('SELECT * FROM groceries')
-    groceries = cursor.fetchall()
+    groceries = GroceriesRepository(connect(db_path)).get_all()
 
     print("\nAll Groceries:")
     for grocery in groceries:
         print(f"ID: {grocery[0]}, Name: {grocery[1]}, Category: {grocery[2]}, Price: ${grocery[3]:.2f}")
 
-    conn.close()
-
-def display_all_home():
-    conn = sqlite3.connect('groceries.db')
-    cursor = conn.cursor()
-
-    # Query and display all groceries
-    cursor.execute('SELECT * FROM home')
-    groceries = cursor.fetchall()
+def display_all_home(db_path=None):
+    # Query and display everything at home
+    groceries = HomeRepository(connect(db_path)).get_all()
 
     print("\nAll Items at Home:")
-    for grocery in groceries:
-        print(f"ID: {grocery[0]}, Name: {grocery[1]}, Category: {grocery[2]}")
+    for name, category in groceries:
+        print(f"Name: {name}, Category: {category}")
 
-    conn.close()
-
-def display_all_recipes():
-    conn = sqlite3.connect('groceries.db')
-    cursor = conn.cursor()
-
-    # Query and display all groceries
-    cursor.execute('SELECT * FROM recipes')
-    groceries = cursor.fetchall()
+def display_all_recipes(db_path=None):
+    # Query and display all recipes
+    recipes = RecipesRepository(connect(db_path)).get_all()
 
     print("\nAll Recipes:")
-    for grocery in groceries:
-        print(f"ID: {grocery[0]}, Name: {grocery[1]}, Ingredients: {grocery[2]}")
-
-    conn.close()
-
+    for recipe in recipes:
+        print(f"ID: {recipe[0]}, Name: {recipe[1]}, Ingredients: {recipe[2]}")
 
 
-def empty_groceries_table():
-    try:
-        # Connect to the database
-        conn = sqlite3.connect('groceries.db')
-        cursor = conn.cursor()
 
+def empty_groceries_table(db_path=None):
+    def empty(conn):
         # Delete all rows from the groceries table
-        cursor.execute('DELETE FROM groceries')
+        GroceriesRepository(conn).clear()
 
         # Try to reset the auto-incrementing primary key if sqlite_sequence exists
         try:
-            cursor.execute('DELETE FROM sqlite_sequence WHERE name="groceries"')
+            conn.execute("DELETE FROM sqlite_sequence WHERE name = 'groceries'")
         except sqlite3.OperationalError:
             # If sqlite_sequence doesn't exist, we can ignore this step
             pass
 
-        # Commit the changes
-        conn.commit()
+    try:
+        get_writer(db_path).submit(empty).result()
 
         # Verify that the table is empty
-        cursor.execute('SELECT COUNT(*) FROM groceries')
-        count = cursor.fetchone()[0]
+        count = GroceriesRepository(connect(db_path)).count()
 
         print(f"All data has been deleted from the groceries table. Current row count: {count}")
 
     except sqlite3.Error as e:
         print(f"An error occurred: {e}")
 
-    finally:
-        # Close the connection
-        if conn:
-            conn.close()
-
 if __name__ == "__main__":
     create_groceries_database()
    # insert_sample_data()
@@ -278,8 +106,8 @@ if __name__ == "__main__":
   #  display_all_home()
     
    # empty_groceries_table()
-  #  drop_table('groceries', 'home')
-  #  add_column_to_table('groceries.db', 'recipes', 'nutrition_values', 'TEXT')
+  #  drop_table(None, 'home')
+  #  add_column_to_table(None, 'recipes', 'nutrition_values', 'TEXT')
 
 
 
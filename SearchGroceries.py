@@ -1,50 +1,29 @@
+from database import get_writer
+from repositories import GroceriesRepository, GroceryListRepository
+from full_text_search import DEFAULT_SEARCH_LIMIT
 
-import sqlite3
 
-
-def search_groceries(search_term, search_type='both'):
-    conn = sqlite3.connect('groceries.db')
-    cursor = conn.cursor()
-    
-    if search_type == 'name':
-        query = "SELECT * FROM groceries WHERE name LIKE ?"
-        params = (f"%{search_term}%",)
-    elif search_type == 'category':
-        query = "SELECT * FROM groceries WHERE category LIKE ?"
-        params = (f"%{search_term}%",)
-    else:  # 'both'
-        query = "SELECT * FROM groceries WHERE name LIKE ? OR category LIKE ?"
-        params = (f"%{search_term}%", f"%{search_term}%")
-    
-    cursor.execute(query, params)
-    results = cursor.fetchall()
-    conn.close()
-    return results
+def search_groceries(search_term, search_type='both', limit=DEFAULT_SEARCH_LIMIT):
+    # Best matches first; words are matched as prefixes ("tom" finds tomatoes)
+    return GroceriesRepository().search(search_term, search_type, limit)
 
 def add_to_grocerylist(item_id):
-    conn = sqlite3.connect('groceries.db')
-    cursor = conn.cursor()
-    
-    # Get item details from groceries table
-    cursor.execute("SELECT name, category, price FROM groceries WHERE id = ?", (item_id,))
-    item = cursor.fetchone()
-    
+    def write(conn):
+        # Get item details from groceries table and add the item to the grocerylist table
+        item = GroceriesRepository(conn).get_item(item_id)
+        if item:
+            GroceryListRepository(conn).add(*item)
+        return item
+
+    # Written by the database's writer thread; wait until it is committed
+    item = get_writer().submit(write).result()
     if item:
-        # Add item to grocerylist table
-        cursor.execute("INSERT INTO grocerylist (name, category, price) VALUES (?, ?, ?)", item)
-        conn.commit()
         print(f"Added {item[0]} to your grocery list.")
     else:
         print("Item not found.")
-    
-    conn.close()
 
 def view_grocerylist():
-    conn = sqlite3.connect('groceries.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM grocerylist")
-    items = cursor.fetchall()
-    conn.close()
+    items = GroceryListRepository().get_all()
     
     if items:
         print("Your grocery list:")
@@ -54,19 +33,11 @@ def view_grocerylist():
         print("Your grocery list is empty.")
 
 def calculate_total_price():
-    conn = sqlite3.connect('groceries.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT SUM(price) FROM grocerylist")
-    total = cursor.fetchone()[0]
-    conn.close()
+    total = GroceryListRepository().total_price()
     return total if total else 0
 
 def clear_grocerylist():
-    conn = sqlite3.connect('groceries.db')
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM grocerylist")
-    conn.commit()
-    conn.close()
+    get_writer().submit(lambda conn: GroceryListRepository(conn).clear()).result()
     print("Grocery list cleared.")
 
 def main():
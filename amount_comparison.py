@@ -12,18 +12,19 @@ def compare_amounts(amount1, amount2):
     return value1 - value2
 
 def extract_value_and_unit(amount_str):
-    # Use regex to extract the numeric value and unit
-    match = re.match(r"(\d+(?:\.\d+)?)\s*([a-zA-Z]+)", amount_str)
-    if match:
-        value = float(match.group(1))
-        unit = match.group(2).lower()
-        return value, unit
-    else:
+    # Numeric value and unit of an amount, converted to its base unit when the unit is known (see
+    # parse_base_amount); other units such as '1loaf' or '2head' are returned as written
+    try:
+        return parse_base_amount(amount_str)
+    except ValueError:
+        match = re.match(r"(\d+(?:\.\d+)?)\s*([a-zA-Z]+)", str(amount_str))
+        if match:
+            return float(match.group(1)), match.group(2).lower()
         raise ValueError(f"Invalid amount format: {amount_str}")
 
 def convert_to_common_unit(value, unit):
     # Convert to grams for weight, milliliters for volume
-    if unit in ['g', 'ml']:
+    if unit in ['g', 'ml', 'piece']:
         return value
     elif unit == 'kg':
         return value * 1000  # convert to grams
@@ -42,3 +43,39 @@ def is_enough_ingredient(home_amount, recipe_amount):
         return False
 
 
+
+
+# Base units amounts are normalised to: grams, millilitres or pieces
+UNIT_FACTORS = {
+    'mg': (0.001, 'g'),
+    'g': (1, 'g'),
+    'kg': (1000, 'g'),
+    'ml': (1, 'ml'),
+    'cl': (10, 'ml'),
+    'l': (1000, 'ml'),
+    'piece': (1, 'piece'),
+    'pieces': (1, 'piece'),
+}
+
+def parse_base_amount(amount_str):
+    # Parse '300g', '1.5 kg', '250ml', '1/4', '4pieces' into (value, base unit);
+    # amounts without a unit (like '1/4' onion) are counted in pieces
+    match = re.match(r"^\s*(\d+(?:\.\d+)?)(?:/(\d+(?:\.\d+)?))?\s*([a-zA-Z]*)\s*$", str(amount_str))
+    if not match:
+        raise ValueError(f"Invalid amount format: {amount_str}")
+    value = float(match.group(1))
+    if match.group(2):
+        value /= float(match.group(2))
+    unit = match.group(3).lower() or 'piece'
+    if unit not in UNIT_FACTORS:
+        raise ValueError(f"Unsupported unit: {unit}")
+    factor, base_unit = UNIT_FACTORS[unit]
+    return value * factor, base_unit
+
+
+def base_amount_columns(amount_str):
+    # (amount_value, amount_unit) stored next to an amount string; (None, None) when it cannot be read
+    try:
+        return parse_base_amount(amount_str)
+    except ValueError:
+        return None, None
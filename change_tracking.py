@@ -0,0 +1,25 @@
+"""Per-table change counters, bumped by triggers on every write to the table"""
+
+
+def track_table_changes(conn, table):
+    # Creates the counter of a table and the triggers that bump it
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO table_versions (name, version) VALUES (?, 0)", (table,))
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_version_{event.lower()} AFTER {event} ON {table}
+            BEGIN
+                UPDATE table_versions SET version = version + 1 WHERE name = '{table}';
+            END
+        ''')
+
+
+def table_version(conn, table):
+    # Changes whenever the table was written to, from any connection
+    row = conn.execute("SELECT version FROM table_versions WHERE name = ?", (table,)).fetchone()
+    return row[0] if row else None
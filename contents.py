@@ -6,12 +6,14 @@ from PyQt5.QtCore import Qt, QSortFilterProxyModel, QUrl
 from PyQt5.QtGui import QStandardItemModel, QStandardItem, QDesktopServices
 
 from recommender import RecipeRecommender  
-from amount_comparison import compare_amounts, extract_value_and_unit, convert_to_common_unit, is_enough_ingredient
+from recipe_ingredients import format_amount
+from recipe_nutrition_calculator import format_nutrition
+from amount_comparison import parse_base_amount
 
 class RecipeRecommenderGUI(QMainWindow):
     def __init__(self):
         super().__init__()
-        self.recommender = RecipeRecommender('groceries.db')
+        self.recommender = RecipeRecommender()
         self.initUI()
 
     def initUI(self):
@@ -32,6 +34,10 @@ class RecipeRecommenderGUI(QMainWindow):
         recommend_button.clicked.connect(self.show_recommendations)
         recommendation_layout.addWidget(recommend_button)
 
+        cheapest_button = QPushButton('Cheapest to Cook Right Now')
+        cheapest_button.clicked.connect(self.show_cheapest_recipes)
+        recommendation_layout.addWidget(cheapest_button)
+
         select_button = QPushButton('Select Recipe')
         select_button.clicked.connect(self.select_recipe)
         recommendation_layout.addWidget(select_button)
@@ -70,10 +76,17 @@ class RecipeRecommenderGUI(QMainWindow):
 
 
     def show_recommendations(self):
-        recommendations = self.recommender.recommend_recipes()
+        recommendations = self.recommender.recommend_cookable_recipes()
         self.recommendation_list.clear()
         for _, row in recommendations.iterrows():
-            self.recommendation_list.addItem(f"{row['name']} (Similarity: {row['similarity']:.2f})")
+            self.recommendation_list.addItem(
+                f"{row['name']} (Cookable: {row['cookable']:.0%}, Similarity: {row['similarity']:.2f})")
+
+    def show_cheapest_recipes(self):
+        recommendations = self.recommender.recommend_cheapest_recipes()
+        self.recommendation_list.clear()
+        for _, row in recommendations.iterrows():
+            self.recommendation_list.addItem(f"{row['name']} (To buy: ${row['cost']:.2f})")
 
     def select_recipe(self):
         selected_items = self.recommendation_list.selectedItems()
@@ -193,12 +206,11 @@ class SelectByIngredientDialog(QDialog):
 
     def update_search_results(self, text):
         self.ingredient_list.clear()
-        self.recommender.cursor.execute("""
-            SELECT name, category FROM groceries 
-            WHERE name LIKE ? OR category LIKE ?
-        """, (f'%{text}%', f'%{text}%'))
-        ingredients = self.recommender.cursor.fetchall()
-        for name, category in ingredients:
+        if not text.strip():
+            self.populate_ingredients()
+            return
+        # Ranked full-text matches on name, category, brand and description
+        for name, category in self.recommender.search_groceries(text):
             self.ingredient_list.addItem(f"{name} ({category})")
 
     def add_ingredient(self, item):
@@ -224,18 +236,12 @@ class SelectByIngredientDialog(QDialog):
         if not self.selected_ingredients:
             return
 
-        # Get all recipes
-        self.recommender.cursor.execute("SELECT id, name, original_ingredients FROM recipes")
-        all_recipes = self.recommender.cursor.fetchall()
+        # Intersect the posting lists of the selected categories
+        recipe_ids = self.recommender.get_recipes_with_categories(self.selected_ingredients.values())
+        recipe_names = self.recommender.get_recipe_names(recipe_ids)
 
-        possible_recipes = []
-        for recipe_id, recipe_name, original_ingredients in all_recipes:
-            recipe_ingredients = set(original_ingredients.split())
-            if all(category in recipe_ingredients for category in self.selected_ingredients.values()):
-                possible_recipes.append(recipe_name)
-
-        for recipe in possible_recipes:
-            self.recipe_combo.addItem(recipe)
+        for recipe_id in recipe_ids:
+            self.recipe_combo.addItem(recipe_names[recipe_id])
 
 
 class ShoppingListDialog(QDialog):
@@ -295,7 +301,13 @@ class ShoppingListDialog(QDialog):
             self.model.appendRow(item)
 
     def update_search_results(self, text):
-        self.proxy_model.setFilterRegExp(f"\\b{text}")
+        self.model.clear()
+        if not text.strip():
+            self.populate_groceries()
+            return
+        # Ranked full-text matches instead of filtering the whole catalog
+        for name, _ in self.recommender.search_groceries(text):
+            self.model.appendRow(QStandardItem(name))
 
     def add_selected_grocery(self):
         selected_indexes = self.list_view.selectedIndexes()
@@ -354,38 +366,13 @@ class ShoppingListDialog(QDialog):
         self.total_label.setText(f"Total Price: ${total_price:.2f}")
 
     def update_quantity(self, name, change):
-        self.recommender.cursor.execute("SELECT quantity, price, amount FROM shoppinglist WHERE name = ?", (name,))
-        current_data = self.recommender.cursor.fetchone()
-        if current_data:
-            current_quantity, current_price, current_amount = current_data
-            new_quantity = max(0, current_quantity + change)
-
-            if new_quantity == 0:
-                self.recommender.cursor.execute("DELETE FROM shoppinglist WHERE name = ?", (name,))
-            else:
-                # Get original price and amount from groceries table
-                self.recommender.cursor.execute("SELECT price, amount FROM groceries WHERE name = ?", (name,))
-                original_data = self.recommender.cursor.fetchone()
-                if original_data:
-                    original_price, original_amount = original_data
-                    new_price = (new_quantity / current_quantity) * current_price
-                    new_amount = f"{self.get_amount_value(current_amount) * (new_quantity / current_quantity)}{self.get_amount_unit(current_amount)}"
-
-                    self.recommender.cursor.execute("""
-                        UPDATE shoppinglist 
-                        SET quantity = ?, price = ?, amount = ? 
-                        WHERE name = ?
-                    """, (new_quantity, new_price, new_amount, name))
-
-            self.recommender.conn.commit()
+        item = self.recommender.shopping_list.get_item(name)
+        if item:
+            current_quantity = item[2]
+            # Amount and price are scaled with the quantity in SQL, on the stored base amounts
+            self.recommender.set_shopping_list_quantity(name, max(0, current_quantity + change))
             self.load_shopping_list()
 
-    def get_amount_value(self, amount_str):
-        return float(''.join(char for char in amount_str if char.isdigit() or char == '.'))
-
-    def get_amount_unit(self, amount_str):
-        return ''.join(char for char in amount_str if char.isalpha())          
-
 """
 class CookingDialog(QDialog):
     def __init__(self, recommender):
@@ -500,7 +487,15 @@ class CookingDialog(QDialog):
             self.model.appendRow(item)
 
     def update_search_results(self, text):
-        self.proxy_model.setFilterRegExp(f"\\b{text}")
+        self.model.clear()
+        if not text.strip():
+            self.populate_recipes()
+            return
+        # Ranked full-text matches on recipe name, ingredients and summary
+        for recipe_id, name in self.recommender.search_recipes(text):
+            item = QStandardItem(name)
+            item.setData(recipe_id, Qt.UserRole)
+            self.model.appendRow(item)
 
     def view_recipe_details(self):
         selected_indexes = self.list_view.selectedIndexes()
@@ -525,6 +520,8 @@ class RecipeDetailDialog(QDialog):
         self.recipe_name = recipe_name
         self.original_servings = self.get_original_servings()
         self.current_servings = self.original_servings
+        # Nutrients per serving, read once; a servings change only multiplies them
+        self.nutrition_per_serving = self.recommender.get_recipe_nutrition(recipe_id)
         self.insufficient_ingredients = []
         self.initUI()
 
@@ -621,16 +618,9 @@ class RecipeDetailDialog(QDialog):
         self.check_ingredient_availability()
 
     def check_ingredient_availability(self):
-        self.insufficient_ingredients = []
-        recipe_ingredients = self.recommender.get_recipe_ingredients_and_amounts(self.recipe_id)[0]
-        scaling_factor = self.current_servings / self.original_servings
-
-        for ingredient, amount in recipe_ingredients:
-            required_amount = self.recommender.scale_amount(amount, scaling_factor)
-            home_amount = self.recommender.get_home_ingredient_amount(ingredient)
-
-            if not self.recommender.is_sufficient_amount(home_amount, required_amount):
-                self.insufficient_ingredients.append(ingredient)
+        # One vectorized comparison of the scaled recipe amounts against the home inventory
+        self.insufficient_ingredients = self.recommender.get_insufficient_ingredients(
+            self.recipe_id, self.current_servings)
 
         if self.insufficient_ingredients:
             self.show_ingredient_warning()
@@ -645,29 +635,15 @@ class RecipeDetailDialog(QDialog):
         self.update_nutrition()
 
     def update_ingredients(self):
-        self.recommender.cursor.execute("""
-            SELECT original_ingredients, amount, servings 
-            FROM recipes 
-            WHERE id = ?
-        """, (self.recipe_id,))
-        result = self.recommender.cursor.fetchone()
+        rows = self.recommender.get_recipe_ingredient_rows(self.recipe_id)
         
-        if result:
-            original_ingredients, original_amounts, original_servings = result
-            ingredients_list = original_ingredients.split()
-            amounts_list = original_amounts.split()
-            
-            # Ensure the lists have the same length
-            min_length = min(len(ingredients_list), len(amounts_list))
-            ingredients_list = ingredients_list[:min_length]
-            amounts_list = amounts_list[:min_length]
-            
+        if rows:
             # Calculate new amounts based on serving size
-            scaling_factor = self.current_servings / original_servings
-            new_amounts = [f"{float(amt.rstrip('gml')) * scaling_factor:.1f}{amt[-1] if amt[-1] in 'gml' else ''}" 
-                           for amt in amounts_list]
-            
-            ingredients_with_amounts = [f"• {ing}: {amt}" for ing, amt in zip(ingredients_list, new_amounts)]
+            scaling_factor = self.current_servings / self.original_servings
+            ingredients_with_amounts = [
+                f"• {original_text}: {format_amount(round(value * scaling_factor, 1), unit)}" if value is not None
+                else f"• {original_text}"
+                for _, original_text, value, unit in rows]
             formatted_ingredients = "\n".join(ingredients_with_amounts)
             
             self.ingredients_text.setPlainText(f"Servings: {self.current_servings}\n\nIngredients:\n{formatted_ingredients}")
@@ -675,20 +651,9 @@ class RecipeDetailDialog(QDialog):
             self.ingredients_text.setPlainText("No ingredients found for this recipe.")
 
     def update_nutrition(self):
-        self.recommender.cursor.execute("SELECT nutrition_values FROM recipes WHERE id = ?", (self.recipe_id,))
-        nutrition = self.recommender.cursor.fetchone()
-        if nutrition and nutrition[0]:
-            original_nutrition = nutrition[0].split('\n')
-            scaling_factor = self.current_servings / self.original_servings
-            new_nutrition = []
-            for line in original_nutrition:
-                nutrient, value = line.split(': ')
-                if 'g' in value:
-                    new_value = f"{float(value[:-1]) * scaling_factor:.2f}g"
-                else:
-                    new_value = f"{float(value) * scaling_factor:.2f}"
-                new_nutrition.append(f"{nutrient}: {new_value}")
-            self.nutrition_label.setText('\n'.join(new_nutrition))
+        if self.nutrition_per_serving:
+            self.nutrition_label.setText(format_nutrition(
+                [value * self.current_servings for value in self.nutrition_per_serving]))
         else:
             self.nutrition_label.setText("Nutrition information not available")
 
@@ -702,36 +667,21 @@ class RecipeDetailDialog(QDialog):
         return link[0] if link else ""
 
     def get_ingredients(self):
-        self.recommender.cursor.execute("""
-            SELECT original_ingredients, amount, servings 
-            FROM recipes 
-            WHERE id = ?
-        """, (self.recipe_id,))
-        result = self.recommender.cursor.fetchone()
+        rows = self.recommender.get_recipe_ingredient_rows(self.recipe_id)
         
-        if result:
-            original_ingredients, amounts, servings = result
-            ingredients_list = original_ingredients.split()
-            amounts_list = amounts.split()
-            
-            # Ensure the lists have the same length
-            min_length = min(len(ingredients_list), len(amounts_list))
-            ingredients_list = ingredients_list[:min_length]
-            amounts_list = amounts_list[:min_length]
-            
-            ingredients_with_amounts = [f"• {ing}: {amt}" for ing, amt in zip(ingredients_list, amounts_list)]
+        if rows:
+            ingredients_with_amounts = [f"• {original_text}: {format_amount(value, unit)}"
+                                        for _, original_text, value, unit in rows]
             formatted_ingredients = "\n".join(ingredients_with_amounts)
             
-            return f"Servings: {servings}\n\nIngredients:\n{formatted_ingredients}"
+            return f"Servings: {self.original_servings}\n\nIngredients:\n{formatted_ingredients}"
         else:
             return "No ingredients found for this recipe."
         
 
     def get_nutrition_values(self):
-        self.recommender.cursor.execute("SELECT nutrition_values FROM recipes WHERE id = ?", (self.recipe_id,))
-        nutrition = self.recommender.cursor.fetchone()
-        if nutrition and nutrition[0]:
-            return nutrition[0]
+        if self.nutrition_per_serving:
+            return format_nutrition([value * self.original_servings for value in self.nutrition_per_serving])
         else:
             return "Nutrition information not available"
         
@@ -743,8 +693,7 @@ class RecipeDetailDialog(QDialog):
 
     def save_summary(self):
         summary = self.summary_text.toPlainText()
-        self.recommender.cursor.execute("UPDATE recipes SET summary = ? WHERE id = ?", (summary, self.recipe_id))
-        self.recommender.conn.commit()
+        self.recommender.save_recipe_summary(self.recipe_id, summary)
         QMessageBox.information(self, 'Success', 'Recipe summary has been saved.')
 
     def finish_cooking(self):
@@ -757,8 +706,8 @@ class RecipeDetailDialog(QDialog):
                                      QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         
         if reply == QMessageBox.Yes:
-            self.recommender.add_to_cooked_recipes(self.recipe_id)
-            self.recommender.update_home_ingredients(self.recipe_id, self.current_servings)
+            # Home inventory and cooked recipes are updated together in one transaction
+            self.recommender.cook_recipes({self.recipe_id: self.current_servings})
             QMessageBox.information(self, 'Success', f'{self.recipe_name} for {self.current_servings} servings has been added to your cooked recipes and home ingredients have been updated.')
             self.accept()
         else:
@@ -817,6 +766,10 @@ class IngredientSelectionDialog(QDialog):
         scroll.setWidget(scroll_content)
         layout.addWidget(scroll)
 
+        suggest_button = QPushButton('Suggest Cheapest Packs')
+        suggest_button.clicked.connect(self.suggest_cheapest_packs)
+        layout.addWidget(suggest_button)
+
         confirm_button = QPushButton('Confirm Selection')
         confirm_button.clicked.connect(self.confirm_selection)
         layout.addWidget(confirm_button)
@@ -888,6 +841,26 @@ class IngredientSelectionDialog(QDialog):
         group_box.setLayout(group_layout)
         self.scroll_layout.addWidget(group_box)
 
+    def suggest_cheapest_packs(self):
+        # Fill in the cheapest packs covering what is not at home for the current servings
+        plan, unavailable = self.recommender.plan_cheapest_purchase(self.recipe_id, self.current_servings)
+
+        for ingredient, items in self.chosen_ingredients.items():
+            chosen_counts = {}
+            if ingredient in plan:
+                chosen_counts = {pack['name']: count for pack, count in plan[ingredient]['packs']}
+            for name, item_data in items.items():
+                if isinstance(item_data, dict) and 'quantity_label' in item_data:
+                    item_data['quantity'] = chosen_counts.get(name, 0)
+                    item_data['quantity_label'].setText(str(item_data['quantity']))
+            self.update_total_amount(ingredient)
+
+        total_cost = sum(category_plan['cost'] for category_plan in plan.values())
+        message = f"Cheapest packs to buy: ${total_cost:.2f}"
+        if unavailable:
+            message += f"\n\nNo grocery option covers: {', '.join(unavailable)}"
+        QMessageBox.information(self, 'Suggested Packs', message)
+
     def update_servings(self, new_servings):
         self.current_servings = new_servings
         scaling_factor = self.current_servings / self.original_servings
@@ -904,9 +877,11 @@ class IngredientSelectionDialog(QDialog):
         self.update_all_total_amounts()
 
     def scale_amount(self, amount, factor):
-        value = float(''.join(char for char in amount if char.isdigit() or char == '.'))
-        unit = ''.join(char for char in amount if char.isalpha())
-        return f"{value * factor:.1f}{unit}"
+        try:
+            value, unit = parse_base_amount(amount)
+        except ValueError:
+            return amount
+        return format_amount(round(value * factor, 1), unit)
 
     def update_all_total_amounts(self):
         for ingredient in self.chosen_ingredients:
@@ -955,8 +930,8 @@ class IngredientSelectionDialog(QDialog):
         for name, item_data in self.chosen_ingredients[ingredient].items():
             if isinstance(item_data, dict) and 'quantity' in item_data:
                 quantity = item_data['quantity']
-                amount = self.recommender.get_grocery_item_amount(name)
-                total_amount += quantity * self.get_amount_value(amount)
+                amount_value, _ = self.recommender.get_grocery_item_base_amount(name)
+                total_amount += quantity * amount_value
 
         total_label = self.chosen_ingredients[ingredient]['total_label']
         total_label.setText(f"Selected: {total_amount}{recipe_amount_parsed.split()[1]} / {recipe_amount_parsed}")
@@ -968,18 +943,19 @@ class IngredientSelectionDialog(QDialog):
             total_label.setStyleSheet("color: red;")
 
     def parse_amount(self, amount_str):
-        # Convert amount string to a consistent format with a space before the unit
-        units = ['kg', 'g', 'ml', 'l', 'piece']
-        for unit in units:
-            if amount_str.endswith(unit):
-                number = amount_str[:-len(unit)]
-                return f"{number} {unit}"
-        return amount_str  # Return as is if no known unit is found
+        # Amount in its base unit with a space before the unit, e.g. '1kg' -> '1000 g'
+        try:
+            value, unit = parse_base_amount(amount_str)
+        except ValueError:
+            return f"{amount_str} ?"
+        return f"{value:g} {unit}"
 
     def get_amount_value(self, amount_str):
-        parsed = self.parse_amount(amount_str)
-        value, unit = parsed.split()
-        return float(value)
+        # Numeric amount in grams, millilitres or pieces (0 when it cannot be read)
+        try:
+            return parse_base_amount(amount_str)[0]
+        except ValueError:
+            return 0.0
 
     def confirm_selection(self):
         missing_ingredients = []
@@ -1001,11 +977,10 @@ class IngredientSelectionDialog(QDialog):
                 if isinstance(item_data, dict) and 'quantity' in item_data:
                     quantity = item_data['quantity']
                     if quantity > 0:
-                        amount = self.recommender.get_grocery_item_amount(name)
+                        amount_value, amount_unit = self.recommender.get_grocery_item_base_amount(name)
                         price = self.recommender.get_grocery_item_price(name)
-                        amount_value = self.get_amount_value(amount)
                         total_amount += quantity * amount_value
-                        new_amount = f"{quantity * amount_value}{amount[-1]}"
+                        new_amount = format_amount(quantity * amount_value, amount_unit)
                         new_price = price * quantity
                         selected_ingredients.append((ingredient, name, new_price, new_amount, False))
 
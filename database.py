@@ -0,0 +1,219 @@
+"""
+One SQLite connection per thread and database, set up once and shared by all
+modules, plus a single writer thread per database. The database runs in WAL
+mode, so readers never block the writer (or each other) and only writers are
+serialised; routing writes through the writer queue avoids "database is
+locked" errors between the GUI and background imports.
+"""
+
+import os
+import atexit
+import sqlite3
+import queue
+import threading
+from concurrent.futures import Future
+
+# Database used when no path is given; can be overridden with the GROCERIES_DB environment variable
+DEFAULT_DB_PATH = os.environ.get('GROCERIES_DB', 'groceries.db')
+
+# Number of prepared statements each connection keeps (sqlite3's default is 128)
+CACHED_STATEMENTS = 256
+
+# How long a connection waits for another one's write lock before giving up, in milliseconds
+BUSY_TIMEOUT_MS = 10000
+
+# Most write jobs the writer thread commits in one transaction
+MAX_WRITE_BATCH = 500
+
+_local = threading.local()
+_lock = threading.Lock()
+_all_connections = []
+_checked_paths = set()
+_writers = {}
+
+
+def get_db_path(db_path=None):
+    return db_path or DEFAULT_DB_PATH
+
+
+def set_db_path(db_path):
+    # Changes the database used by every later connect() without an explicit path
+    global DEFAULT_DB_PATH
+    DEFAULT_DB_PATH = db_path
+
+
+def configure(conn):
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    # WAL is persistent in the database file; in-memory databases keep their own journal mode
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute("PRAGMA temp_store = MEMORY")
+
+
+def check_schema(conn, db_path):
+    # Once per process and database: bring the schema up to date (see migrations.py)
+    with _lock:
+        if db_path in _checked_paths:
+            return
+        _checked_paths.add(db_path)
+    from migrations import migrate
+    migrate(conn)
+
+
+def connect(db_path=None):
+    """
+    Returns this thread's connection to the database, opening and configuring it
+    on first use. Statements executed through it are prepared once and reused.
+    """
+    db_path = get_db_path(db_path)
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000, cached_statements=CACHED_STATEMENTS)
+        configure(conn)
+        check_schema(conn, db_path)
+        connections[db_path] = conn
+        with _lock:
+            _all_connections.append(conn)
+    return conn
+
+
+def close_connection(db_path=None):
+    # Closes this thread's connection; the next connect() opens a new one
+    connections = getattr(_local, 'connections', {})
+    conn = connections.pop(get_db_path(db_path), None)
+    if conn is not None:
+        with _lock:
+            if conn in _all_connections:
+                _all_connections.remove(conn)
+        conn.close()
+
+
+class DatabaseWriter:
+    """
+    Owns the only writing connection of a database in this process. Jobs are
+    callables taking that connection; submit() queues one and returns a Future
+    with its return value (or exception). The thread commits the jobs waiting
+    in the queue together, up to MAX_WRITE_BATCH per transaction, each inside
+    its own savepoint so a failing job is rolled back without affecting the
+    others. A job alone in its batch runs without a savepoint, since rolling
+    back the transaction undoes just that job; statements inside a savepoint
+    get slower as the database grows, which bulk loads of many rows per job
+    would notice. Jobs must not commit or roll back themselves.
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = get_db_path(db_path)
+        self.jobs = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name=f"writer:{self.db_path}", daemon=True)
+        self.thread.start()
+
+    def submit(self, job):
+        future = Future()
+        self.jobs.put((job, future))
+        return future
+
+    def execute(self, sql, params=()):
+        return self.submit(lambda conn: conn.execute(sql, params).rowcount)
+
+    def executemany(self, sql, rows):
+        rows = list(rows)
+        return self.submit(lambda conn: conn.executemany(sql, rows).rowcount)
+
+    def close(self):
+        # Finishes the queued jobs, then stops the thread
+        self.jobs.put(None)
+        self.thread.join()
+
+    def next_batch(self):
+        batch = [self.jobs.get()]
+        while batch[-1] is not None and len(batch) < MAX_WRITE_BATCH:
+            try:
+                batch.append(self.jobs.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        # Autocommit mode: transactions and savepoints are managed explicitly below
+        conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_MS / 1000,
+                               cached_statements=CACHED_STATEMENTS, isolation_level=None)
+        configure(conn)
+        check_schema(conn, self.db_path)
+        running = True
+        while running:
+            batch = self.next_batch()
+            if batch[-1] is None:
+                running = False
+                batch = batch[:-1]
+            if batch:
+                self.run_batch(conn, batch)
+        conn.close()
+
+    def run_batch(self, conn, batch):
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            savepoints = len(batch) > 1
+            for job, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                if savepoints:
+                    conn.execute("SAVEPOINT job")
+                try:
+                    results.append((future, job(conn), None))
+                    if savepoints:
+                        conn.execute("RELEASE job")
+                except Exception as e:
+                    if savepoints:
+                        conn.execute("ROLLBACK TO job")
+                        conn.execute("RELEASE job")
+                    else:
+                        conn.execute("ROLLBACK")
+                    results.append((future, None, e))
+            if conn.in_transaction:
+                conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for job, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        # Results only become visible once the whole batch is committed
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+def get_writer(db_path=None):
+    # The process-wide writer thread of a database, started on first use
+    db_path = get_db_path(db_path)
+    with _lock:
+        writer = _writers.get(db_path)
+        if writer is None:
+            writer = _writers[db_path] = DatabaseWriter(db_path)
+    return writer
+
+
+@atexit.register
+def close_all():
+    with _lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close()
+    with _lock:
+        connections = list(_all_connections)
+        _all_connections.clear()
+    for conn in connections:
+        try:
+            conn.close()
+        except sqlite3.ProgrammingError:
+            # Connections of other threads can only be closed by them
+            pass
@@ -1,132 +1,166 @@
 import pandas as pd 
 import sqlite3
 import csv
-
-def load_csv_to_groceries(csv_file_path, columns_to_import):
+import os
+import sys
+import time
+import random
+import tempfile
+import tracemalloc
+from database import connect, close_connection, get_writer
+from repositories import GroceriesRepository, HomeRepository, RecipesRepository
+from full_text_search import FTS_TABLES, pause_fts_sync, resume_fts_sync
+
+# Rows read from the CSV file and written per writer transaction
+CHUNK_SIZE = 10000
+
+
+def read_csv_chunks(csv_file_path, csv_columns, chunk_size=CHUNK_SIZE):
+    # Yields lists of at most chunk_size rows (the values of csv_columns), so memory use does not grow with the file
+    with open(csv_file_path, 'r', newline='') as csv_file:
+        csv_reader = csv.reader(csv_file)
+        header = next(csv_reader)
+        missing = [column for column in csv_columns if column not in header]
+        if missing:
+            raise ValueError(f"Columns not found in {csv_file_path}: {', '.join(missing)}")
+        positions = [header.index(column) for column in csv_columns]
+        chunk = []
+        for row in csv_reader:
+            chunk.append([row[position] for position in positions])
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def print_progress(rows_loaded, rows_per_second):
+    print(f"  {rows_loaded} rows loaded ({rows_per_second:.0f} rows/s)")
+
+
+def insert_chunk(repository_class, columns, rows, upsert_key):
+    # Writer job: one chunk of CSV rows
+    def write(conn):
+        repository_class(conn).insert_many(columns, rows, upsert_key)
+        return len(rows)
+    return write
+
+
+def load_csv_to_table(csv_file_path, repository_class, columns_to_import, column_mapping=None, upsert_key=None,
+                      chunk_size=CHUNK_SIZE, progress=None, defer_search_index=True, db_path=None):
+    """
+    Streams columns_to_import from a CSV file into the table of
+    repository_class through the database's writer thread, one transaction
+    per chunk of chunk_size rows, so other writes (e.g. from the GUI) are
+    never locked out for the whole load. A failing chunk stops the load; the
+    chunks before it stay committed. column_mapping renames CSV columns to
+    table columns ({'persons': 'servings'}); with upsert_key (a table column
+    with a unique index) existing rows are updated instead of duplicated.
+    progress(rows_loaded, rows_per_second) is called after every chunk. The
+    full-text index of the table is rebuilt once after the load (searches miss
+    the new rows until then) unless defer_search_index is False (cheaper for a
+    few rows into a big table). Returns the number of rows written.
+    """
+    writer = get_writer(db_path)
+    table = repository_class.table
+    column_mapping = column_mapping or {}
+    table_columns = [column_mapping.get(column, column) for column in columns_to_import]
+    defer_search_index = defer_search_index and table in FTS_TABLES
+    rows_loaded = 0
+    start = time.perf_counter()
     try:
-        # Connect to the database
-        conn = sqlite3.connect('groceries.db')
-        cursor = conn.cursor()
-
-        # Prepare the SQL query
-        placeholders = ', '.join(['?' for _ in columns_to_import])
-        columns = ', '.join(columns_to_import)
-        sql = f"INSERT INTO groceries ({columns}) VALUES ({placeholders})"
-
-        # Read the CSV file and insert data
-        with open(csv_file_path, 'r') as csv_file:
-            csv_reader = csv.DictReader(csv_file)
-            for row in csv_reader:
-                # Extract only the specified columns
-                values = [row[column] for column in columns_to_import]
-                cursor.execute(sql, values)
-
-        # Commit the changes
-        conn.commit()
+        if defer_search_index:
+            writer.submit(lambda conn: pause_fts_sync(conn, table)).result()
+        try:
+            pending = None
+            for chunk in read_csv_chunks(csv_file_path, columns_to_import, chunk_size):
+                # The next chunk is read while the writer inserts this one
+                if pending is not None:
+                    rows_loaded += pending.result()
+                    if progress is not None:
+                        progress(rows_loaded, rows_loaded / max(time.perf_counter() - start, 1e-9))
+                pending = writer.submit(insert_chunk(repository_class, table_columns, chunk, upsert_key))
+            if pending is not None:
+                rows_loaded += pending.result()
+                if progress is not None:
+                    progress(rows_loaded, rows_loaded / max(time.perf_counter() - start, 1e-9))
+        finally:
+            if defer_search_index:
+                writer.submit(lambda conn: resume_fts_sync(conn, table)).result()
 
         # Verify the number of rows inserted
-        cursor.execute('SELECT COUNT(*) FROM groceries')
-        count = cursor.fetchone()[0]
-        print(f"Data loaded successfully. Total rows in groceries table: {count}")
+        count = repository_class(connect(db_path)).count()
+        print(f"Data loaded successfully. Total rows in {table} table: {count}")
 
     except sqlite3.Error as e:
         print(f"An SQLite error occurred: {e}")
-    except IOError as e:
+    except (IOError, ValueError) as e:
         print(f"An error occurred while reading the CSV file: {e}")
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
-    finally:
-        # Close the connection
-        if conn:
-            conn.close()
+    return rows_loaded
 
 
-def load_csv_to_home(csv_file_path, columns_to_import):
-    try:
-        # Connect to the database
-        conn = sqlite3.connect('groceries.db')
-        cursor = conn.cursor()
-
-        # Prepare the SQL query
-        placeholders = ', '.join(['?' for _ in columns_to_import])
-        columns = ', '.join(columns_to_import)
-        sql = f"INSERT INTO home ({columns}) VALUES ({placeholders})"
-
-        # Read the CSV file and insert data
-        with open(csv_file_path, 'r') as csv_file:
-            csv_reader = csv.DictReader(csv_file)
-            for row in csv_reader:
-                # Extract only the specified columns
-                values = [row[column] for column in columns_to_import]
-                cursor.execute(sql, values)
-
-        # Commit the changes
-        conn.commit()
+def load_csv_to_groceries(csv_file_path, columns_to_import, **options):
+    return load_csv_to_table(csv_file_path, GroceriesRepository, columns_to_import, **options)
 
-        # Verify the number of rows inserted
-        cursor.execute('SELECT COUNT(*) FROM home')
-        count = cursor.fetchone()[0]
-        print(f"Data loaded successfully. Total rows in home table: {count}")
 
-    except sqlite3.Error as e:
-        print(f"An SQLite error occurred: {e}")
-    except IOError as e:
-        print(f"An error occurred while reading the CSV file: {e}")
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
-    finally:
-        # Close the connection
-        if conn:
-            conn.close()
+def load_csv_to_home(csv_file_path, columns_to_import, **options):
+    return load_csv_to_table(csv_file_path, HomeRepository, columns_to_import, **options)
 
 
-def load_csv_to_recipes(csv_file_path, columns_to_import):
-    try:
-        # Connect to the database
-        conn = sqlite3.connect('groceries.db')
-        cursor = conn.cursor()
-
-        # Prepare the SQL query
-        placeholders = ', '.join(['?' for _ in columns_to_import])
-        columns = ', '.join(columns_to_import)
-        sql = f"INSERT INTO recipes ({columns}) VALUES ({placeholders})"
-
-        # Read the CSV file and insert data
-        with open(csv_file_path, 'r') as csv_file:
-            csv_reader = csv.DictReader(csv_file)
-            for row in csv_reader:
-                # Extract only the specified columns
-                values = [row[column] for column in columns_to_import]
-                cursor.execute(sql, values)
-
-        # Commit the changes
-        conn.commit()
+def load_csv_to_recipes(csv_file_path, columns_to_import, **options):
+    return load_csv_to_table(csv_file_path, RecipesRepository, columns_to_import, **options)
 
-        # Verify the number of rows inserted
-        cursor.execute('SELECT COUNT(*) FROM recipes')
-        count = cursor.fetchone()[0]
-        print(f"Data loaded successfully. Total rows in recipes table: {count}")
 
-    except sqlite3.Error as e:
-        print(f"An SQLite error occurred: {e}")
-    except IOError as e:
-        print(f"An error occurred while reading the CSV file: {e}")
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
-    finally:
-        # Close the connection
-        if conn:
-            conn.close()
+def write_synthetic_groceries_csv(csv_file_path, n_rows, seed=0):
+    rng = random.Random(seed)
+    units = ['g', 'kg', 'ml', 'l', 'pieces']
+    with open(csv_file_path, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(['name', 'category', 'price', 'amount'])
+        for i in range(n_rows):
+            writer.writerow([f"product {i}", f"category_{rng.randrange(500)}", round(rng.uniform(0.5, 20), 2),
+                             f"{rng.randint(1, 1000)}{rng.choice(units)}"])
+
+
+def benchmark(n_rows=1000000, chunk_size=CHUNK_SIZE):
+    """
+    Loads a synthetic n_rows grocery CSV into a fresh database and reports the
+    throughput and the peak Python memory of the load, which is bounded by the
+    chunk size rather than the file size.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        csv_file_path = os.path.join(directory, 'groceries.csv')
+        db_path = os.path.join(directory, 'benchmark.db')
+        write_synthetic_groceries_csv(csv_file_path, n_rows)
+        connect(db_path)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        rows_loaded = load_csv_to_table(csv_file_path, GroceriesRepository, ['name', 'category', 'price', 'amount'],
+                                        upsert_key='name', chunk_size=chunk_size, db_path=db_path)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        close_connection(db_path)
+
+    print(f"{n_rows} rows, chunk_size={chunk_size}")
+    print(f"  load time:   {elapsed:.2f}s ({rows_loaded / elapsed:.0f} rows/s)")
+    print(f"  peak memory: {peak / 2 ** 20:.1f} MiB")
 
 
 
 
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == 'benchmark':
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 1000000)
+        sys.exit()
 
     csv_file_path = 'ingredients.csv'
     columns_to_import = ['name', 'price', 'category', 'amount']  
-    load_csv_to_groceries(csv_file_path, columns_to_import)
+    load_csv_to_groceries(csv_file_path, columns_to_import, upsert_key='name', progress=print_progress)
 
    # csv_file_path = 'home_items.csv'
    # columns_to_import = ['name', 'price', 'category', 'amount']
@@ -135,5 +169,5 @@ if __name__ == "__main__":
         
    # csv_file_path = 'recipes.csv'
    # columns_to_import = ['name', 'ingredients', 'amount', 'persons']
-   # load_csv_to_recipes(csv_file_path, columns_to_import)
+   # load_csv_to_recipes(csv_file_path, columns_to_import, column_mapping={'persons': 'servings'})
 
@@ -0,0 +1,113 @@
+"""FTS5 full-text indexes over groceries and recipes, ranked with BM25 and kept in sync by triggers"""
+
+import re
+
+# Results returned by the search boxes when no limit is given
+DEFAULT_SEARCH_LIMIT = 50
+
+# Indexed columns of each table, and the BM25 weight of each column (name matches rank first)
+FTS_TABLES = {
+    'groceries': (['name', 'category', 'brand', 'description'], [10.0, 5.0, 2.0, 1.0]),
+    'recipes': (['name', 'original_ingredients', 'summary'], [10.0, 2.0, 1.0]),
+}
+
+
+def create_fts_triggers(conn, table):
+    # Triggers keeping '<table>_fts' in sync with every insert, update and delete on the table
+    columns, _ = FTS_TABLES[table]
+    fts = f"{table}_fts"
+    column_list = ', '.join(columns)
+    new_values = ', '.join(f"NEW.{column}" for column in columns)
+    old_values = ', '.join(f"OLD.{column}" for column in columns)
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table}
+        BEGIN
+            INSERT INTO {fts} (rowid, {column_list}) VALUES (NEW.id, {new_values});
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table}
+        BEGIN
+            INSERT INTO {fts} ({fts}, rowid, {column_list}) VALUES ('delete', OLD.id, {old_values});
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF id, {column_list} ON {table}
+        BEGIN
+            INSERT INTO {fts} ({fts}, rowid, {column_list}) VALUES ('delete', OLD.id, {old_values});
+            INSERT INTO {fts} (rowid, {column_list}) VALUES (NEW.id, {new_values});
+        END
+    ''')
+
+
+def rebuild_fts(conn, table):
+    # Re-indexes every row of the table in one pass
+    conn.execute(f"INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')")
+
+
+def create_fts_table(conn, table):
+    """
+    Creates '<table>_fts', an external-content FTS5 table over the columns of
+    FTS_TABLES[table], and the triggers that keep it in sync with the table.
+    Prefix indexes make 2 and 3 character prefix queries index lookups. The
+    index is (re)built from the table's current rows.
+    """
+    columns, weights = FTS_TABLES[table]
+    fts = f"{table}_fts"
+    conn.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+            {', '.join(columns)},
+            content='{table}', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    ''')
+    create_fts_triggers(conn, table)
+    # ORDER BY rank uses these column weights
+    conn.execute(f"INSERT INTO {fts} ({fts}, rank) VALUES ('rank', 'bm25({', '.join(map(str, weights))})')")
+    rebuild_fts(conn, table)
+
+
+def pause_fts_sync(conn, table):
+    """
+    For bulk loads: drops the table's sync triggers, so rows are not indexed
+    one by one. resume_fts_sync must follow, also when the load fails;
+    until then searches do not see the rows loaded.
+    """
+    for event in ('insert', 'delete', 'update'):
+        conn.execute(f"DROP TRIGGER IF EXISTS {table}_fts_{event}")
+
+
+def resume_fts_sync(conn, table):
+    # Re-indexes the table once, which is far cheaper than row by row, and brings the triggers back
+    rebuild_fts(conn, table)
+    create_fts_triggers(conn, table)
+
+
+def fts_query(text, prefix=True, columns=None):
+    """
+    Turns what the user typed into an FTS5 query: every word must match, each
+    as a prefix when `prefix` is set ('chick bro' finds 'chicken broth'), and
+    only in `columns` if given. Words are quoted, so operators and punctuation
+    in the input are never interpreted. Returns None when there are no words.
+    """
+    words = re.findall(r"\w+", text or '')
+    if not words:
+        return None
+    query = ' '.join(f'"{word}"' + ('*' if prefix else '') for word in words)
+    if columns:
+        query = f"{{{' '.join(columns)}}} : ({query})"
+    return query
+
+
+def search(conn, table, text, limit=DEFAULT_SEARCH_LIMIT, prefix=True, columns=None, select='t.*'):
+    # Rows of `table` matching `text`, best BM25 match first
+    query = fts_query(text, prefix, columns)
+    if query is None:
+        return []
+    return conn.execute(f"""
+        SELECT {select} FROM {table}_fts
+        JOIN {table} t ON t.id = {table}_fts.rowid
+        WHERE {table}_fts MATCH ?
+        ORDER BY rank
+        LIMIT ?
+    """, (query, -1 if limit is None else limit)).fetchall()
@@ -1,37 +1,42 @@
-import sqlite3
+from database import get_writer
+from repositories import GroceriesRepository, HomeRepository
 
 # Adding ingredients either to the list of possible ingredients to buy or to the list of ingredients at home 
 # TODO : import idea into contents interface 
 
 
-def add_ingredient(ingredient_name, category, price, amount, to_home):
+def add_ingredient(ingredient_name, category, price, amount, to_home, wait=True):
     """
-    Adds an ingredient to the database 'groceries.db', in particular to either
+    Adds an ingredient to the database (groceries.db unless GROCERIES_DB is set), in particular to either
     the table 'home' or 'groceries'. If to_home is True, the ingredient is added to the table 'home'.
     Both tables have the same structure : the columns are 
     'name' (ingredient_name),
     'category' (category),
     'price' (price),
     'amount' (amount).
+    The write goes through the database's writer thread; with wait=False the
+    Future of the write is returned instead (its result is the table name, or
+    None if the ingredient was already in 'groceries').
     """
-    conn = sqlite3.connect('groceries.db')
-    c = conn.cursor()
+    def write(conn):
+        if to_home == False: 
+            if GroceriesRepository(conn).exists(ingredient_name):
+                return None
 
-    if to_home == False: 
-        c.execute("SELECT name FROM groceries WHERE name = ?", (ingredient_name,))
-        if c.fetchone() is not None:
-            print(f"Ingredient '{ingredient_name}' is already in the database.")
-            conn.close()
-            return
+        repository = HomeRepository(conn) if to_home else GroceriesRepository(conn)
+        repository.add(ingredient_name, category, price, amount)
+        return repository.table
 
-    table = 'home' if to_home else 'groceries'
-    c.execute(f"INSERT INTO {table} (name, category, price, amount) VALUES (?, ?, ?, ?)", 
-              (ingredient_name, category, price, amount))
+    future = get_writer().submit(write)
+    if not wait:
+        return future
+    report_added(ingredient_name, future.result())
 
-    conn.commit()
-    conn.close()
-
-    print(f"Added '{ingredient_name}' to the {table} table.")
+def report_added(ingredient_name, table):
+    if table is None:
+        print(f"Ingredient '{ingredient_name}' is already in the database.")
+    else:
+        print(f"Added '{ingredient_name}' to the {table} table.")
 
 def read_ingredients_file(filename):
     """
@@ -49,6 +54,8 @@ def read_ingredients_file(filename):
 
     at_home = lines[0].strip().upper() == 'TRUE'
 
+    # Queue all lines first so the writer thread commits them in a few batches
+    pending = []
     for line in lines[1:]:
         parts = line.strip().split(',')
         if len(parts) != 4:
@@ -59,10 +66,14 @@ def read_ingredients_file(filename):
         try:
             price = float(price)
             amount = amount.strip()  # Keep amount as string to preserve units
-            add_ingredient(name.strip(), category.strip(), price, amount, at_home)
+            pending.append((name.strip(), add_ingredient(name.strip(), category.strip(), price, amount, at_home,
+                                                         wait=False)))
         except ValueError:
             print(f"Skipping line due to invalid price: {line.strip()}")
 
+    for name, future in pending:
+        report_added(name, future.result())
+
 def main():
     filename = 'all_ingredients_home_start.txt' 
     read_ingredients_file(filename)
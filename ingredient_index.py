@@ -0,0 +1,112 @@
+"""Inverted index from ingredient category to the (sorted) ids of the recipes using it"""
+
+from bisect import bisect_left
+
+
+# Splits space-separated categories into one (category, recipe_id) row per category
+SPLIT_CATEGORIES = '''
+    WITH RECURSIVE split(recipe_id, category, rest) AS (
+        SELECT {recipe_id}, '', trim({ingredients}) || ' ' {source}
+        UNION ALL
+        SELECT recipe_id, substr(rest, 1, instr(rest, ' ') - 1), ltrim(substr(rest, instr(rest, ' ') + 1))
+        FROM split WHERE rest <> ''
+    )
+    SELECT category, recipe_id FROM split WHERE category <> ''
+'''
+
+
+def create_recipe_postings(conn):
+    """
+    Creates the 'recipe_postings' table and the triggers that keep it in sync
+    with 'recipes.ingredients'. The (category, recipe_id) primary key stores each
+    posting list contiguously and sorted by recipe id. Existing recipes are
+    indexed the first time the table is created.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'recipe_postings'").fetchone()
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS recipe_postings (
+            category TEXT NOT NULL,
+            recipe_id INTEGER NOT NULL,
+            PRIMARY KEY (category, recipe_id)
+        ) WITHOUT ROWID
+    ''')
+
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS recipe_postings_insert AFTER INSERT ON recipes
+        BEGIN
+            INSERT OR IGNORE INTO recipe_postings (category, recipe_id)
+            {SPLIT_CATEGORIES.format(recipe_id='NEW.id', ingredients='NEW.ingredients', source='')};
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS recipe_postings_update AFTER UPDATE OF id, ingredients ON recipes
+        BEGIN
+            DELETE FROM recipe_postings WHERE recipe_id = OLD.id;
+            INSERT OR IGNORE INTO recipe_postings (category, recipe_id)
+            {SPLIT_CATEGORIES.format(recipe_id='NEW.id', ingredients='NEW.ingredients', source='')};
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS recipe_postings_delete AFTER DELETE ON recipes
+        BEGIN
+            DELETE FROM recipe_postings WHERE recipe_id = OLD.id;
+        END
+    ''')
+
+    if not exists:
+        conn.execute(f'''
+            INSERT OR IGNORE INTO recipe_postings (category, recipe_id)
+            {SPLIT_CATEGORIES.format(recipe_id='id', ingredients='ingredients', source='FROM recipes')}
+        ''')
+
+
+def intersect_sorted(lists):
+    # Walk the shortest posting list and binary search the others,
+    # so the cost follows the smallest list instead of the corpus size
+    if not lists:
+        return []
+    lists = sorted(lists, key=len)
+    result = []
+    for recipe_id in lists[0]:
+        for other in lists[1:]:
+            position = bisect_left(other, recipe_id)
+            if position == len(other) or other[position] != recipe_id:
+                break
+        else:
+            result.append(recipe_id)
+    return result
+
+
+class InvertedIngredientIndex:
+    # In-memory mirror of 'recipe_postings', filled lazily per category
+    def __init__(self, conn):
+        self.conn = conn
+        self.postings = {}
+        self.last_seen_version = None
+
+    def check_for_changes(self):
+        # Any write (from this or another connection) invalidates the mirror
+        version = (self.conn.execute("PRAGMA data_version").fetchone()[0], self.conn.total_changes)
+        if version != self.last_seen_version:
+            self.postings.clear()
+            self.last_seen_version = version
+
+    def get_postings(self, category):
+        if category not in self.postings:
+            rows = self.conn.execute(
+                "SELECT recipe_id FROM recipe_postings WHERE category = ? ORDER BY recipe_id", (category,))
+            self.postings[category] = [row[0] for row in rows]
+        return self.postings[category]
+
+    def recipes_with_all(self, categories):
+        # Ids of the recipes that use every one of the given categories
+        self.check_for_changes()
+        categories = set(categories)
+        if not categories:
+            return []
+        lists = [self.get_postings(category) for category in categories]
+        if any(not postings for postings in lists):
+            return []
+        return intersect_sorted(lists)
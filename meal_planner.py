@@ -0,0 +1,325 @@
+"""Weekly meal plans: several recipes chosen together, sharing the packs bought for them"""
+
+import time
+import numpy as np
+from change_tracking import table_version
+from repositories import RecipeNutritionRepository
+
+try:
+    import pulp
+except ImportError:
+    pulp = None
+
+# Nutrients stored in 'recipe_nutrition', in column order
+NUTRIENTS = RecipeNutritionRepository.columns
+
+
+class MealPlanner:
+    """
+    Picks n recipes for a week minimising what has to be bought plus the value of
+    what is left over, given the home inventory and optional weekly nutrition
+    targets ({'protein': (350, None), 'calories': (None, 14000), ...}).
+
+    The amounts of all chosen recipes are added up per category before buying,
+    so a pack bought for one recipe also serves the others. Every category is
+    then bought with the pack-aware PurchasePlanner, and the leftover of a
+    category is valued at its cheapest price per unit.
+
+    The search is a greedy construction followed by swap local search over the
+    candidate_pool recipes that are cheapest on their own, stopped after
+    time_budget seconds. When pulp is installed, a MILP over the same pool can
+    be used instead; its result is only kept if it beats the heuristic.
+    """
+
+    def __init__(self, conn, feasibility, purchase_planner, waste_weight=1.0, candidate_pool=200,
+                 nutrition_weight=100.0):
+        self.conn = conn
+        self.feasibility = feasibility
+        self.purchase_planner = purchase_planner
+        self.waste_weight = waste_weight
+        self.candidate_pool = candidate_pool
+        self.nutrition_weight = nutrition_weight
+        self.nutrition_version = None
+        self.nutrition = np.zeros((0, len(NUTRIENTS)))
+        self.column_costs = {}
+        self.column_costs_key = None
+
+    def build_nutrition(self):
+        # Per-recipe nutrition (for its original servings), aligned with the feasibility matrix rows
+        self.feasibility.ensure_current()
+        version = (self.feasibility.recipes_version, table_version(self.conn, 'recipe_nutrition'))
+        if self.nutrition_version == version:
+            return
+        totals = RecipeNutritionRepository(self.conn).get_recipe_totals()
+        self.nutrition = np.full((len(self.feasibility.recipe_ids), len(NUTRIENTS)), np.nan)
+        for row, recipe_id in enumerate(self.feasibility.recipe_ids.tolist()):
+            if recipe_id in totals:
+                self.nutrition[row] = totals[recipe_id]
+        self.nutrition_version = version
+
+    def prepare(self, servings):
+        # Amounts each recipe needs for `servings`, which categories need "some", and its nutrition
+        self.purchase_planner.ensure_current()
+        self.build_nutrition()
+        key = (self.feasibility.recipes_version, self.feasibility.home_version,
+               self.purchase_planner.groceries_version)
+        if key != self.column_costs_key:
+            self.column_costs = {}
+            self.column_costs_key = key
+        scale = self.feasibility.scaling(slice(None), servings)[:, np.newaxis]
+        needed = (self.feasibility.required * scale).astype(np.float64)
+        some = self.feasibility.uses & (self.feasibility.required == 0)
+        nutrition = self.nutrition * scale
+        return needed, some, nutrition
+
+    def column_cost(self, column, short, some_count):
+        """
+        (cost, leftover value) of buying `short` of a category, or a single pack
+        when it is only needed as "some" and there is none at home.
+        """
+        if short <= 1e-6 and (some_count == 0 or self.feasibility.home_any[column]):
+            return 0.0, 0.0
+        key = (column, round(short, 3))
+        if key not in self.column_costs:
+            category = list(self.feasibility.categories)[column]
+            unit = self.feasibility.units[column]
+            plan = self.purchase_planner.plan_category(category, short if short > 1e-6 else None, unit)
+            if plan is None:
+                self.column_costs[key] = (np.inf, 0.0)
+            elif short > 1e-6:
+                unit_price = self.purchase_planner.cheapest_unit_price(category, unit)
+                self.column_costs[key] = (plan['cost'], unit_price * max(plan['bought'] - short, 0.0))
+            else:
+                self.column_costs[key] = (plan['cost'], 0.0)
+        return self.column_costs[key]
+
+    def columns_objective(self, columns, totals, some_counts):
+        cost = waste = 0.0
+        for column in columns:
+            short = max(totals[column] - self.feasibility.home[column], 0.0)
+            column_cost, column_waste = self.column_cost(column, short, some_counts[column])
+            cost += column_cost
+            waste += column_waste
+        return cost + self.waste_weight * waste
+
+    def nutrition_penalty(self, nutrition_totals, chosen, n_recipes, targets):
+        # Relative violation of the weekly targets, extrapolated from the recipes chosen so far
+        if not targets or chosen == 0:
+            return 0.0
+        projected = nutrition_totals * n_recipes / chosen
+        penalty = 0.0
+        for nutrient, (low, high) in targets.items():
+            value = projected[NUTRIENTS.index(nutrient)]
+            if low is not None and value < low:
+                penalty += (low - value) / max(low, 1e-9)
+            if high is not None and value > high:
+                penalty += (value - high) / max(high, 1e-9)
+        return self.nutrition_weight * penalty
+
+    def candidates(self, n_recipes, servings, nutrition, targets):
+        # The recipes cheapest to cook on their own, with nutrition information if targets are given
+        _, costs = self.purchase_planner.shopping_costs(servings)
+        usable = np.isfinite(costs)
+        if targets:
+            usable &= ~np.isnan(nutrition).any(axis=1)
+        rows = np.flatnonzero(usable)
+        pool = max(self.candidate_pool, n_recipes)
+        if len(rows) > pool:
+            rows = rows[np.argpartition(costs[rows], pool - 1)[:pool]]
+        return rows[np.argsort(costs[rows], kind='stable')]
+
+    def heuristic(self, pool, n_recipes, needed, some, nutrition, targets, deadline):
+        totals = np.zeros(needed.shape[1])
+        some_counts = np.zeros(needed.shape[1], dtype=np.int64)
+        nutrition_totals = np.zeros(len(NUTRIENTS))
+        used_columns = [np.flatnonzero(self.feasibility.uses[row]) for row in range(len(needed))]
+        nutrition = np.nan_to_num(nutrition)
+
+        def delta(add, remove, chosen):
+            # Change of the objective when replacing `remove` (or nothing) by `add`
+            columns = np.union1d(used_columns[add], used_columns[remove]) if remove is not None else used_columns[add]
+            before = self.columns_objective(columns, totals, some_counts)
+            before += self.nutrition_penalty(nutrition_totals, chosen, n_recipes, targets)
+            totals[columns] += needed[add, columns]
+            some_counts[columns] += some[add, columns]
+            new_nutrition = nutrition_totals + nutrition[add]
+            if remove is not None:
+                totals[columns] -= needed[remove, columns]
+                some_counts[columns] -= some[remove, columns]
+                new_nutrition = new_nutrition - nutrition[remove]
+            after = self.columns_objective(columns, totals, some_counts)
+            after += self.nutrition_penalty(new_nutrition, chosen + (remove is None), n_recipes, targets)
+            # Undo, the caller applies the move it picks
+            totals[columns] -= needed[add, columns]
+            some_counts[columns] -= some[add, columns]
+            if remove is not None:
+                totals[columns] += needed[remove, columns]
+                some_counts[columns] += some[remove, columns]
+            return after - before
+
+        def apply(row, sign):
+            totals[used_columns[row]] += sign * needed[row, used_columns[row]]
+            some_counts[used_columns[row]] += sign * some[row, used_columns[row]]
+            nutrition_totals[:] += sign * nutrition[row]
+
+        # Greedy: repeatedly add the recipe with the smallest increase of the objective
+        chosen = []
+        remaining = list(pool)
+        while len(chosen) < n_recipes and remaining:
+            deltas = [delta(row, None, len(chosen)) for row in remaining]
+            best = int(np.argmin(deltas))
+            apply(remaining[best], 1)
+            chosen.append(remaining.pop(best))
+
+        # Local search: swap a chosen recipe for another one while that improves the plan
+        improved = True
+        while improved and time.perf_counter() < deadline:
+            improved = False
+            for i, out in enumerate(chosen):
+                moves = [(delta(row, out, len(chosen)), row) for row in remaining]
+                if not moves:
+                    break
+                change, row = min(moves)
+                if change < -1e-6:
+                    apply(out, -1)
+                    apply(row, 1)
+                    remaining[remaining.index(row)] = out
+                    chosen[i] = row
+                    improved = True
+                if time.perf_counter() >= deadline:
+                    break
+        return chosen
+
+    def milp(self, pool, n_recipes, needed, some, nutrition, targets, time_budget):
+        """
+        Exact model over the candidate pool: x_r picks recipe r, y_p counts the
+        packs p bought and w_c is the leftover value of category c. Returns the
+        chosen matrix rows, or None when no plan was found in time.
+        """
+        problem = pulp.LpProblem('meal_plan', pulp.LpMinimize)
+        x = {row: pulp.LpVariable(f'x_{row}', cat='Binary') for row in pool}
+        problem += pulp.lpSum(x.values()) == n_recipes
+
+        categories = list(self.feasibility.categories)
+        spend = []
+        waste = []
+        for column in sorted(set(np.flatnonzero(self.feasibility.uses[pool].any(axis=0)).tolist())):
+            category, unit = categories[column], self.feasibility.units[column]
+            quantity_rows = [row for row in pool if needed[row, column] > 0]
+            some_rows = [] if self.feasibility.home_any[column] else [row for row in pool if some[row, column]]
+            if quantity_rows:
+                packs = self.purchase_planner.pack_tables.get((category, unit), [])
+                y = [pulp.LpVariable(f'y_{column}_{j}', lowBound=0, cat='Integer') for j in range(len(packs))]
+                bought = pulp.lpSum(pack['amount'] * count for pack, count in zip(packs, y))
+                need = pulp.lpSum(needed[row, column] * x[row] for row in quantity_rows) - self.feasibility.home[column]
+                problem += bought >= need
+                spend.append(pulp.lpSum(pack['price'] * count for pack, count in zip(packs, y)))
+                if packs:
+                    unit_price = self.purchase_planner.cheapest_unit_price(category, unit)
+                    w = pulp.LpVariable(f'w_{column}', lowBound=0)
+                    problem += w >= unit_price * (bought - need)
+                    waste.append(w)
+                # Any pack of the right unit also covers the recipes that only need "some"
+                for row in some_rows:
+                    problem += pulp.lpSum(y) >= x[row]
+            elif some_rows:
+                packs = self.purchase_planner.all_packs.get(category, [])
+                cheapest = min((pack['price'] for pack in packs), default=None)
+                any_pack = pulp.LpVariable(f'y_{column}', cat='Binary')
+                for row in some_rows:
+                    problem += any_pack >= x[row]
+                if cheapest is None:
+                    problem += any_pack == 0
+                else:
+                    spend.append(cheapest * any_pack)
+
+        if targets:
+            for nutrient, (low, high) in targets.items():
+                total = pulp.lpSum(nutrition[row, NUTRIENTS.index(nutrient)] * x[row] for row in pool)
+                if low is not None:
+                    problem += total >= low
+                if high is not None:
+                    problem += total <= high
+
+        problem += pulp.lpSum(spend) + self.waste_weight * pulp.lpSum(waste)
+        problem.solve(pulp.PULP_CBC_CMD(msg=False, timeLimit=max(1, int(time_budget))))
+        if pulp.LpStatus[problem.status] != 'Optimal':
+            return None
+        chosen = [row for row in pool if (x[row].value() or 0) > 0.5]
+        return chosen if len(chosen) == n_recipes else None
+
+    def evaluate(self, rows, needed, some, nutrition, targets, n_recipes):
+        # Objective, spend, leftover value, nutrition totals and purchases of a set of recipes
+        rows = list(rows)
+        totals = needed[rows].sum(axis=0)
+        some_counts = some[rows].sum(axis=0)
+        nutrition_totals = nutrition[rows].sum(axis=0)
+        categories = list(self.feasibility.categories)
+        cost = waste = 0.0
+        purchases = {}
+        for column in np.flatnonzero(self.feasibility.uses[rows].any(axis=0)):
+            short = max(totals[column] - self.feasibility.home[column], 0.0)
+            column_cost, column_waste = self.column_cost(column, short, some_counts[column])
+            if column_cost == 0:
+                continue
+            cost += column_cost
+            waste += column_waste
+            purchases[categories[column]] = self.purchase_planner.plan_category(
+                categories[column], short if short > 1e-6 else None, self.feasibility.units[column])
+        penalty = self.nutrition_penalty(np.nan_to_num(nutrition_totals), len(rows), n_recipes, targets)
+        return {
+            'recipe_ids': self.feasibility.recipe_ids[rows].tolist(),
+            'objective': cost + self.waste_weight * waste + penalty,
+            'cost': cost,
+            'waste': waste,
+            'nutrition': dict(zip(NUTRIENTS, nutrition_totals.tolist())),
+            'purchases': purchases
+        }
+
+    def plan_week(self, n_recipes=7, servings=None, nutrition_targets=None, time_budget=5.0, use_milp=None):
+        """
+        Returns the plan as a dict: recipe_ids, cost, waste (value of the leftovers),
+        nutrition (weekly totals), objective and purchases ({category: plan}, in the
+        PurchasePlanner.plan_category format). use_milp=None uses pulp when installed.
+        """
+        start = time.perf_counter()
+        for nutrient in nutrition_targets or {}:
+            if nutrient not in NUTRIENTS:
+                raise ValueError(f"Unknown nutrient '{nutrient}', expected one of {', '.join(NUTRIENTS)}")
+        needed, some, nutrition = self.prepare(servings)
+        pool = self.candidates(n_recipes, servings, nutrition, nutrition_targets)
+        if len(pool) == 0:
+            return None
+
+        deadline = start + time_budget
+        chosen = self.heuristic(list(pool), n_recipes, needed, some, nutrition, nutrition_targets, deadline)
+        plan = self.evaluate(chosen, needed, some, nutrition, nutrition_targets, n_recipes)
+
+        if use_milp is None:
+            use_milp = pulp is not None
+        if use_milp and len(pool) >= n_recipes:
+            if pulp is None:
+                raise ImportError("use_milp=True requires the 'pulp' package")
+            remaining = deadline - time.perf_counter()
+            if remaining > 0:
+                exact = self.milp(list(pool), n_recipes, needed, some, nutrition, nutrition_targets, remaining)
+                if exact is not None:
+                    exact_plan = self.evaluate(exact, needed, some, nutrition, nutrition_targets, n_recipes)
+                    if exact_plan['objective'] < plan['objective']:
+                        plan = exact_plan
+        return plan
+
+
+if __name__ == "__main__":
+    from recommender import RecipeRecommender
+    recommender = RecipeRecommender()
+    plan = recommender.plan_week(7)
+    if plan is None:
+        print("No recipe can be cooked with the groceries available.")
+    else:
+        names = recommender.get_recipe_names(plan['recipe_ids'])
+        print(f"Recipes: {', '.join(names[recipe_id] for recipe_id in plan['recipe_ids'])}")
+        print(f"To buy: ${plan['cost']:.2f} (leftovers worth ${plan['waste']:.2f})")
+        for category, purchase in plan['purchases'].items():
+            packs = ', '.join(f"{count} x {pack['name']}" for pack, count in purchase['packs'])
+            print(f"  {category}: {packs}")
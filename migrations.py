@@ -0,0 +1,403 @@
+"""
+Versioned schema migrations. The 'schema_version' table records which of the
+ordered MIGRATIONS have been applied; migrate() runs the missing ones in order,
+each in its own transaction. Steps are idempotent (IF NOT EXISTS, column
+checks). Rows standing in the way of a unique index are merged, not dropped:
+shopping list items and cooked recipes have their quantities summed, grocery
+products are renamed after their pack size, and only rows that are exact
+copies of another row are deleted.
+"""
+
+import logging
+import sqlite3
+from database import get_db_path
+from change_tracking import track_table_changes
+from ingredient_index import create_recipe_postings
+from recipe_neighbors import create_recipe_neighbors_table
+from recipe_ingredients import create_recipe_ingredients_table, backfill_recipe_ingredients
+from amount_comparison import base_amount_columns
+from full_text_search import FTS_TABLES, create_fts_table
+from product_nutrition import (create_product_nutrition_table, refresh_product_nutrition,
+                               create_product_nutrition_triggers, create_grocery_nutrition_table, NUTRIENTS)
+from recipe_nutrition_calculator import (create_recipe_nutrition_table, backfill_recipe_nutrition,
+                                         create_nutrition_dirty_queue)
+
+logger = logging.getLogger(__name__)
+
+# Lookup columns of the hot queries: (index name, table, column, unique)
+INDEXES = [
+    ('idx_groceries_name', 'groceries', 'name', True),
+    ('idx_groceries_category', 'groceries', 'category', False),
+    ('idx_home_category', 'home', 'category', False),
+    ('idx_shoppinglist_name', 'shoppinglist', 'name', True),
+    ('idx_recipes_name', 'recipes', 'name', False),
+    ('idx_nutrition_category', 'nutrition', 'category', False),
+    ('idx_cookedrecipes_name', 'cookedrecipes', 'name', True),
+]
+
+# Tables whose 'amount' strings get numeric amount_value/amount_unit columns (grams, millilitres or pieces)
+AMOUNT_TABLES = ['groceries', 'home', 'shoppinglist', 'chosenforrecipe']
+
+# Queries run per ingredient or per click, each of which should be an index lookup
+HOT_QUERIES = [
+    ("SELECT amount FROM groceries WHERE name = ?", ('x',)),
+    ("SELECT price FROM groceries WHERE name = ?", ('x',)),
+    ("SELECT id, name, price, amount FROM groceries WHERE category = ?", ('x',)),
+    ("SELECT amount FROM home WHERE category = ?", ('x',)),
+    ("SELECT name, price, amount FROM home WHERE category = ?", ('x',)),
+    ("SELECT amount, price, quantity FROM shoppinglist WHERE name = ?", ('x',)),
+    ("SELECT ingredients, amount FROM recipes WHERE name = ?", ('x',)),
+    ("SELECT ingredients, amount, servings FROM recipes WHERE id = ?", (1,)),
+    ("SELECT calories, fat, protein, carbs, sugar, fiber FROM nutrition WHERE category = ?", ('x',)),
+    ("SELECT quantity FROM cookedrecipes WHERE name = ?", ('x',)),
+]
+
+
+def column_exists(conn, table, column):
+    return any(row[1] == column for row in conn.execute(f"PRAGMA table_info({table})"))
+
+
+def create_base_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS nutrition (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            category TEXT NOT NULL,
+            amount TEXT NOT NULL,
+            calories REAL NOT NULL,
+            fat REAL NOT NULL,
+            protein REAL NOT NULL,
+            carbs REAL NOT NULL,
+            sugar REAL NOT NULL,
+            fiber REAL NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS groceries (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            category TEXT NOT NULL,
+            price REAL NOT NULL,
+            amount TEXT NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS home (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            category TEXT NOT NULL,
+            price REAL NOT NULL,
+            amount TEXT NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS grocerylist (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            category TEXT NOT NULL,
+            price REAL NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS recipes (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            original_ingredients TEXT NOT NULL,
+            ingredients TEXT NOT NULL,
+            amount TEXT NOT NULL,
+            servings REAL NOT NULL,
+            link TEXT NOT NULL,
+            nutrition_values TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS chosenforrecipe (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            category TEXT NOT NULL,
+            price REAL NOT NULL,
+            athome BOOL NOT NULL,
+            amount TEXT NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS shoppinglist (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            category TEXT NOT NULL,
+            price REAL NOT NULL,
+            amount TEXT NOT NULL,
+            quantity REAL NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS cookedrecipes (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            quantity REAL NOT NULL
+        )
+    ''')
+
+
+def add_recipe_summary(conn):
+    # Written by RecipeDetailDialog.save_summary
+    if not column_exists(conn, 'recipes', 'nutrition_values'):
+        conn.execute("ALTER TABLE recipes ADD COLUMN nutrition_values TEXT")
+    if not column_exists(conn, 'recipes', 'summary'):
+        conn.execute("ALTER TABLE recipes ADD COLUMN summary TEXT")
+
+
+def create_derived_tables(conn):
+    # Neighbour lists, posting lists and change counters derived from the base tables
+    create_recipe_neighbors_table(conn)
+    create_recipe_postings(conn)
+    for table in ('groceries', 'home', 'recipes'):
+        track_table_changes(conn, table)
+
+
+def create_lookup_indexes(conn):
+    for name, table, column, unique in INDEXES:
+        if unique:
+            duplicates = conn.execute(
+                f"SELECT {column}, COUNT(*) FROM {table} GROUP BY {column} HAVING COUNT(*) > 1 LIMIT 5").fetchall()
+            if not duplicates:
+                conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {name} ON {table} ({column})")
+                continue
+            # Keep the data and a plain index for now; the unique_* migrations merge the duplicates
+            examples = ', '.join(f"'{value}' ({count}x)" for value, count in duplicates)
+            logger.warning("%s.%s is not unique (%s); the index becomes unique once a later migration "
+                           "has merged the duplicates", table, column, examples)
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({column})")
+
+
+def normalize_recipe_ingredients(conn):
+    # One row per recipe ingredient, filled from the space-joined strings of the existing recipes
+    create_recipe_ingredients_table(conn)
+    backfill_recipe_ingredients(conn)
+
+
+def fill_base_amounts(conn, table):
+    # Parses the amount strings of the rows without base amount yet; unreadable amounts stay NULL
+    rows = conn.execute(f"SELECT id, amount FROM {table} WHERE amount_value IS NULL").fetchall()
+    conn.executemany(f"UPDATE {table} SET amount_value = ?, amount_unit = ? WHERE id = ?",
+                     [base_amount_columns(amount) + (row_id,) for row_id, amount in rows])
+
+
+def add_base_amounts(conn):
+    for table in AMOUNT_TABLES:
+        if not column_exists(conn, table, 'amount_value'):
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN amount_value REAL")
+        if not column_exists(conn, table, 'amount_unit'):
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN amount_unit TEXT")
+        fill_base_amounts(conn, table)
+
+
+def create_search_tables(conn):
+    # Brand and description are only filled by catalog imports; they are searched along with name and category
+    for column in ('brand', 'description'):
+        if not column_exists(conn, 'groceries', column):
+            conn.execute(f"ALTER TABLE groceries ADD COLUMN {column} TEXT")
+    for table in FTS_TABLES:
+        create_fts_table(conn, table)
+
+
+def unique_shopping_list_items(conn):
+    # Upserts on the shopping list need a unique name; items listed more than once are merged into their first row
+    if any(row[1] == 'idx_shoppinglist_name' and row[2] for row in conn.execute("PRAGMA index_list(shoppinglist)")):
+        return
+    same_amount = ("SELECT SUM(amount_value) FROM shoppinglist s "
+                   "WHERE s.name = shoppinglist.name AND s.amount_unit = shoppinglist.amount_unit")
+    conn.execute(f'''
+        UPDATE shoppinglist
+        SET price = (SELECT SUM(price) FROM shoppinglist s WHERE s.name = shoppinglist.name),
+            quantity = (SELECT SUM(quantity) FROM shoppinglist s WHERE s.name = shoppinglist.name),
+            amount_value = ({same_amount}),
+            amount = CASE WHEN amount_value IS NULL THEN amount ELSE printf('%g', ({same_amount})) || amount_unit END
+        WHERE id IN (SELECT MIN(id) FROM shoppinglist GROUP BY name HAVING COUNT(*) > 1)
+    ''')
+    conn.execute("DELETE FROM shoppinglist WHERE id NOT IN (SELECT MIN(id) FROM shoppinglist GROUP BY name)")
+    conn.execute("DROP INDEX IF EXISTS idx_shoppinglist_name")
+    conn.execute("CREATE UNIQUE INDEX idx_shoppinglist_name ON shoppinglist (name)")
+
+
+def unique_cooked_recipes(conn):
+    # Cook sessions upsert by recipe name; recipes recorded more than once are merged into their first row
+    if any(row[1] == 'idx_cookedrecipes_name' and row[2] for row in conn.execute("PRAGMA index_list(cookedrecipes)")):
+        return
+    conn.execute('''
+        UPDATE cookedrecipes
+        SET quantity = (SELECT SUM(quantity) FROM cookedrecipes c WHERE c.name = cookedrecipes.name)
+        WHERE id IN (SELECT MIN(id) FROM cookedrecipes GROUP BY name HAVING COUNT(*) > 1)
+    ''')
+    conn.execute("DELETE FROM cookedrecipes WHERE id NOT IN (SELECT MIN(id) FROM cookedrecipes GROUP BY name)")
+    conn.execute("DROP INDEX IF EXISTS idx_cookedrecipes_name")
+    conn.execute("CREATE UNIQUE INDEX idx_cookedrecipes_name ON cookedrecipes (name)")
+
+
+def unique_grocery_names(conn):
+    """
+    Catalog imports upsert groceries by name. Rows that are exact copies of an
+    earlier row are deleted; the other rows sharing a name are distinct packs
+    (another size or price), so every one but the first is renamed to
+    'name (amount)', with ' #id' appended where that is still taken. Renamed
+    products are logged.
+    """
+    if any(row[1] == 'idx_groceries_name' and row[2] for row in conn.execute("PRAGMA index_list(groceries)")):
+        return
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(groceries)") if row[1] != 'id']
+    conn.execute(f"DELETE FROM groceries WHERE id NOT IN (SELECT MIN(id) FROM groceries GROUP BY {', '.join(columns)})")
+    later = "id NOT IN (SELECT MIN(id) FROM groceries GROUP BY name)"
+    renamed = conn.execute(f"SELECT name, COUNT(*) FROM groceries WHERE {later} GROUP BY name").fetchall()
+    conn.execute(f"UPDATE groceries SET name = name || ' (' || amount || ')' WHERE {later}")
+    conn.execute(f"UPDATE groceries SET name = name || ' #' || id WHERE {later}")
+    if renamed:
+        examples = ', '.join(f"'{name}' ({count}x)" for name, count in renamed[:5])
+        logger.warning("Renamed %d grocery product(s) sharing the name of another pack: %s",
+                       sum(count for _, count in renamed), examples)
+    conn.execute("DROP INDEX IF EXISTS idx_groceries_name")
+    conn.execute("CREATE UNIQUE INDEX idx_groceries_name ON groceries (name)")
+
+
+def create_recipe_nutrition(conn):
+    # Numeric per-serving nutrients, filled from the nutrition text of the recipes calculated so far
+    create_recipe_nutrition_table(conn)
+    track_table_changes(conn, 'recipe_nutrition')
+    backfill_recipe_nutrition(conn)
+
+
+def create_nutrition_recompute_queue(conn):
+    # Recipes never calculated are queued too, so the first recompute run fills them in
+    create_nutrition_dirty_queue(conn)
+    conn.execute('''
+        INSERT OR IGNORE INTO recipe_nutrition_dirty (recipe_id)
+        SELECT id FROM recipes WHERE id NOT IN (SELECT recipe_id FROM recipe_nutrition)
+    ''')
+
+
+def create_product_ranking(conn):
+    # Products are matched to their nutrition row by name
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_nutrition_name ON nutrition (name)")
+    create_product_nutrition_table(conn)
+    refresh_product_nutrition(conn)
+
+
+def recipe_ingredients_base_units(conn):
+    # Rows parsed before amounts were stored in base units are filled again from the recipe strings
+    conn.execute("DELETE FROM recipe_ingredients")
+    backfill_recipe_ingredients(conn)
+
+
+def maintain_product_ranking(conn):
+    # From now on every write to groceries or nutrition updates the ranking
+    create_product_nutrition_triggers(conn)
+    refresh_product_nutrition(conn)
+
+
+def separate_grocery_nutrition(conn):
+    """
+    Product labels move out of 'nutrition', where the category lookups could
+    pick one ahead of the curated row: rows named after a branded product (only
+    catalog imports set a brand) go to 'grocery_nutrition'. The ranking
+    triggers are created again so they read both tables.
+    """
+    create_grocery_nutrition_table(conn)
+    conn.execute(f'''
+        INSERT OR REPLACE INTO grocery_nutrition (grocery_id, {', '.join(NUTRIENTS)})
+        SELECT g.id, {', '.join(f"n.{nutrient}" for nutrient in NUTRIENTS)}
+        FROM groceries g
+        JOIN nutrition n ON n.id = (SELECT MIN(id) FROM nutrition WHERE name = g.name)
+        WHERE g.brand IS NOT NULL
+    ''')
+    conn.execute("DELETE FROM nutrition WHERE name IN (SELECT name FROM groceries WHERE brand IS NOT NULL)")
+    triggers = conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'product_nutrition_%'")
+    for (trigger,) in triggers.fetchall():
+        conn.execute(f"DROP TRIGGER {trigger}")
+    create_product_nutrition_triggers(conn)
+    refresh_product_nutrition(conn)
+
+
+# Ordered upgrade steps: (version, description, step). Append new steps, never reorder or edit old ones
+MIGRATIONS = [
+    (1, 'base tables', create_base_tables),
+    (2, 'recipes.summary column', add_recipe_summary),
+    (3, 'neighbour, posting and change tracking tables', create_derived_tables),
+    (4, 'lookup indexes and unique constraints', create_lookup_indexes),
+    (5, 'recipe_ingredients table', normalize_recipe_ingredients),
+    (6, 'numeric base amounts', add_base_amounts),
+    (7, 'full-text search tables', create_search_tables),
+    (8, 'unique shopping list items', unique_shopping_list_items),
+    (9, 'unique cooked recipes', unique_cooked_recipes),
+    (10, 'recipe_nutrition table', create_recipe_nutrition),
+    (11, 'nutrition recompute queue', create_nutrition_recompute_queue),
+    (12, 'product nutrition ranking', create_product_ranking),
+    (13, 'recipe_ingredients amounts in base units', recipe_ingredients_base_units),
+    (14, 'product nutrition ranking triggers', maintain_product_ranking),
+    (15, 'unique grocery names', unique_grocery_names),
+    (16, 'grocery product nutrition labels', separate_grocery_nutrition),
+    (17, 'nutrition recompute on servings changes', create_nutrition_dirty_queue),
+    (18, 'recipe neighbour checksums', create_recipe_neighbors_table),
+]
+
+
+def schema_version(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def migrate(conn):
+    """
+    Applies the migrations newer than the database's schema version, each step
+    in its own transaction, and refreshes the planner statistics when any ran.
+    Returns the list of applied versions.
+    """
+    current = schema_version(conn)
+    applied = []
+    for version, description, step in MIGRATIONS:
+        if version <= current:
+            continue
+        try:
+            # One transaction per step: DDL does not open one implicitly, and helpers
+            # called by a step leave committing to migrate()
+            if not conn.in_transaction:
+                conn.execute("BEGIN")
+            step(conn)
+            conn.execute("INSERT INTO schema_version (version, description) VALUES (?, ?)", (version, description))
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            logger.error("Migration %d (%s) failed: %s", version, description, e)
+            raise
+        applied.append(version)
+    if applied:
+        conn.execute("ANALYZE")
+        conn.commit()
+    return applied
+
+
+def check_query_plans(conn, queries=HOT_QUERIES):
+    """
+    Runs EXPLAIN QUERY PLAN for every hot query and returns (query, plan, uses_index)
+    triples; a query uses an index when no step of its plan is a full table SCAN.
+    After ANALYZE, SQLite may still prefer a scan for tables of a handful of rows.
+    """
+    results = []
+    for query, params in queries:
+        plan = ' | '.join(row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params))
+        uses_index = 'SEARCH' in plan and not any(step.startswith('SCAN') for step in plan.split(' | '))
+        results.append((query, plan, uses_index))
+    return results
+
+
+if __name__ == "__main__":
+    conn = sqlite3.connect(get_db_path())
+    applied = migrate(conn)
+    print(f"Applied migrations: {applied}" if applied else "Schema is up to date.")
+    for query, plan, uses_index in check_query_plans(conn):
+        print(f"{'OK  ' if uses_index else 'SCAN'} {query}\n     {plan}")
+    conn.close()
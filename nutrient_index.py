@@ -0,0 +1,182 @@
+"""Per-serving recipe nutrients as NumPy columns, for multi-constraint range queries"""
+
+import sys
+import time
+import sqlite3
+import numpy as np
+from change_tracking import track_table_changes, table_version
+from repositories import RecipeNutritionRepository
+from recipe_nutrition_calculator import create_recipe_nutrition_table
+
+NUTRIENTS = RecipeNutritionRepository.columns
+
+
+class NutrientIndex:
+    """
+    In-memory columnar copy of 'recipe_nutrition': a (recipes x nutrients)
+    float array of per-serving values, rows sorted by recipe id, rebuilt when
+    the table's change counter moves. A query such as {'protein': (30, None),
+    'calories': (None, 600)} is one vectorized comparison per bound, so any
+    number of constraints costs a few passes over the columns, where SQL could
+    use an index for one range only.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.version = None
+        self.ids = np.empty(0, dtype=np.int64)
+        self.values = np.zeros((0, len(NUTRIENTS)))
+
+    def ensure_current(self):
+        version = table_version(self.conn, 'recipe_nutrition')
+        if version != self.version:
+            self.build()
+            self.version = version
+
+    def build(self):
+        table = np.array(RecipeNutritionRepository(self.conn).get_all(), dtype=np.float64)
+        table = table.reshape(len(table), len(NUTRIENTS) + 1)
+        self.ids = table[:, 0].astype(np.int64)
+        self.values = np.ascontiguousarray(table[:, 1:])
+
+    def column(self, nutrient):
+        if nutrient not in NUTRIENTS:
+            raise ValueError(f"Unknown nutrient '{nutrient}', expected one of {', '.join(NUTRIENTS)}")
+        return NUTRIENTS.index(nutrient)
+
+    def mask(self, ranges):
+        # Rows whose per-serving values lie within every (low, high) range; None leaves a side open
+        self.ensure_current()
+        selected = np.ones(len(self.ids), dtype=bool)
+        for nutrient, (low, high) in ranges.items():
+            values = self.values[:, self.column(nutrient)]
+            if low is not None:
+                selected &= values >= low
+            if high is not None:
+                selected &= values <= high
+        return selected
+
+    def query(self, ranges, order_by=None, descending=True, limit=None):
+        """
+        (recipe ids, per-serving values) of the recipes within `ranges`, sorted
+        by the `order_by` nutrient (highest first unless descending is False)
+        or by id, and cut to `limit` rows.
+        """
+        rows = np.flatnonzero(self.mask(ranges))
+        if order_by is not None:
+            keys = self.values[rows, self.column(order_by)]
+            keys = -keys if descending else keys
+            if limit is not None and limit < len(rows):
+                best = np.argpartition(keys, limit - 1)[:limit]
+                rows = rows[best[np.argsort(keys[best], kind='stable')]]
+            else:
+                rows = rows[np.argsort(keys, kind='stable')]
+        if limit is not None:
+            rows = rows[:limit]
+        return self.ids[rows], self.values[rows]
+
+    def contains(self, recipe_ids, ranges):
+        # For an array of recipe ids (e.g. the TF-IDF index order): whether each is within `ranges`
+        recipe_ids = np.asarray(recipe_ids, dtype=np.int64)
+        selected = self.mask(ranges)
+        result = np.zeros(len(recipe_ids), dtype=bool)
+        if len(self.ids):
+            positions = np.minimum(np.searchsorted(self.ids, recipe_ids), len(self.ids) - 1)
+            found = self.ids[positions] == recipe_ids
+            result[found] = selected[positions[found]]
+        return result
+
+
+def range_query_sql(ranges, order_by=None, descending=True, limit=None):
+    # The same query in SQL, for comparison in the benchmark
+    conditions = []
+    params = []
+    for nutrient, (low, high) in ranges.items():
+        if low is not None:
+            conditions.append(f"{nutrient} >= ?")
+            params.append(low)
+        if high is not None:
+            conditions.append(f"{nutrient} <= ?")
+            params.append(high)
+    sql = f"SELECT recipe_id, {', '.join(NUTRIENTS)} FROM recipe_nutrition"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += f" ORDER BY {order_by} {'DESC' if descending else 'ASC'}" if order_by else " ORDER BY recipe_id"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return sql, params
+
+
+def synthetic_queries(n_queries, seed=1):
+    # Two or three random bounds per query, ordered by a random nutrient
+    rng = np.random.RandomState(seed)
+    bounds = {'calories': (200, 900), 'fat': (5, 40), 'protein': (10, 50), 'carbs': (20, 100),
+              'sugar': (2, 30), 'fiber': (1, 12)}
+    queries = []
+    for _ in range(n_queries):
+        ranges = {}
+        for nutrient in rng.choice(NUTRIENTS, size=rng.randint(2, 4), replace=False):
+            low, high = bounds[nutrient]
+            ranges[str(nutrient)] = (float(rng.uniform(low, high)), None) if rng.rand() < 0.5 \
+                else (None, float(rng.uniform(low, high)))
+        queries.append((ranges, str(rng.choice(NUTRIENTS))))
+    return queries
+
+
+def benchmark(n_recipes=100000, n_queries=200, limit=50):
+    """
+    Times multi-constraint range queries over n_recipes synthetic recipes: the
+    NumPy columns against SQLite with a plain table, with one index per
+    nutrient, and with a composite (protein, calories) index. Results of all
+    variants are checked to agree.
+    """
+    rng = np.random.RandomState(0)
+    conn = sqlite3.connect(':memory:')
+    # The nutrition table's triggers refer to the recipes table
+    conn.execute("CREATE TABLE recipes (id INTEGER PRIMARY KEY, servings REAL NOT NULL)")
+    create_recipe_nutrition_table(conn)
+    track_table_changes(conn, 'recipe_nutrition')
+    values = np.column_stack([rng.gamma(4.0, scale, n_recipes) for scale in (125, 5, 7, 15, 4, 1.5)])
+    conn.executemany(f"INSERT INTO recipe_nutrition (recipe_id, {', '.join(NUTRIENTS)}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                     ((recipe_id, *row) for recipe_id, row in enumerate(values.tolist(), start=1)))
+    conn.commit()
+    queries = synthetic_queries(n_queries)
+
+    start = time.perf_counter()
+    index = NutrientIndex(conn)
+    index.ensure_current()
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    expected = [index.query(ranges, order_by, limit=limit)[0] for ranges, order_by in queries]
+    numpy_time = time.perf_counter() - start
+
+    print(f"{n_recipes} recipes, {n_queries} queries of 2-3 bounds, top {limit}")
+    print(f"  NumPy columns build:           {1000 * build_time:.1f}ms")
+    print(f"  NumPy columns query:           {1000 * numpy_time / n_queries:.2f}ms")
+    variants = [
+        ('SQLite, no index', []),
+        ('SQLite, index per nutrient', [f"CREATE INDEX idx_bench_{nutrient} ON recipe_nutrition ({nutrient})"
+                                        for nutrient in NUTRIENTS]),
+        ('SQLite, (protein, calories)', ["CREATE INDEX idx_bench_protein_calories "
+                                         "ON recipe_nutrition (protein, calories)"]),
+    ]
+    for name, statements in variants:
+        for (index_name,) in conn.execute("SELECT name FROM sqlite_master WHERE name LIKE 'idx_bench_%'").fetchall():
+            conn.execute(f"DROP INDEX {index_name}")
+        for statement in statements:
+            conn.execute(statement)
+        conn.execute("ANALYZE")
+        start = time.perf_counter()
+        results = [[row[0] for row in conn.execute(*range_query_sql(ranges, order_by, limit=limit))]
+                   for ranges, order_by in queries]
+        elapsed = time.perf_counter() - start
+        # Ties in the sort key may be ordered differently, so compare as sets
+        agree = all(set(result) == set(ids.tolist()) for result, ids in zip(results, expected))
+        print(f"  {name + ':':<31}{1000 * elapsed / n_queries:.2f}ms{'' if agree else '  (results differ)'}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
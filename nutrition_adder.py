@@ -1,9 +1,10 @@
 import sqlite3
+from database import get_writer
+from recipe_nutrition_calculator import recompute_dirty_nutrition
 
-def add_nutritional_info(file_path, db_path='groceries.db'):
-    # Connect to the database
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+def add_nutritional_info(file_path, db_path=None):
+    # All rows are written by the database's writer thread, in one batch
+    writer = get_writer(db_path)
 
     # Read and process the file
     with open(file_path, 'r') as file:
@@ -24,34 +25,39 @@ def add_nutritional_info(file_path, db_path='groceries.db'):
             ingredient_data.append(current_ingredient)
 
     # Insert data into the database
+    pending = []
     for ingredient in ingredient_data:
         if len(ingredient) != 9:
             print(f"Skipping ingredient due to incorrect data format: {ingredient}")
             continue
 
+        future = writer.execute('''
+        INSERT OR REPLACE INTO nutrition 
+        (name, category, amount, calories, fat, protein, carbs, sugar, fiber)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            ingredient[0],  # name
+            ingredient[1],  # category
+            ingredient[2],  # amount
+            float(ingredient[3]),  # calories
+            float(ingredient[4][:-1]),  # fat (remove 'g')
+            float(ingredient[5][:-1]),  # protein (remove 'g')
+            float(ingredient[6][:-1]),  # carbs (remove 'g')
+            float(ingredient[7][:-1]),  # sugar (remove 'g')
+            float(ingredient[8][:-1])   # fiber (remove 'g')
+        ))
+        pending.append((ingredient[0], future))
+
+    # Wait until the writer has committed the rows
+    for name, future in pending:
         try:
-            cursor.execute('''
-            INSERT OR REPLACE INTO nutrition 
-            (name, category, amount, calories, fat, protein, carbs, sugar, fiber)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                ingredient[0],  # name
-                ingredient[1],  # category
-                ingredient[2],  # amount
-                float(ingredient[3]),  # calories
-                float(ingredient[4][:-1]),  # fat (remove 'g')
-                float(ingredient[5][:-1]),  # protein (remove 'g')
-                float(ingredient[6][:-1]),  # carbs (remove 'g')
-                float(ingredient[7][:-1]),  # sugar (remove 'g')
-                float(ingredient[8][:-1])   # fiber (remove 'g')
-            ))
-            print(f"Added nutritional info for: {ingredient[0]}")
+            future.result()
+            print(f"Added nutritional info for: {name}")
         except sqlite3.Error as e:
-            print(f"Error adding {ingredient[0]}: {e}")
+            print(f"Error adding {name}: {e}")
 
-    # Commit changes and close connection
-    conn.commit()
-    conn.close()
+    # Recipes using the changed categories were queued by the triggers on 'nutrition'
+    recompute_dirty_nutrition(db_path)
 
 
 if __name__ == "__main__":
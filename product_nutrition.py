@@ -0,0 +1,140 @@
+"""Nutrient densities and nutrients per currency unit of every grocery product, ranked by index"""
+
+import sys
+from database import connect, get_writer
+from repositories import ProductNutritionRepository, RecipeNutritionRepository
+
+NUTRIENTS = RecipeNutritionRepository.columns
+RANKING_COLUMNS = ProductNutritionRepository.columns
+
+
+def create_grocery_nutrition_table(conn):
+    """
+    Creates 'grocery_nutrition', the nutrition label of one grocery product
+    (values per 100g/ml of its pack unit), e.g. from tesco_importer. It is kept
+    apart from 'nutrition', whose rows stand for a whole ingredient category in
+    recipe calculations.
+    """
+    columns = ',\n'.join(f"            {nutrient} REAL NOT NULL" for nutrient in NUTRIENTS)
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS grocery_nutrition (
+            grocery_id INTEGER PRIMARY KEY,
+{columns}
+        )
+    ''')
+
+
+def create_product_nutrition_table(conn):
+    """
+    Creates 'product_nutrition', one row per grocery product with nutrition
+    values (its own label in 'grocery_nutrition', else the nutrition row of the
+    same name) and a pack in grams or millilitres, and an index on every
+    ranking column so a top-K query reads only K index entries.
+    """
+    create_grocery_nutrition_table(conn)
+    columns = ',\n'.join(f"            {column} REAL NOT NULL" for column in RANKING_COLUMNS)
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS product_nutrition (
+            grocery_id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            category TEXT NOT NULL,
+            unit TEXT NOT NULL,
+{columns}
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_product_nutrition_category ON product_nutrition (category)")
+    for column in RANKING_COLUMNS:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_product_nutrition_{column} ON product_nutrition ({column})")
+
+
+def product_rows(condition=''):
+    # INSERT ... SELECT of the ranking rows of the products matching an extra SQL condition on g;
+    # a product's own label (p) wins over the nutrition row of the same name (n)
+    values = [f"COALESCE(p.{nutrient}, n.{nutrient})" for nutrient in NUTRIENTS]
+    per_price = ', '.join(f"{value} * g.amount_value / 100 / g.price" for value in values)
+    return f'''
+        INSERT OR REPLACE INTO product_nutrition (grocery_id, name, category, unit, {', '.join(RANKING_COLUMNS)})
+        SELECT g.id, g.name, g.category, g.amount_unit, g.price * 100 / g.amount_value,
+               {', '.join(values)}, {per_price}
+        FROM groceries g
+        LEFT JOIN grocery_nutrition p ON p.grocery_id = g.id
+        LEFT JOIN nutrition n ON n.id = (SELECT MIN(id) FROM nutrition WHERE name = g.name)
+        WHERE (p.grocery_id IS NOT NULL OR n.id IS NOT NULL)
+          AND g.amount_unit IN ('g', 'ml') AND g.amount_value > 0 AND g.price > 0 {condition}
+    '''
+
+
+def create_product_nutrition_triggers(conn):
+    """
+    Keeps 'product_nutrition' current with every write to 'groceries',
+    'grocery_nutrition' and 'nutrition': the affected products are deleted from
+    the ranking and inserted again from the same SELECT as
+    refresh_product_nutrition. Deleting a product also deletes its label.
+    """
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS product_nutrition_groceries_insert AFTER INSERT ON groceries
+        BEGIN
+            {product_rows('AND g.id = NEW.id')};
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS product_nutrition_groceries_update
+        AFTER UPDATE OF id, name, category, price, amount_value, amount_unit ON groceries
+        BEGIN
+            DELETE FROM product_nutrition WHERE grocery_id = OLD.id;
+            {product_rows('AND g.id = NEW.id')};
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS product_nutrition_groceries_delete AFTER DELETE ON groceries
+        BEGIN
+            DELETE FROM product_nutrition WHERE grocery_id = OLD.id;
+            DELETE FROM grocery_nutrition WHERE grocery_id = OLD.id;
+        END
+    ''')
+    for event, ids in (('INSERT', 'NEW.grocery_id'), ('DELETE', 'OLD.grocery_id'),
+                       ('UPDATE', 'OLD.grocery_id, NEW.grocery_id')):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS product_nutrition_grocery_nutrition_{event.lower()}
+            AFTER {event} ON grocery_nutrition
+            BEGIN
+                DELETE FROM product_nutrition WHERE grocery_id IN ({ids});
+                {product_rows(f'AND g.id IN ({ids})')};
+            END
+        ''')
+    for event, names in (('INSERT', 'NEW.name'), ('DELETE', 'OLD.name'), ('UPDATE', 'OLD.name, NEW.name')):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS product_nutrition_nutrition_{event.lower()} AFTER {event} ON nutrition
+            BEGIN
+                DELETE FROM product_nutrition WHERE grocery_id IN (SELECT id FROM groceries WHERE name IN ({names}));
+                {product_rows(f'AND g.name IN ({names})')};
+            END
+        ''')
+
+
+def refresh_product_nutrition(conn):
+    """
+    Recomputes 'product_nutrition' from 'groceries' joined with their labels
+    in 'grocery_nutrition' or with 'nutrition' on the product name, in one
+    INSERT ... SELECT. Nutrition values are per
+    100g/ml of the pack's base unit; products without a positive price are
+    left out. Runs inside the caller's transaction (it is also a writer job)
+    and returns the number of products ranked.
+    """
+    conn.execute("DELETE FROM product_nutrition")
+    return conn.execute(product_rows()).rowcount
+
+
+def rebuild_product_nutrition(db_path=None):
+    # Refreshes the whole ranking through the writer thread (the triggers keep it current otherwise)
+    products = get_writer(db_path).submit(refresh_product_nutrition).result()
+    print(f"Ranked {products} products by nutrient density and price.")
+    return products
+
+
+if __name__ == "__main__":
+    rebuild_product_nutrition()
+    ranking = ProductNutritionRepository(connect())
+    for name, category, value in ranking.top(sys.argv[1] if len(sys.argv) > 1 else 'protein_per_price',
+                                             sys.argv[2] if len(sys.argv) > 2 else None):
+        print(f"{value:10.2f}  {name} ({category})")
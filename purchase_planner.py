@@ -0,0 +1,190 @@
+"""Cheapest combination of grocery packs covering what a recipe still needs"""
+
+import math
+from functools import reduce
+import numpy as np
+from change_tracking import table_version
+
+
+def prune_dominated(packs):
+    # A pack is never needed if another one is at most as expensive and at least as big
+    packs = sorted(packs, key=lambda pack: (pack['price'], -pack['amount']))
+    frontier = []
+    for pack in packs:
+        if not frontier or pack['amount'] > frontier[-1]['amount']:
+            frontier.append(pack)
+    return frontier
+
+
+def grid_step(packs, needed, resolution, max_steps):
+    # Integer pack sizes (190g, 500g, ...) are exact on a grid of their gcd; otherwise
+    # (or when that grid would be too fine) fall back to needed / resolution
+    amounts = [pack['amount'] for pack in packs]
+    if all(float(amount).is_integer() for amount in amounts):
+        step = reduce(math.gcd, (int(amount) for amount in amounts))
+        if needed / step <= max_steps:
+            return step
+    return needed / resolution
+
+
+def cheapest_cover(packs, needed, resolution=500, max_steps=2000):
+    """
+    Bounded dynamic program over the amount, on a grid of at most max_steps steps:
+    the cheapest multiset of packs whose total amount covers `needed`, with the
+    smallest total amount (least waste) among equally cheap ones.
+    Returns {pack index: count}, or None when no pack can be used.
+    """
+    step = grid_step(packs, needed, resolution, max_steps)
+    # Pack sizes are rounded down, so a plan found on the grid always covers the real amount
+    units = [int(pack['amount'] / step + 1e-9) for pack in packs]
+    usable = [j for j, unit in enumerate(units) if unit > 0]
+    if not usable:
+        # Only packs smaller than one step: fill up with the cheapest one per unit
+        if not packs:
+            return None
+        best = min(range(len(packs)), key=lambda j: packs[j]['price'] / packs[j]['amount'])
+        return {best: math.ceil(needed / packs[best]['amount'])}
+
+    target = max(1, math.ceil(needed / step - 1e-9))
+    # best[x] = (cost, bought amount) to cover at least x steps; choice[x] = last pack added
+    best = [(0.0, 0.0)] + [None] * target
+    choice = [None] * (target + 1)
+    for x in range(1, target + 1):
+        for j in usable:
+            previous = best[max(0, x - units[j])]
+            candidate = (round(previous[0] + packs[j]['price'], 6), previous[1] + packs[j]['amount'])
+            if best[x] is None or candidate < best[x]:
+                best[x] = candidate
+                choice[x] = j
+
+    counts = {}
+    x = target
+    while x > 0:
+        j = choice[x]
+        counts[j] = counts.get(j, 0) + 1
+        x = max(0, x - units[j])
+    return counts
+
+
+class PurchasePlanner:
+    """
+    Per-category pack tables built once from 'groceries' (amounts in base units,
+    dominated packs removed), and a solver choosing the cheapest packs that cover
+    a recipe's shortfall given what is already at home.
+    """
+
+    def __init__(self, conn, feasibility, resolution=500):
+        self.conn = conn
+        self.feasibility = feasibility
+        self.resolution = resolution
+        self.groceries_version = None
+        self.pack_tables = {}
+        self.all_packs = {}
+        self.price_vectors_key = None
+
+    def ensure_current(self):
+        version = table_version(self.conn, 'groceries')
+        if version != self.groceries_version:
+            self.build_pack_tables()
+            self.groceries_version = version
+
+    def build_pack_tables(self):
+        packs = {}
+        self.all_packs = {}
+        for grocery_id, name, category, price, value, unit in self.conn.execute(
+                "SELECT id, name, category, price, amount_value, amount_unit FROM groceries WHERE amount_value > 0"):
+            pack = {'id': grocery_id, 'name': name, 'price': price, 'amount': value, 'unit': unit}
+            packs.setdefault((category, unit), []).append(pack)
+            self.all_packs.setdefault(category, []).append(pack)
+        self.pack_tables = {key: prune_dominated(category_packs) for key, category_packs in packs.items()}
+
+    def cheapest_unit_price(self, category, unit):
+        # Lowest price per base unit among the packs of a category
+        packs = self.pack_tables.get((category, unit), [])
+        return min((pack['price'] / pack['amount'] for pack in packs), default=None)
+
+    def plan_category(self, category, needed, unit):
+        self.ensure_current()
+        if needed is None:
+            # Nothing comparable at home: any one pack of the category will do, take the cheapest
+            packs = self.all_packs.get(category, [])
+            if not packs:
+                return None
+            cheapest = min(packs, key=lambda pack: pack['price'])
+            return {'packs': [(cheapest, 1)], 'cost': cheapest['price'],
+                    'bought': cheapest['amount'], 'needed': None, 'unit': cheapest['unit']}
+
+        packs = self.pack_tables.get((category, unit), [])
+        counts = cheapest_cover(packs, needed, self.resolution) if packs else None
+        if counts is None:
+            return None
+        chosen = [(packs[j], count) for j, count in sorted(counts.items())]
+        return {'packs': chosen,
+                'cost': sum(pack['price'] * count for pack, count in chosen),
+                'bought': sum(pack['amount'] * count for pack, count in chosen),
+                'needed': needed,
+                'unit': unit}
+
+    def plan_recipe(self, recipe_id, servings=None):
+        """
+        Returns (plan, unavailable): the cheapest packs per missing category for
+        cooking the recipe for `servings`, and the categories no grocery can cover.
+        """
+        plan = {}
+        unavailable = []
+        for category, needed, unit in self.feasibility.shortfalls(recipe_id, servings):
+            category_plan = self.plan_category(category, needed, unit)
+            if category_plan is None:
+                unavailable.append(category)
+            else:
+                plan[category] = category_plan
+        return plan, unavailable
+
+    def price_vectors(self):
+        """
+        Per-category vectors aligned with the feasibility matrix columns: the cheapest
+        price per base unit, and the cheapest single pack (for ingredients that are
+        only needed as "some"). Categories no grocery sells are infinitely expensive.
+        """
+        self.ensure_current()
+        self.feasibility.ensure_current()
+        key = (self.groceries_version, self.feasibility.recipes_version)
+        if key != self.price_vectors_key:
+            unit_prices = []
+            pack_prices = []
+            for category, column in self.feasibility.categories.items():
+                unit_price = self.cheapest_unit_price(category, self.feasibility.units[column])
+                unit_prices.append(np.inf if unit_price is None else unit_price)
+                packs = self.all_packs.get(category, [])
+                pack_prices.append(min((pack['price'] for pack in packs), default=np.inf))
+            self.unit_prices = np.array(unit_prices, dtype=np.float64)
+            self.pack_prices = np.array(pack_prices, dtype=np.float64)
+            self.price_vectors_key = key
+        return self.unit_prices, self.pack_prices
+
+    def shopping_costs(self, servings=None):
+        """
+        Money to spend on every recipe at once, buying each missing amount at the
+        cheapest per-unit price: shortfall matrix x unit price vector. Recipes
+        needing a category no grocery sells cost infinity.
+        """
+        unit_prices, pack_prices = self.price_vectors()
+        recipe_ids, _, shortfall, missing = self.feasibility.evaluate(servings)
+        only_some = missing & (shortfall == 0)
+        costs = shortfall @ np.where(np.isfinite(unit_prices), unit_prices, 0)
+        costs += only_some @ np.where(np.isfinite(pack_prices), pack_prices, 0)
+        unbuyable = ((shortfall > 0) & ~np.isfinite(unit_prices)).any(axis=1) | \
+            (only_some & ~np.isfinite(pack_prices)).any(axis=1)
+        costs[unbuyable] = np.inf
+        return recipe_ids, costs
+
+    def cheapest_recipes(self, top_n=5, budget=None, servings=None):
+        # The top N recipes with the lowest shopping cost (at most `budget`)
+        recipe_ids, costs = self.shopping_costs(servings)
+        affordable = np.flatnonzero(np.isfinite(costs) & ((costs <= budget) if budget is not None else True))
+        top_n = min(top_n, len(affordable))
+        if top_n == 0:
+            return recipe_ids[:0], costs[:0]
+        best = affordable[np.argpartition(costs[affordable], top_n - 1)[:top_n]]
+        best = best[np.argsort(costs[best], kind='stable')]
+        return recipe_ids[best], costs[best]
@@ -1,5 +1,6 @@
-import sqlite3
 import sys
+from database import connect, get_db_path, get_writer
+from recipe_ingredients import insert_recipe_ingredients
 import recipe_nutrition_calculator
 
 
@@ -315,9 +316,6 @@ def process_recipe(recipe_content, word_to_category):
     return all_ingredients
 
 def insert_recipe_to_db(db_path, recipe_name, original_ingredients, mapped_ingredients, amounts, servings, link):
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
     formatted_original = ' '.join(original_ingredients)
     formatted_mapped = ' '.join(mapped_ingredients)
     formatted_amounts = ' '.join(amounts)
@@ -331,59 +329,58 @@ def insert_recipe_to_db(db_path, recipe_name, original_ingredients, mapped_ingre
         link
     )
 
-    cursor.execute('''
-        INSERT INTO recipes (name, original_ingredients, ingredients, amount, servings, link)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', recipe_data)
-
-    conn.commit()
-    conn.close()
-
-
-# Create word to category mapping
-word_to_category = create_word_to_category_mapping(category_mapping)
-
-# Read the recipe file
-recipe_file_path = 'recipe_ingredients.txt'  
-recipe_name, servings, link, recipe_content = read_recipe_file(recipe_file_path)
-
-try:
-    # Process the recipe
-    result = process_recipe(recipe_content, word_to_category)
-
-    # Prepare data for database insertion
-    original_ingredients = [item[1] for item in result]
-    mapped_ingredients = [item[2] for item in result]
-    amounts = [item[0] for item in result]
+    def write(conn):
+        recipe_id = conn.execute('''
+            INSERT INTO recipes (name, original_ingredients, ingredients, amount, servings, link)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', recipe_data).lastrowid
+        # The original texts are still separate here, so no alignment is needed
+        insert_recipe_ingredients(conn, recipe_id, original_ingredients, mapped_ingredients, amounts)
 
-    # Insert the recipe into the database
-    db_path = 'groceries.db'
-    insert_recipe_to_db(db_path, recipe_name, original_ingredients, mapped_ingredients, amounts, servings, link)
+    # Written by the database's writer thread; wait until it is committed
+    get_writer(db_path).submit(write).result()
 
-    print(f"Recipe '{recipe_name}' has been added to the database.")
 
-    # Verify the insertion
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+def main():
+    # Create word to category mapping
+    word_to_category = create_word_to_category_mapping(category_mapping)
 
-    cursor.execute("SELECT * FROM recipes WHERE name = ?", (recipe_name,))
-    print("\nInserted recipe:")
-    print(cursor.fetchone())
+    # Read the recipe file
+    recipe_file_path = 'recipe_ingredients.txt'  
+    recipe_name, servings, link, recipe_content = read_recipe_file(recipe_file_path)
 
-    # Calculate nutrition values for the recipe
-    recipe_nutrition_calculator.calculate_recipe_nutrition(recipe_name)
+    try:
+        # Process the recipe
+        result = process_recipe(recipe_content, word_to_category)
 
+        # Prepare data for database insertion
+        original_ingredients = [item[1] for item in result]
+        mapped_ingredients = [item[2] for item in result]
+        amounts = [item[0] for item in result]
 
-    conn.close()
+        # Insert the recipe into the database
+        db_path = get_db_path()
+        insert_recipe_to_db(db_path, recipe_name, original_ingredients, mapped_ingredients, amounts, servings, link)
 
-except IngredientMappingError as e:
-    print(f"Error: {e}")
-    print("The recipe was not added to the database.")
-    sys.exit(1)
+        print(f"Recipe '{recipe_name}' has been added to the database.")
 
+        # Verify the insertion
+        conn = connect(db_path)
+        cursor = conn.cursor()
 
+        cursor.execute("SELECT * FROM recipes WHERE name = ?", (recipe_name,))
+        print("\nInserted recipe:")
+        print(cursor.fetchone())
 
+        # Calculate nutrition values for the recipe
+        recipe_nutrition_calculator.calculate_recipe_nutrition(recipe_name, db_path)
 
 
+    except IngredientMappingError as e:
+        print(f"Error: {e}")
+        print("The recipe was not added to the database.")
+        sys.exit(1)
 
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Recipes as fixed-width category bitsets, for "missing at most k ingredients" searches"""
+
+import numpy as np
+from recipe_adder import category_mapping
+from change_tracking import table_version
+from database import connect
+
+# Number of set bits in every byte value, used when numpy has no bitwise_count
+BYTE_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def popcount(blocks):
+    # Set bits per row of a (rows x blocks) uint64 array
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(blocks).sum(axis=1, dtype=np.int64)
+    as_bytes = np.ascontiguousarray(blocks).view(np.uint8).reshape(len(blocks), -1)
+    return BYTE_POPCOUNT[as_bytes].sum(axis=1, dtype=np.int64)
+
+
+class CategoryBitsets:
+    """
+    Encodes each recipe's category set as uint64 blocks over a fixed category
+    vocabulary: the categories of recipe_adder.category_mapping, followed by any
+    other category used in the recipes or at home. The home inventory is encoded
+    the same way, so popcount(recipe & ~home) is the number of missing categories.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.vocabulary = {category: bit for bit, category in enumerate(sorted(category_mapping))}
+        self.recipes_version = None
+        self.recipe_ids = np.empty(0, dtype=np.int64)
+        self.recipe_bits = np.zeros((0, 1), dtype=np.uint64)
+
+    @property
+    def n_blocks(self):
+        return max(1, (len(self.vocabulary) + 63) // 64)
+
+    def add_to_vocabulary(self, categories):
+        for category in categories:
+            self.vocabulary.setdefault(category, len(self.vocabulary))
+
+    def encode(self, categories):
+        bits = np.zeros(self.n_blocks, dtype=np.uint64)
+        for category in categories:
+            bit = self.vocabulary[category]
+            bits[bit // 64] |= np.uint64(1) << np.uint64(bit % 64)
+        return bits
+
+    def decode(self, bits):
+        categories = list(self.vocabulary)
+        return [categories[block * 64 + offset]
+                for block, value in enumerate(bits.tolist())
+                for offset in range(64) if value >> offset & 1]
+
+    def ensure_current(self):
+        version = table_version(self.conn, 'recipes')
+        if version != self.recipes_version:
+            self.build()
+            self.recipes_version = version
+
+    def build(self):
+        rows = self.conn.execute("SELECT id, ingredients FROM recipes ORDER BY id").fetchall()
+        category_sets = [set(ingredients.split()) for _, ingredients in rows]
+        for categories in category_sets:
+            self.add_to_vocabulary(categories)
+        self.recipe_ids = np.array([recipe_id for recipe_id, _ in rows], dtype=np.int64)
+        self.recipe_bits = np.zeros((len(rows), self.n_blocks), dtype=np.uint64)
+        pairs = [(row, self.vocabulary[category]) for row, categories in enumerate(category_sets)
+                 for category in categories]
+        if pairs:
+            recipe_rows, bits = (np.array(values, dtype=np.int64) for values in zip(*pairs))
+            np.bitwise_or.at(self.recipe_bits, (recipe_rows, bits // 64),
+                             np.left_shift(np.uint64(1), (bits % 64).astype(np.uint64)))
+
+    def home_bits(self):
+        home_categories = {row[0] for row in self.conn.execute("SELECT DISTINCT category FROM home")}
+        # Categories only found at home do not matter for what a recipe is missing
+        return self.encode(category for category in home_categories if category in self.vocabulary)
+
+    def missing_at_most(self, k):
+        """
+        Returns {missing categories (tuple): [recipe ids]} for every recipe that
+        misses at most k categories at home, ordered by the number missing.
+        """
+        self.ensure_current()
+        missing = self.recipe_bits & ~self.home_bits()
+        counts = popcount(missing)
+        selected = np.flatnonzero(counts <= k)
+        if len(selected) == 0:
+            return {}
+
+        # Group the recipes with identical missing sets
+        patterns, groups = np.unique(missing[selected], axis=0, return_inverse=True)
+        groups = groups.ravel()
+        order = np.argsort(popcount(patterns), kind='stable')
+        return {tuple(self.decode(patterns[group])): self.recipe_ids[selected[groups == group]].tolist()
+                for group in order}
+
+
+if __name__ == "__main__":
+    # connect() brings the schema (and its change counters) up to date
+    conn = connect()
+    bitsets = CategoryBitsets(conn)
+    for missing, recipe_ids in bitsets.missing_at_most(2).items():
+        names = [conn.execute("SELECT name FROM recipes WHERE id = ?", (recipe_id,)).fetchone()[0]
+                 for recipe_id in recipe_ids]
+        print(f"Missing {', '.join(missing) or 'nothing'}: {', '.join(names)}")
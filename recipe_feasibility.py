@@ -0,0 +1,145 @@
+"""Vectorized "cookable now" scoring of every recipe against the ingredients at home"""
+
+import numpy as np
+from amount_comparison import UNIT_FACTORS
+from repositories import HomeRepository, RecipeIngredientsRepository
+from change_tracking import table_version
+
+
+class FeasibilityEngine:
+    """
+    Holds a dense recipes x categories matrix of the amounts each recipe needs
+    (in base units: g, ml or pieces, for the recipe's original servings) and the
+    home inventory as a vector over the same categories. One vectorized
+    comparison then gives, for every recipe at once, which ingredients are
+    covered for a given number of servings and how much is missing.
+
+    Each category is measured in the base unit it is first used with in the
+    recipes; recipe or home amounts in another unit (e.g. pieces of something
+    usually weighed) cannot be compared and only count as "some" of it.
+
+    The amounts come from the parsed 'recipe_ingredients' rows. `prepare`, if
+    given, is called before the matrix is rebuilt to fill the rows of recipes
+    added or edited since (see RecipeRecommender.ensure_recipe_ingredients).
+    """
+
+    def __init__(self, conn, prepare=None):
+        self.conn = conn
+        self.prepare = prepare
+        self.recipes_version = None
+        self.home_version = None
+        self.categories = {}
+        self.units = []
+        self.recipe_ids = np.empty(0, dtype=np.int64)
+        self.servings = np.empty(0, dtype=np.float32)
+        self.required = np.zeros((0, 0), dtype=np.float32)
+        self.uses = np.zeros((0, 0), dtype=bool)
+        self.home = np.zeros(0, dtype=np.float32)
+        self.home_any = np.zeros(0, dtype=bool)
+
+    def ensure_current(self):
+        # Rebuild the recipe matrix or the home vector only when their table changed
+        recipes_version = table_version(self.conn, 'recipes')
+        if recipes_version != self.recipes_version:
+            if self.prepare is not None:
+                self.prepare()
+            self.build_recipes()
+            self.recipes_version = recipes_version
+            self.home_version = None
+        home_version = table_version(self.conn, 'home')
+        if home_version != self.home_version:
+            self.build_home()
+            self.home_version = home_version
+
+    def category_column(self, category, unit):
+        if category not in self.categories:
+            self.categories[category] = len(self.categories)
+            self.units.append(unit)
+        return self.categories[category]
+
+    def build_recipes(self):
+        rows = self.conn.execute("SELECT id, servings FROM recipes ORDER BY id").fetchall()
+        row_of = {recipe_id: row for row, (recipe_id, _) in enumerate(rows)}
+        self.categories = {}
+        self.units = []
+
+        entries = []
+        for recipe_id, category, value, unit in RecipeIngredientsRepository(self.conn).get_all_amounts():
+            row = row_of.get(recipe_id)
+            if row is None:
+                continue
+            # Stored amounts are in base units already; unreadable ones have no value
+            factor, base_unit = UNIT_FACTORS.get(unit, (None, None)) if unit else (None, None)
+            value = value * factor if value is not None and base_unit is not None else 0.0
+            column = self.category_column(category, base_unit)
+            if self.units[column] is None:
+                self.units[column] = base_unit
+            # Amounts in a different unit than the category's are only "needs some"
+            entries.append((row, column, value if base_unit == self.units[column] else 0.0))
+
+        self.recipe_ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self.servings = np.array([row[1] or 1 for row in rows], dtype=np.float32)
+        self.required = np.zeros((len(rows), len(self.categories)), dtype=np.float32)
+        self.uses = np.zeros((len(rows), len(self.categories)), dtype=bool)
+        if entries:
+            recipe_rows, columns, values = zip(*entries)
+            np.add.at(self.required, (np.array(recipe_rows), np.array(columns)), np.array(values, dtype=np.float32))
+            self.uses[np.array(recipe_rows), np.array(columns)] = True
+
+    def build_home(self):
+        self.home = np.zeros(len(self.categories), dtype=np.float32)
+        self.home_any = np.zeros(len(self.categories), dtype=bool)
+        # Home amounts summed per category and base unit in SQL, from the stored numeric columns
+        for category, value, unit in HomeRepository(self.conn).get_totals():
+            column = self.categories.get(category)
+            if column is None:
+                continue
+            if value > 0:
+                self.home_any[column] = True
+            if unit == self.units[column]:
+                self.home[column] += value
+
+    def scaling(self, rows, servings=None, multiplier=1.0):
+        # Per-recipe scaling factor: either to a fixed number of servings or by a multiplier
+        if servings is not None:
+            return np.float32(servings) / self.servings[rows]
+        return np.full(len(self.servings[rows]), multiplier, dtype=np.float32)
+
+    def evaluate(self, servings=None, multiplier=1.0, rows=slice(None)):
+        """
+        Returns (recipe_ids, coverage, shortfall, missing) for all recipes (or the
+        given matrix rows): the fraction of each recipe's ingredients covered at
+        home, the recipes x categories matrix of amounts still missing, and which
+        ingredients are not covered.
+        """
+        self.ensure_current()
+        uses = self.uses[rows]
+        needed = self.required[rows] * self.scaling(rows, servings, multiplier)[:, np.newaxis]
+        shortfall = np.maximum(needed - self.home, 0) * uses
+        # Ingredients without a comparable amount are covered by having any of them
+        missing = uses & ((shortfall > 1e-6) | ((needed == 0) & ~self.home_any))
+        counts = uses.sum(axis=1)
+        coverage = np.divide(counts - missing.sum(axis=1), counts,
+                             out=np.ones(len(counts)), where=counts > 0)
+        return self.recipe_ids[rows], coverage, shortfall, missing
+
+    def recipe_row(self, recipe_id):
+        self.ensure_current()
+        row = int(np.searchsorted(self.recipe_ids, int(recipe_id)))
+        if row == len(self.recipe_ids) or self.recipe_ids[row] != int(recipe_id):
+            return None
+        return row
+
+    def shortfalls(self, recipe_id, servings=None, multiplier=1.0):
+        """
+        Lists (category, missing amount, unit) for one recipe. The missing amount is
+        None for ingredients that are not at home at all and have no comparable amount.
+        """
+        row = self.recipe_row(recipe_id)
+        if row is None:
+            return []
+        _, _, shortfall, missing = self.evaluate(servings, multiplier, rows=[row])
+        names = list(self.categories)
+        return [(names[column], float(shortfall[0, column]) if shortfall[0, column] > 0 else None,
+                 self.units[column])
+                for column in np.flatnonzero(missing[0])]
@@ -0,0 +1,314 @@
+"""Persistent TF-IDF index over recipe ingredients, stored next to the database"""
+
+import os
+import re
+import zlib
+from collections import Counter
+import numpy as np
+import scipy.sparse as sp
+
+# Same tokenisation as the TfidfVectorizer(token_pattern=r'\b\w+\b') used before
+TOKEN_PATTERN = re.compile(r'\b\w+\b')
+
+
+def index_path_for(db_path):
+    # 'groceries.db' -> 'groceries.tfidf.npz' in the same directory
+    return os.path.splitext(db_path)[0] + '.tfidf.npz'
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall((text or '').lower())
+
+
+def ingredients_checksum(ingredients):
+    return zlib.crc32((ingredients or '').encode('utf-8'))
+
+
+class RecipeVectorIndex:
+    """
+    TF-IDF vectors (l2-normalised rows, smoothed idf) of all recipes, built once
+    and saved as vocabulary, idf weights and a CSR matrix. Later refreshes only
+    vectorize the recipes that were added or changed since the last build; the
+    idf weights stay frozen until more than `rebuild_ratio` of the rows changed,
+    at which point the whole index is rebuilt.
+    """
+
+    def __init__(self, db_path, index_path=None, rebuild_ratio=0.2):
+        self.index_path = index_path or index_path_for(db_path)
+        self.rebuild_ratio = rebuild_ratio
+        self.loaded = False
+        self.last_seen_version = None
+        self.clear()
+
+    def clear(self):
+        self.ids = np.empty(0, dtype=np.int64)
+        self.checksums = np.empty(0, dtype=np.uint32)
+        self.vocabulary = {}
+        self.idf = np.empty(0, dtype=np.float64)
+        self.doc_freq = np.empty(0, dtype=np.int64)
+        self.n_docs = 0
+        self.matrix = sp.csr_matrix((0, 0), dtype=np.float64)
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def load(self):
+        if not os.path.exists(self.index_path):
+            return False
+        try:
+            with np.load(self.index_path, allow_pickle=False) as data:
+                terms = data['vocabulary']
+                self.vocabulary = {term: i for i, term in enumerate(terms.tolist())}
+                self.ids = data['ids']
+                self.checksums = data['checksums']
+                self.idf = data['idf']
+                self.doc_freq = data['doc_freq']
+                self.n_docs = int(data['n_docs'])
+                self.matrix = sp.csr_matrix((data['data'], data['indices'], data['indptr']),
+                                            shape=tuple(data['shape']))
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Could not load recipe index '{self.index_path}', rebuilding it: {e}")
+            self.clear()
+            return False
+        return True
+
+    def save(self):
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        # Write to a temporary file first so a crash never leaves a half-written index
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f,
+                     vocabulary=np.array(terms, dtype=str),
+                     ids=self.ids,
+                     checksums=self.checksums,
+                     idf=self.idf,
+                     doc_freq=self.doc_freq,
+                     n_docs=np.int64(self.n_docs),
+                     data=self.matrix.data,
+                     indices=self.matrix.indices,
+                     indptr=self.matrix.indptr,
+                     shape=np.array(self.matrix.shape, dtype=np.int64))
+        os.replace(tmp_path, self.index_path)
+
+    # ------------------------------------------------------------------
+    # Building and incremental maintenance
+    # ------------------------------------------------------------------
+
+    def ensure_current(self, conn):
+        # Lazily load the saved index, then bring it up to date with the recipes table
+        if not self.loaded:
+            self.load()
+            self.loaded = True
+        # Skip the recipes scan when nothing was written since the last check
+        version = (conn.execute("PRAGMA data_version").fetchone()[0], conn.total_changes)
+        if version == self.last_seen_version:
+            return
+        self.refresh(conn)
+        self.last_seen_version = version
+
+    def refresh(self, conn):
+        rows = conn.execute("SELECT id, ingredients FROM recipes ORDER BY id").fetchall()
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        checksums = np.array([ingredients_checksum(row[1]) for row in rows], dtype=np.uint32)
+
+        # Match current rows against the indexed ones (both are sorted by id)
+        if len(self.ids):
+            positions = np.minimum(np.searchsorted(self.ids, ids), len(self.ids) - 1)
+            known = self.ids[positions] == ids
+            unchanged = known & (self.checksums[positions] == checksums)
+        else:
+            positions = np.zeros(len(ids), dtype=np.int64)
+            known = unchanged = np.zeros(len(ids), dtype=bool)
+        changed_rows = np.flatnonzero(~unchanged)
+        n_removed = len(self.ids) - int(known.sum())
+
+        if len(changed_rows) == 0 and n_removed == 0:
+            return False
+
+        if self.matrix.shape[0] == 0 or len(changed_rows) + n_removed > self.rebuild_ratio * len(self.ids):
+            self.build([row[1] for row in rows], ids, checksums)
+        else:
+            self.update(positions[unchanged], [rows[i][1] for i in changed_rows],
+                        ids[changed_rows], checksums[changed_rows])
+        self.save()
+        return True
+
+    def build(self, documents, ids, checksums):
+        # Full fit: vocabulary, document frequencies and idf from scratch
+        token_lists = [tokenize(doc) for doc in documents]
+        self.vocabulary = {}
+        for tokens in token_lists:
+            for token in tokens:
+                self.vocabulary.setdefault(token, len(self.vocabulary))
+        # Keep the columns in sorted term order, like TfidfVectorizer does
+        ordered = sorted(self.vocabulary)
+        self.vocabulary = {term: i for i, term in enumerate(ordered)}
+
+        counts = self._count_matrix(token_lists)
+        self.n_docs = len(documents)
+        self.doc_freq = np.bincount(counts.indices, minlength=len(self.vocabulary)).astype(np.int64)
+        self.idf = self._idf(self.doc_freq, self.n_docs)
+        self.matrix = self._weight_and_normalize(counts)
+        self.ids = ids
+        self.checksums = checksums
+
+    def update(self, kept_rows, documents, new_ids, new_checksums):
+        # Remove the document frequencies of rows that are gone or about to be replaced
+        stale_rows = np.setdiff1d(np.arange(len(self.ids)), kept_rows)
+        if len(stale_rows):
+            stale = self.matrix[stale_rows]
+            self.doc_freq -= np.bincount(stale.indices, minlength=len(self.doc_freq))
+            self.n_docs -= len(stale_rows)
+
+        token_lists = [tokenize(doc) for doc in documents]
+        n_old_terms = len(self.vocabulary)
+        for tokens in token_lists:
+            for token in tokens:
+                self.vocabulary.setdefault(token, len(self.vocabulary))
+        n_terms = len(self.vocabulary)
+
+        counts = self._count_matrix(token_lists)
+        self.n_docs += len(documents)
+        self.doc_freq = np.concatenate([self.doc_freq, np.zeros(n_terms - n_old_terms, dtype=np.int64)])
+        self.doc_freq += np.bincount(counts.indices, minlength=n_terms)
+        # Existing idf weights are frozen; only terms seen for the first time get one
+        if n_terms > n_old_terms:
+            new_idf = self._idf(self.doc_freq[n_old_terms:], self.n_docs)
+            self.idf = np.concatenate([self.idf, new_idf])
+        new_vectors = self._weight_and_normalize(counts)
+
+        kept = self.matrix[kept_rows]
+        kept.resize((kept.shape[0], n_terms))
+        combined = sp.vstack([kept, new_vectors], format='csr')
+
+        # Restore id order: unchanged rows come first, then the re-vectorized ones
+        order_ids = np.concatenate([self.ids[kept_rows], new_ids])
+        order = np.argsort(order_ids, kind='stable')
+        self.matrix = combined[order]
+        self.checksums = np.concatenate([self.checksums[kept_rows], new_checksums])[order]
+        self.ids = order_ids[order]
+
+    def _count_matrix(self, token_lists):
+        indptr = [0]
+        indices = []
+        data = []
+        for tokens in token_lists:
+            term_counts = {}
+            for token in tokens:
+                column = self.vocabulary[token]
+                term_counts[column] = term_counts.get(column, 0) + 1
+            indices.extend(term_counts.keys())
+            data.extend(term_counts.values())
+            indptr.append(len(indices))
+        counts = sp.csr_matrix((np.array(data, dtype=np.float64), np.array(indices, dtype=np.int32), indptr),
+                               shape=(len(token_lists), len(self.vocabulary)))
+        counts.sort_indices()
+        return counts
+
+    @staticmethod
+    def _idf(doc_freq, n_docs):
+        # Smoothed idf, identical to TfidfVectorizer(smooth_idf=True)
+        return np.log((1 + n_docs) / (1 + doc_freq)) + 1
+
+    def _weight_and_normalize(self, counts):
+        weighted = counts.multiply(self.idf[np.newaxis, :counts.shape[1]]).tocsr()
+        norms = np.sqrt(np.asarray(weighted.multiply(weighted).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return sp.csr_matrix(sp.diags(1 / norms) @ weighted)
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def vectorize(self, text):
+        # TF-IDF vector of an arbitrary text with the index vocabulary (unknown terms are ignored)
+        vector = np.zeros(len(self.vocabulary), dtype=np.float64)
+        for token in tokenize(text):
+            column = self.vocabulary.get(token)
+            if column is not None:
+                vector[column] += 1
+        vector *= self.idf
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def scores(self, text):
+        # Cosine similarity of the text with every recipe: one sparse matrix-vector product
+        return self.matrix @ self.vectorize(text)
+
+    def top_matches(self, text, top_n=5):
+        return self.top_of_scores(self.scores(text), top_n)
+
+    def top_of_scores(self, scores, top_n=5):
+        # (ids, scores) of the top_n best scoring recipes
+        if len(scores) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        top_n = min(top_n, len(scores))
+        best = np.argpartition(-scores, top_n - 1)[:top_n]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return self.ids[best], scores[best]
+
+
+class IncrementalQueryScores:
+    """
+    Keeps the cosine scores of one slowly changing query (the home inventory)
+    against every recipe. The unnormalised scores matrix @ (counts * idf) are
+    stored with the term counts they were computed for; when the query changes,
+    only the CSC columns of the terms whose count changed are added or
+    subtracted, so an inventory edit costs O(postings of the changed terms).
+    Scores are recomputed from scratch when the index matrix is replaced, and
+    every `recompute_every` updates to shed floating point drift.
+    """
+
+    def __init__(self, vector_index, recompute_every=1000):
+        self.vector_index = vector_index
+        self.recompute_every = recompute_every
+        self.matrix = None
+        self.counts = Counter()
+        self.weights = {}
+        self.raw_scores = np.empty(0)
+        self.norm_squared = 0.0
+        self.updates = 0
+
+    def recompute(self, counts):
+        index = self.vector_index
+        self.matrix = index.matrix
+        self.columns = index.matrix.tocsc()
+        self.counts = Counter()
+        self.weights = {}
+        self.raw_scores = np.zeros(index.matrix.shape[0])
+        self.norm_squared = 0.0
+        self.updates = 0
+        self.apply(counts)
+
+    def apply(self, delta):
+        # Adds delta[term] occurrences of each term to the query
+        index = self.vector_index
+        for term, change in delta.items():
+            self.counts[term] += change
+            if self.counts[term] == 0:
+                del self.counts[term]
+            column = index.vocabulary.get(term)
+            if column is None or change == 0:
+                continue
+            old_weight = self.weights.get(column, 0.0)
+            new_weight = old_weight + change * index.idf[column]
+            self.weights[column] = new_weight
+            self.norm_squared += new_weight * new_weight - old_weight * old_weight
+            start, end = self.columns.indptr[column], self.columns.indptr[column + 1]
+            self.raw_scores[self.columns.indices[start:end]] += change * index.idf[column] * self.columns.data[start:end]
+
+    def scores(self, text):
+        counts = Counter(tokenize(text))
+        if self.matrix is not self.vector_index.matrix or self.updates >= self.recompute_every:
+            self.recompute(counts)
+        elif counts != self.counts:
+            delta = Counter(counts)
+            delta.subtract(self.counts)
+            self.apply(delta)
+            self.updates += 1
+        norm = np.sqrt(max(self.norm_squared, 0.0))
+        return self.raw_scores / norm if norm > 1e-12 else np.zeros_like(self.raw_scores)
+
+    def top_matches(self, text, top_n=5):
+        return self.vector_index.top_of_scores(self.scores(text), top_n)
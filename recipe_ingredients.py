@@ -0,0 +1,117 @@
+"""One row per ingredient of a recipe, instead of the space-joined strings in 'recipes'"""
+
+from amount_comparison import base_amount_columns
+
+
+def create_recipe_ingredients_table(conn):
+    """
+    Creates 'recipe_ingredients' with its indexes, and the triggers that drop a
+    recipe's rows when it is deleted or its ingredient strings change (they are
+    filled again by backfill_recipe_ingredients).
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS recipe_ingredients (
+            recipe_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            original_text TEXT NOT NULL,
+            value REAL,
+            unit TEXT,
+            PRIMARY KEY (recipe_id, position)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_recipe_ingredients_category ON recipe_ingredients (category)")
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS recipe_ingredients_delete AFTER DELETE ON recipes
+        BEGIN
+            DELETE FROM recipe_ingredients WHERE recipe_id = OLD.id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS recipe_ingredients_update
+        AFTER UPDATE OF id, original_ingredients, ingredients, amount ON recipes
+        BEGIN
+            DELETE FROM recipe_ingredients WHERE recipe_id = OLD.id;
+        END
+    ''')
+
+
+def format_amount(value, unit):
+    # Inverse of parse_base_amount: (300.0, 'g') -> '300g', (0.25, 'piece') -> '0.25'
+    if value is None:
+        return ''
+    return f"{value:g}{'' if unit in (None, 'piece') else unit}"
+
+
+def phrase_at(words, start, word_to_category, category=None):
+    # Length of the longest phrase starting at words[start] that maps to a category (or to `category`)
+    for length in range(len(words) - start, 0, -1):
+        mapped = word_to_category.get(' '.join(words[start:start + length]).lower())
+        if mapped is not None and (category is None or mapped == category):
+            return length
+    return 0
+
+
+def align_original_ingredients(original_ingredients, categories, word_to_category):
+    """
+    Splits the space-joined original ingredient texts back into one text per
+    category. Each text starts with the longest phrase mapping to its category
+    and extends until the phrase of the next category starts (so "garlic clove"
+    stays together). Falls back to one word per category when the words cannot
+    be matched.
+    """
+    words = original_ingredients.split()
+    texts = []
+    start = 0
+    for i, category in enumerate(categories):
+        length = phrase_at(words, start, word_to_category, category)
+        if length == 0:
+            if len(words) == len(categories):
+                return words
+            return None
+        end = start + length
+        if i + 1 < len(categories):
+            while end < len(words) and not phrase_at(words, end, word_to_category, categories[i + 1]):
+                end += 1
+        else:
+            end = len(words)
+        texts.append(' '.join(words[start:end]))
+        start = end
+    return texts
+
+
+def recipe_ingredient_rows(recipe_id, original_texts, categories, amounts):
+    rows = []
+    for position, (category, original_text, amount) in enumerate(zip(categories, original_texts, amounts)):
+        value, unit = base_amount_columns(amount)
+        rows.append((recipe_id, position, category, original_text, value, unit))
+    return rows
+
+
+def insert_recipe_ingredients(conn, recipe_id, original_texts, categories, amounts):
+    conn.executemany('''
+        INSERT OR REPLACE INTO recipe_ingredients (recipe_id, position, category, original_text, value, unit)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', recipe_ingredient_rows(recipe_id, original_texts, categories, amounts))
+
+
+def backfill_recipe_ingredients(conn, word_to_category=None):
+    """
+    Fills 'recipe_ingredients' for every recipe that has no rows yet, from its
+    space-joined strings. Returns the number of recipes filled.
+    """
+    if word_to_category is None:
+        from recipe_adder import category_mapping, create_word_to_category_mapping
+        word_to_category = create_word_to_category_mapping(category_mapping)
+    recipes = conn.execute('''
+        SELECT id, original_ingredients, ingredients, amount FROM recipes
+        WHERE NOT EXISTS (SELECT 1 FROM recipe_ingredients WHERE recipe_id = recipes.id)
+    ''').fetchall()
+    for recipe_id, original_ingredients, ingredients, amounts in recipes:
+        categories = ingredients.split()
+        texts = align_original_ingredients(original_ingredients or '', categories, word_to_category)
+        if texts is None:
+            # Unknown phrases: fall back to the category names
+            texts = [category.replace('_', ' ') for category in categories]
+        insert_recipe_ingredients(conn, recipe_id, texts, categories, amounts.split())
+    return len(recipes)
@@ -0,0 +1,195 @@
+"""Approximate recipe similarity with MinHash signatures and locality-sensitive hashing"""
+
+import sys
+import time
+import random
+import numpy as np
+from recipe_index import RecipeVectorIndex, tokenize
+
+# Mersenne prime 2^31 - 1: a * x + b stays below 2^63 for 31-bit a, x and b
+PRIME = np.uint64((1 << 31) - 1)
+
+
+class ApproximateRecipeIndex:
+    """
+    MinHash signatures of each recipe's category set (the non-zero columns of its
+    TF-IDF row), bucketed per band. A query only scores the recipes sharing at
+    least one band bucket with it, then ranks those with the exact cosine.
+
+    Knobs:
+    - num_perm: signature length; longer signatures estimate Jaccard more precisely
+    - bands: number of LSH bands (num_perm must be a multiple). More bands (fewer
+      rows per band) give higher recall and more candidates; the Jaccard threshold
+      where recall reaches 50% is roughly (1 / bands) ** (1 / rows_per_band)
+    - max_candidates: cap on how many candidates are scored, bounding query latency
+    """
+
+    def __init__(self, vector_index, num_perm=64, bands=32, max_candidates=None, seed=1, chunk_size=5000):
+        if num_perm % bands != 0:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.vector_index = vector_index
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows_per_band = num_perm // bands
+        self.max_candidates = max_candidates
+        self.chunk_size = chunk_size
+
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, int(PRIME), size=num_perm).astype(np.uint64)
+        self.b = rng.randint(0, int(PRIME), size=num_perm).astype(np.uint64)
+        # Random odd multipliers used to fold the rows of a band into one key
+        self.band_coefficients = (rng.randint(1, 1 << 31, size=self.rows_per_band).astype(np.uint64) << 1) | 1
+
+        self.built_for = None
+        self.signatures = None
+        self.band_keys = None
+        self.band_order = None
+        self.sorted_keys = None
+
+    def ensure_current(self):
+        # Rebuild the buckets whenever the underlying TF-IDF matrix was replaced
+        if self.built_for is not self.vector_index.matrix:
+            self.build()
+
+    def build(self):
+        matrix = self.vector_index.matrix
+        n = matrix.shape[0]
+        self.signatures = np.full((n, self.num_perm), PRIME, dtype=np.uint64)
+        for start in range(0, n, self.chunk_size):
+            chunk = matrix[start:start + self.chunk_size]
+            non_empty = np.flatnonzero(np.diff(chunk.indptr))
+            if len(non_empty) == 0:
+                continue
+            hashed = self.hash_terms(chunk.indices)
+            self.signatures[start + non_empty] = np.minimum.reduceat(hashed, chunk.indptr[non_empty], axis=0)
+
+        # Per band: the band key of every recipe, and the recipes sorted by key
+        self.band_keys = self.fold_bands(self.signatures)
+        # Recipes without categories would all share one bucket, keep them out
+        self.band_keys[np.diff(matrix.indptr) == 0] = np.iinfo(np.uint64).max
+        self.band_order = np.argsort(self.band_keys, axis=0, kind='stable')
+        self.sorted_keys = np.take_along_axis(self.band_keys, self.band_order, axis=0)
+        self.built_for = matrix
+
+    def hash_terms(self, terms):
+        x = terms.astype(np.uint64)[:, np.newaxis]
+        return (self.a * x + self.b) % PRIME
+
+    def fold_bands(self, signatures):
+        banded = signatures.reshape(len(signatures), self.bands, self.rows_per_band)
+        # uint64 arithmetic wraps around, which is fine for a hash
+        return (banded * self.band_coefficients).sum(axis=2, dtype=np.uint64)
+
+    def signature_of_columns(self, columns):
+        if len(columns) == 0:
+            return None
+        return self.hash_terms(np.asarray(columns)).min(axis=0)
+
+    def candidates(self, signature):
+        # Rows sharing at least one band bucket with the signature
+        keys = self.fold_bands(signature[np.newaxis, :])[0]
+        found = []
+        for band, key in enumerate(keys):
+            column = self.sorted_keys[:, band]
+            left = np.searchsorted(column, key, side='left')
+            right = np.searchsorted(column, key, side='right')
+            if right > left:
+                found.append(self.band_order[left:right, band])
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        rows, counts = np.unique(np.concatenate(found), return_counts=True)
+        if self.max_candidates is not None and len(rows) > self.max_candidates:
+            # Keep the rows that collided in the most bands
+            rows = rows[np.argsort(-counts, kind='stable')[:self.max_candidates]]
+        return rows
+
+    def rank(self, rows, query_vector, top_n, exclude_row=None):
+        if exclude_row is not None:
+            rows = rows[rows != exclude_row]
+        if len(rows) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        scores = self.vector_index.matrix[rows] @ query_vector
+        top_n = min(top_n, len(rows))
+        best = np.argpartition(-scores, top_n - 1)[:top_n]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return rows[best], scores[best]
+
+    def top_matches(self, text, top_n=5):
+        # Approximate counterpart of RecipeVectorIndex.top_matches
+        self.ensure_current()
+        columns = sorted({self.vector_index.vocabulary[token] for token in tokenize(text)
+                          if token in self.vector_index.vocabulary})
+        signature = self.signature_of_columns(columns)
+        if signature is None:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        rows, scores = self.rank(self.candidates(signature), self.vector_index.vectorize(text), top_n)
+        return self.vector_index.ids[rows], scores
+
+    def neighbors_of_row(self, row, top_n=5):
+        # Approximate nearest recipes of an indexed recipe (by matrix row), excluding itself
+        self.ensure_current()
+        if self.signatures[row][0] == PRIME:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        query_vector = self.vector_index.matrix[row].toarray().ravel()
+        return self.rank(self.candidates(self.signatures[row]), query_vector, top_n, exclude_row=row)
+
+
+def synthetic_documents(n_recipes, n_categories=400, n_templates=2000, seed=0):
+    # Recipes derived from a pool of templates with a few categories swapped,
+    # so that (like real recipes) many of them share most of their ingredients
+    rng = random.Random(seed)
+    categories = [f"category_{i}" for i in range(n_categories)]
+    templates = [rng.sample(categories, rng.randint(4, 12)) for _ in range(n_templates)]
+    documents = []
+    for _ in range(n_recipes):
+        recipe = list(rng.choice(templates))
+        for _ in range(rng.randint(0, 3)):
+            recipe[rng.randrange(len(recipe))] = rng.choice(categories)
+        documents.append(' '.join(recipe))
+    return documents
+
+
+def benchmark(n_recipes=100000, n_queries=200, top_n=10, num_perm=64, bands=32, max_candidates=None):
+    """
+    Compares the approximate top-N neighbours with the exact ones on a synthetic
+    corpus: mean recall@N, mean candidates scored and latency per query.
+    """
+    documents = synthetic_documents(n_recipes)
+    index = RecipeVectorIndex(':memory:')
+    index.build(documents, np.arange(1, n_recipes + 1, dtype=np.int64), np.zeros(n_recipes, dtype=np.uint32))
+
+    start = time.perf_counter()
+    lsh = ApproximateRecipeIndex(index, num_perm=num_perm, bands=bands, max_candidates=max_candidates)
+    lsh.build()
+    build_time = time.perf_counter() - start
+
+    query_rows = np.random.RandomState(1).choice(n_recipes, size=n_queries, replace=False)
+    exact_time = approximate_time = 0.0
+    recalls = []
+    candidate_counts = []
+    for row in query_rows:
+        start = time.perf_counter()
+        scores = index.matrix @ index.matrix[row].toarray().ravel()
+        scores[row] = -np.inf
+        exact = np.argpartition(-scores, top_n - 1)[:top_n]
+        exact_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        approximate, _ = lsh.neighbors_of_row(row, top_n)
+        approximate_time += time.perf_counter() - start
+
+        # Ties at the cut-off make any recipe with the n-th best score a correct answer
+        threshold = scores[exact].min()
+        recalls.append(np.sum(scores[approximate] >= threshold - 1e-12) / top_n)
+        candidate_counts.append(len(lsh.candidates(lsh.signatures[row])))
+
+    print(f"{n_recipes} recipes, num_perm={num_perm}, bands={bands}, max_candidates={max_candidates}")
+    print(f"  LSH build:            {build_time:.2f}s")
+    print(f"  exact query:          {1000 * exact_time / n_queries:.2f}ms")
+    print(f"  approximate query:    {1000 * approximate_time / n_queries:.2f}ms")
+    print(f"  candidates per query: {np.mean(candidate_counts):.0f}")
+    print(f"  recall@{top_n}:            {np.mean(recalls):.3f}")
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
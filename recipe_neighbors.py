@@ -0,0 +1,209 @@
+"""Precomputed top-K most similar recipes, stored in the 'recipe_neighbors' table"""
+
+import sys
+import sqlite3
+import numpy as np
+from recipe_index import RecipeVectorIndex
+from recipe_lsh import ApproximateRecipeIndex
+from database import connect, get_db_path, get_writer
+
+# Largest difference between a stored and a recomputed similarity that is still rounding
+SIMILARITY_TOLERANCE = 1e-9
+
+
+def create_recipe_neighbors_table(conn):
+    # One row per (recipe, rank); the primary key makes a recipe's neighbours a single range read
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS recipe_neighbors (
+            recipe_id INTEGER NOT NULL,
+            rank INTEGER NOT NULL,
+            neighbor_id INTEGER NOT NULL,
+            similarity REAL NOT NULL,
+            PRIMARY KEY (recipe_id, rank)
+        ) WITHOUT ROWID
+    ''')
+    # Ingredients checksum (see recipe_index.ingredients_checksum) of each recipe when its list was computed
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS recipe_neighbor_checksums (
+            recipe_id INTEGER PRIMARY KEY,
+            checksum INTEGER NOT NULL
+        )
+    ''')
+
+
+def top_k_neighbors(block, matrix, block_rows, k):
+    # Cosine similarities of a block of recipes against all recipes (rows are l2-normalised)
+    similarities = (block @ matrix.T).toarray()
+    # A recipe is never its own neighbour
+    similarities[np.arange(len(block_rows)), block_rows] = -np.inf
+    k = min(k, matrix.shape[0] - 1)
+    if k <= 0:
+        return np.empty((len(block_rows), 0), dtype=np.int64), np.empty((len(block_rows), 0))
+    best = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    best_scores = np.take_along_axis(similarities, best, axis=1)
+    order = np.argsort(-best_scores, axis=1, kind='stable')
+    return np.take_along_axis(best, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+
+def neighbor_rows(recipe_id, neighbor_ids, similarities):
+    return [(int(recipe_id), rank, int(neighbor_id), float(similarity))
+            for rank, (neighbor_id, similarity) in enumerate(zip(neighbor_ids, similarities), 1)]
+
+
+def checksum_rows(index, recipe_ids=None):
+    # (recipe id, ingredients checksum) of the given recipes, or of all, from the vector index
+    rows = zip(index.ids.tolist(), index.checksums.tolist())
+    if recipe_ids is None:
+        return list(rows)
+    return [(recipe_id, checksum) for recipe_id, checksum in rows if recipe_id in recipe_ids]
+
+
+def stale_lists(matrix, row_of, current):
+    # Recipes whose stored similarities no longer match the index, e.g. after it refitted its idf weights
+    pairs = [(recipe_id, row_of[neighbor_id], similarity) for recipe_id, neighbors in current.items()
+             if recipe_id in row_of for neighbor_id, similarity in neighbors if neighbor_id in row_of]
+    if not pairs:
+        return set()
+    left = matrix[[row_of[recipe_id] for recipe_id, _, _ in pairs]]
+    right = matrix[[row for _, row, _ in pairs]]
+    similarities = np.asarray(left.multiply(right).sum(axis=1)).ravel()
+    stored = np.array([similarity for _, _, similarity in pairs])
+    return {pairs[i][0] for i in np.flatnonzero(np.abs(similarities - stored) > SIMILARITY_TOLERANCE)}
+
+
+def load_index(conn, db_path):
+    index = RecipeVectorIndex(db_path)
+    index.ensure_current(conn)
+    return index
+
+
+def build_recipe_neighbors(db_path, k=10, block_size=1000, approximate=False):
+    """
+    Recomputes the top-k neighbours of every recipe. Similarities are computed
+    block_size recipes at a time, so memory stays at block_size x N scores.
+    With approximate=True each recipe is only compared with its MinHash/LSH
+    candidates instead of the whole table, for very large recipe tables.
+    """
+    # Similarities are read on the shared connection, the table is rewritten by the writer thread
+    conn = connect(db_path)
+    try:
+        index = load_index(conn, db_path)
+        matrix = index.matrix
+
+        approximate_index = ApproximateRecipeIndex(index) if approximate else None
+
+        rows = []
+        for start in range(0, matrix.shape[0], block_size):
+            block_rows = np.arange(start, min(start + block_size, matrix.shape[0]))
+            if approximate:
+                neighbors, scores = zip(*(approximate_index.neighbors_of_row(row, k) for row in block_rows))
+            else:
+                neighbors, scores = top_k_neighbors(matrix[block_rows], matrix, block_rows, k)
+            for row, recipe_neighbors, recipe_scores in zip(block_rows, neighbors, scores):
+                rows.extend(neighbor_rows(index.ids[row], index.ids[recipe_neighbors], recipe_scores))
+
+        checksums = checksum_rows(index)
+
+        def write(conn):
+            conn.execute("DELETE FROM recipe_neighbors")
+            conn.executemany("INSERT INTO recipe_neighbors VALUES (?, ?, ?, ?)", rows)
+            conn.execute("DELETE FROM recipe_neighbor_checksums")
+            conn.executemany("INSERT INTO recipe_neighbor_checksums VALUES (?, ?)", checksums)
+
+        get_writer(db_path).submit(write).result()
+        print(f"Stored the {k} nearest neighbours of {matrix.shape[0]} recipes.")
+    except sqlite3.Error as e:
+        print(f"An error occurred: {e}")
+
+
+def update_recipe_neighbors(db_path, k=10, block_size=1000):
+    """
+    Partial rebuild after recipes were inserted, edited or deleted. A recipe is
+    edited when its ingredients checksum differs from the one stored with its
+    list, which also catches a deleted id taken by a new recipe. New and edited
+    recipes get their full neighbour list; other recipes are only rewritten
+    when one of their neighbours was deleted or edited, when their stored
+    similarities no longer match the index (it was rebuilt with new idf
+    weights), or when a new or edited recipe beats their current k-th
+    neighbour.
+    """
+    # Similarities are read on the shared connection, the changed lists are written by the writer thread
+    conn = connect(db_path)
+    try:
+        index = load_index(conn, db_path)
+        matrix = index.matrix
+        row_of = {int(recipe_id): row for row, recipe_id in enumerate(index.ids)}
+
+        # Current neighbour lists of every remaining recipe that has one
+        current = {}
+        for recipe_id, neighbor_id, similarity in conn.execute("""
+                SELECT recipe_id, neighbor_id, similarity FROM recipe_neighbors
+                WHERE recipe_id IN (SELECT id FROM recipes)
+                ORDER BY recipe_id, rank"""):
+            current.setdefault(recipe_id, []).append((neighbor_id, similarity))
+        checksums = dict(conn.execute("SELECT recipe_id, checksum FROM recipe_neighbor_checksums"))
+
+        new_ids = [recipe_id for recipe_id in row_of if recipe_id not in current]
+        changed_ids = set(new_ids) | {recipe_id for recipe_id in current
+                                      if checksums.get(recipe_id) != int(index.checksums[row_of[recipe_id]])}
+        # Lists of deleted recipes are dropped below; lists that point to a deleted or edited recipe are recomputed
+        broken_ids = {recipe_id for recipe_id, neighbors in current.items()
+                      if any(neighbor_id not in row_of or neighbor_id in changed_ids for neighbor_id, _ in neighbors)}
+        broken_ids |= stale_lists(matrix, row_of, current)
+        recompute_rows = np.array(sorted(row_of[recipe_id] for recipe_id in changed_ids | broken_ids),
+                                  dtype=np.int64)
+
+        # Full neighbour lists for the new, edited and broken recipes
+        rewritten = {}
+        for start in range(0, len(recompute_rows), block_size):
+            block_rows = recompute_rows[start:start + block_size]
+            neighbors, scores = top_k_neighbors(matrix[block_rows], matrix, block_rows, k)
+            for row, recipe_neighbors, recipe_scores in zip(block_rows, neighbors, scores):
+                rewritten[int(index.ids[row])] = list(zip(index.ids[recipe_neighbors].tolist(),
+                                                          recipe_scores.tolist()))
+
+        # Other recipes only change if a new or edited recipe enters their top k
+        new_rows = np.array(sorted(row_of[recipe_id] for recipe_id in changed_ids), dtype=np.int64)
+        if len(new_rows):
+            new_matrix_t = matrix[new_rows].T
+            existing_ids = [recipe_id for recipe_id in current if recipe_id in row_of and recipe_id not in rewritten]
+            for start in range(0, len(existing_ids), block_size):
+                block_ids = existing_ids[start:start + block_size]
+                block_rows = [row_of[recipe_id] for recipe_id in block_ids]
+                similarities = (matrix[block_rows] @ new_matrix_t).toarray()
+                for recipe_id, candidate_scores in zip(block_ids, similarities):
+                    neighbors = current[recipe_id]
+                    threshold = neighbors[-1][1] if len(neighbors) >= k else -np.inf
+                    better = np.flatnonzero(candidate_scores > threshold)
+                    if len(better) == 0:
+                        continue
+                    candidates = neighbors + list(zip(index.ids[new_rows[better]].tolist(),
+                                                      candidate_scores[better].tolist()))
+                    candidates.sort(key=lambda item: -item[1])
+                    rewritten[recipe_id] = candidates[:k]
+
+        rows = [row for recipe_id, neighbors in rewritten.items()
+                for row in neighbor_rows(recipe_id, [n for n, _ in neighbors], [s for _, s in neighbors])]
+        rewritten_checksums = checksum_rows(index, rewritten)
+
+        def write(conn):
+            conn.execute("DELETE FROM recipe_neighbors WHERE recipe_id NOT IN (SELECT id FROM recipes)")
+            conn.execute("DELETE FROM recipe_neighbor_checksums WHERE recipe_id NOT IN (SELECT id FROM recipes)")
+            conn.executemany("DELETE FROM recipe_neighbors WHERE recipe_id = ?",
+                             [(recipe_id,) for recipe_id in rewritten])
+            conn.executemany("INSERT INTO recipe_neighbors VALUES (?, ?, ?, ?)", rows)
+            conn.executemany("INSERT OR REPLACE INTO recipe_neighbor_checksums VALUES (?, ?)", rewritten_checksums)
+
+        get_writer(db_path).submit(write).result()
+        print(f"Updated the neighbour lists of {len(rewritten)} recipe(s) ({len(new_ids)} new, "
+              f"{len(changed_ids) - len(new_ids)} edited).")
+    except sqlite3.Error as e:
+        print(f"An error occurred: {e}")
+
+
+if __name__ == "__main__":
+    db_path = get_db_path()
+    if '--update' in sys.argv:
+        update_recipe_neighbors(db_path)
+    else:
+        build_recipe_neighbors(db_path, approximate='--approximate' in sys.argv)
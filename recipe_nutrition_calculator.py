@@ -1,106 +1,318 @@
 import sqlite3
 import re
+import numpy as np
+import scipy.sparse as sp
+from database import get_writer
+from repositories import RecipesRepository, NutritionRepository, RecipeIngredientsRepository, RecipeNutritionRepository
+from recipe_ingredients import backfill_recipe_ingredients
+from amount_comparison import parse_base_amount, UNIT_FACTORS
+
+# Dirty recipes recalculated per writer transaction
+RECOMPUTE_BATCH_SIZE = 500
 
 class MissingNutritionInfoError(Exception):
     pass
 
+def create_recipe_nutrition_table(conn):
+    """
+    Creates 'recipe_nutrition', the nutrients of one serving of each recipe
+    (scaling to other servings is a multiplication), with the triggers that
+    drop a recipe's row when it is deleted and rescale it when its servings
+    change.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS recipe_nutrition (
+            recipe_id INTEGER PRIMARY KEY,
+            calories REAL NOT NULL,
+            fat REAL NOT NULL,
+            protein REAL NOT NULL,
+            carbs REAL NOT NULL,
+            sugar REAL NOT NULL,
+            fiber REAL NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS recipe_nutrition_delete AFTER DELETE ON recipes
+        BEGIN
+            DELETE FROM recipe_nutrition WHERE recipe_id = OLD.id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS recipe_nutrition_servings AFTER UPDATE OF servings ON recipes
+        WHEN NEW.servings > 0 AND OLD.servings > 0
+        BEGIN
+            UPDATE recipe_nutrition
+            SET calories = calories * OLD.servings / NEW.servings, fat = fat * OLD.servings / NEW.servings,
+                protein = protein * OLD.servings / NEW.servings, carbs = carbs * OLD.servings / NEW.servings,
+                sugar = sugar * OLD.servings / NEW.servings, fiber = fiber * OLD.servings / NEW.servings
+            WHERE recipe_id = NEW.id;
+        END
+    ''')
+
+def create_nutrition_dirty_queue(conn):
+    """
+    Creates 'recipe_nutrition_dirty', the recipes whose nutrition has to be
+    recalculated, and the triggers filling it: a change to the nutrition of a
+    category queues every recipe using that category (found through the
+    category index of 'recipe_ingredients'), and new or edited recipes queue
+    themselves, as do recipes whose servings change (the rescaling trigger
+    cannot help a recipe that had no servings before). recompute_dirty_nutrition
+    drains the queue.
+    """
+    conn.execute("CREATE TABLE IF NOT EXISTS recipe_nutrition_dirty (recipe_id INTEGER PRIMARY KEY)")
+    uses = "INSERT OR IGNORE INTO recipe_nutrition_dirty (recipe_id) SELECT recipe_id FROM recipe_ingredients"
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS recipe_nutrition_dirty_nutrition_insert AFTER INSERT ON nutrition
+        BEGIN
+            {uses} WHERE category = NEW.category;
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS recipe_nutrition_dirty_nutrition_delete AFTER DELETE ON nutrition
+        BEGIN
+            {uses} WHERE category = OLD.category;
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS recipe_nutrition_dirty_nutrition_update
+        AFTER UPDATE OF category, calories, fat, protein, carbs, sugar, fiber ON nutrition
+        BEGIN
+            {uses} WHERE category IN (OLD.category, NEW.category);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS recipe_nutrition_dirty_recipe_insert AFTER INSERT ON recipes
+        BEGIN
+            INSERT OR IGNORE INTO recipe_nutrition_dirty (recipe_id) VALUES (NEW.id);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS recipe_nutrition_dirty_recipe_update
+        AFTER UPDATE OF id, original_ingredients, ingredients, amount ON recipes
+        BEGIN
+            INSERT OR IGNORE INTO recipe_nutrition_dirty (recipe_id) VALUES (OLD.id), (NEW.id);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS recipe_nutrition_dirty_recipe_servings AFTER UPDATE OF servings ON recipes
+        BEGIN
+            INSERT OR IGNORE INTO recipe_nutrition_dirty (recipe_id) VALUES (NEW.id);
+        END
+    ''')
+
+def parse_nutrition_values(text):
+    # "Calories: 512.00\nFat: 20.10g\n..." (the former recipes.nutrition_values) -> six totals, or None
+    if not text:
+        return None
+    values = {}
+    for line in text.split('\n'):
+        if ': ' not in line:
+            continue
+        nutrient, value = line.split(': ', 1)
+        try:
+            values[nutrient.strip().lower()] = float(value.strip().rstrip('g'))
+        except ValueError:
+            return None
+    if any(nutrient not in values for nutrient in RecipeNutritionRepository.columns):
+        return None
+    return [values[nutrient] for nutrient in RecipeNutritionRepository.columns]
+
+def backfill_recipe_nutrition(conn):
+    # Moves the nutrition text of recipes calculated before 'recipe_nutrition' existed into the table
+    rows = conn.execute("""
+        SELECT id, nutrition_values FROM recipes
+        WHERE nutrition_values IS NOT NULL AND id NOT IN (SELECT recipe_id FROM recipe_nutrition)
+    """).fetchall()
+    parsed = [(recipe_id, parse_nutrition_values(text)) for recipe_id, text in rows]
+    return RecipeNutritionRepository(conn).set_totals_many(
+        [(recipe_id, totals) for recipe_id, totals in parsed if totals is not None])
+
 def is_unit_less(amount):
     # Check if the amount is a fraction or a whole number without units
     return bool(re.match(r'^(\d+(/\d+)?|\d+\.\d+)$', amount))
 
 def extract_number_from_amount(amount):
-    # Extract the numerical part from the amount string
-    match = re.match(r'^([\d./]+)', amount)
-    if match:
-        num_str = match.group(1)
-        # Handle fractions
-        if '/' in num_str:
-            num, denom = map(float, num_str.split('/'))
-            return num / denom
-        return float(num_str)
-    return None
-
-def calculate_recipe_nutrition(recipe_name):
-    # Connect to the database
-    conn = sqlite3.connect('groceries.db')
-    cursor = conn.cursor()
-
-    # Get recipe ingredients and amounts
-    cursor.execute("SELECT ingredients, amount FROM recipes WHERE name = ?", (recipe_name,))
-    recipe_data = cursor.fetchone()
-
-    if not recipe_data:
-        print(f"Recipe '{recipe_name}' not found.")
-        conn.close()
-        return
-
-    ingredients = recipe_data[0].split()
-    amounts = recipe_data[1].split()
-
-    # Initialize nutritional totals
-    total_calories = total_fat = total_protein = total_carbs = total_sugar = total_fiber = 0
-    skipped_ingredients = []
-
+    # Numerical part of the amount string, in grams, millilitres or pieces
     try:
-        # Calculate nutrition for each ingredient
-        for ingredient, amount in zip(ingredients, amounts):
-            if is_unit_less(amount):
-                skipped_ingredients.append(ingredient)
-                continue
-
-            amount_value = extract_number_from_amount(amount)
-            if amount_value is None:
-                skipped_ingredients.append(ingredient)
-                continue
-
-            # Get nutritional data for the ingredient
-            cursor.execute("""
-                SELECT calories, fat, protein, carbs, sugar, fiber
-                FROM nutrition
-                WHERE category = ?
-            """, (ingredient,))
-            nutrition_data = cursor.fetchone()
-
-            if not nutrition_data:
-                raise MissingNutritionInfoError(f"Missing nutritional information for ingredient: {ingredient}")
-
-            # Calculate nutrition based on amount
-            calories, fat, protein, carbs, sugar, fiber = nutrition_data
-            factor = amount_value / 100  # Since nutrition data is per 100g/ml
-
-            total_calories += calories * factor
-            total_fat += fat * factor
-            total_protein += protein * factor
-            total_carbs += carbs * factor
-            total_sugar += sugar * factor
-            total_fiber += fiber * factor
-
-        # Format the nutrition values as a string
-        nutrition_string = f"""Calories: {total_calories:.2f}
+        return parse_base_amount(amount)[0]
+    except ValueError:
+        return None
+
+def format_nutrition(totals):
+    total_calories, total_fat, total_protein, total_carbs, total_sugar, total_fiber = totals
+    return f"""Calories: {total_calories:.2f}
 Fat: {total_fat:.2f}g
 Protein: {total_protein:.2f}g
 Carbs: {total_carbs:.2f}g
 Sugar: {total_sugar:.2f}g
 Fiber: {total_fiber:.2f}g"""
 
-        # Update the recipe table with the calculated nutrition values
-        cursor.execute("""
-            UPDATE recipes
-            SET nutrition_values = ?
-            WHERE name = ?
-        """, (nutrition_string, recipe_name))
-        conn.commit()
-        print(f"Nutrition values for '{recipe_name}' have been updated in the database.")
-        
-        if skipped_ingredients:
-            print(f"Note: The following ingredients were skipped due to lack of unit information or invalid format: {', '.join(skipped_ingredients)}")
+def calculate_recipe_nutrition(recipe_name, db_path=None):
+    # Calculated and stored by the database's writer thread, in one transaction
+    def write(conn):
+        # Backfill the ingredient rows of recipes added since the last run
+        backfill_recipe_ingredients(conn)
+
+        # Sum the nutrition of all ingredients in one query over 'recipe_ingredients'
+        recipe_totals = NutritionRepository(conn).get_recipe_totals(recipe_name)
+        if recipe_totals is None:
+            return None
+        totals, skipped_ingredients, missing = recipe_totals
+
+        if missing:
+            raise MissingNutritionInfoError(f"Missing nutritional information for ingredient: {missing[0]}")
 
+        # Store the values per serving in 'recipe_nutrition'
+        recipe_id = RecipesRepository(conn).get_id(recipe_name)
+        RecipeNutritionRepository(conn).set_totals_many([(recipe_id, totals)])
+        return skipped_ingredients
+
+    try:
+        skipped_ingredients = get_writer(db_path).submit(write).result()
     except MissingNutritionInfoError as e:
         print(f"Error: {e}")
         print("The nutrition values were not calculated or updated.")
+        return
     except sqlite3.Error as e:
         print(f"An error occurred while updating the database: {e}")
-    finally:
-        conn.close()
+        return
+
+    if skipped_ingredients is None:
+        print(f"Recipe '{recipe_name}' not found.")
+        return
+    print(f"Nutrition values for '{recipe_name}' have been updated in the database.")
+    
+    if skipped_ingredients:
+        print(f"Note: The following ingredients were skipped due to lack of unit information or invalid format: {', '.join(skipped_ingredients)}")
+
+
+def nutrition_totals(conn, recipe_ids=None):
+    """
+    The nutrition of all recipes (or of recipe_ids) from one sparse matrix
+    product. A recipes x categories matrix holds the amounts in grams or
+    millilitres divided by 100, a categories x nutrients matrix the values per
+    100g/ml. Ingredients counted in pieces are left out as in
+    calculate_recipe_nutrition. Returns (totals, skipped): a list of (recipe
+    id, six totals), and {recipe id: categories without nutrition information}
+    for the recipes that could not be calculated.
+    """
+    rows = RecipeIngredientsRepository(conn).get_all_amounts(recipe_ids)
+    values_by_category = NutritionRepository(conn).get_all_values()
+
+    recipe_ids = sorted({recipe_id for recipe_id, _, _, _ in rows})
+    recipe_rows = {recipe_id: row for row, recipe_id in enumerate(recipe_ids)}
+    categories = {}
+    entries = []
+    for recipe_id, category, value, unit in rows:
+        factor, base_unit = UNIT_FACTORS.get(unit, (None, None)) if unit else (None, None)
+        if value is None or base_unit not in ('g', 'ml'):
+            continue
+        column = categories.setdefault(category, len(categories))
+        entries.append((recipe_rows[recipe_id], column, value * factor / 100))
+
+    # Duplicate (recipe, category) entries are summed
+    row_index, column_index, data = zip(*entries) if entries else ((), (), ())
+    amounts = sp.csr_matrix((data, (row_index, column_index)), shape=(len(recipe_ids), len(categories)),
+                            dtype=np.float64)
+    per_100 = np.zeros((len(categories), 6))
+    available = np.zeros(len(categories), dtype=bool)
+    for category, column in categories.items():
+        if category in values_by_category:
+            per_100[column] = values_by_category[category]
+            available[column] = True
+
+    totals = amounts @ per_100
+    # Recipes with an amount of a category that has no nutrition values
+    uses_missing = amounts[:, np.flatnonzero(~available)].getnnz(axis=1) > 0
+
+    missing_categories = [category for category, column in categories.items() if not available[column]]
+    skipped = {}
+    calculated = []
+    for row, recipe_id in enumerate(recipe_ids):
+        if uses_missing[row]:
+            used = set(amounts[row].indices)
+            skipped[recipe_id] = [category for category in missing_categories if categories[category] in used]
+        else:
+            calculated.append((recipe_id, totals[row]))
+    return calculated, skipped
+
+
+def calculate_all_recipe_nutrition(db_path=None):
+    """
+    Bulk mode: calculates every recipe with nutrition_totals and writes the
+    results to 'recipe_nutrition' in one writer-thread transaction. Recipes using a category
+    without nutrition information are skipped and reported rather than
+    stopping the run. Returns (updated, skipped) with skipped as {recipe name:
+    missing categories}.
+    """
+    def write(conn):
+        recipe_nutrition = RecipeNutritionRepository(conn)
+        backfill_recipe_ingredients(conn)
+        calculated, skipped_ids = nutrition_totals(conn)
+        names = RecipesRepository(conn).get_names(skipped_ids)
+        skipped = {names.get(recipe_id): missing for recipe_id, missing in skipped_ids.items()}
+
+        updated = recipe_nutrition.set_totals_many(calculated)
+        # Every recipe was just calculated, so nothing is left for the recompute worker
+        recipe_nutrition.clear_dirty()
+        return updated, skipped
+
+    try:
+        updated, skipped = get_writer(db_path).submit(write).result()
+    except sqlite3.Error as e:
+        print(f"An error occurred while updating the database: {e}")
+        return 0, {}
+
+    print(f"Nutrition values updated for {updated} recipe(s).")
+    for name, missing in skipped.items():
+        print(f"Skipped '{name}': missing nutritional information for {', '.join(missing)}")
+    return updated, skipped
+
+
+def recompute_nutrition_batch(batch_size=RECOMPUTE_BATCH_SIZE):
+    """
+    Writer job recalculating up to batch_size recipes of the dirty queue.
+    Recipes that can no longer be calculated (a category lost its nutrition,
+    the recipe has no servings, or it is gone) lose their stale
+    'recipe_nutrition' row. Returns
+    (recipes taken from the queue, recipes updated, {recipe id: missing
+    categories}).
+    """
+    def recompute(conn):
+        recipe_nutrition = RecipeNutritionRepository(conn)
+        # Recipes added or edited since the last run get their ingredient rows first
+        backfill_recipe_ingredients(conn)
+        recipe_ids = recipe_nutrition.get_dirty(batch_size)
+        if not recipe_ids:
+            return 0, 0, {}
+        calculated, skipped = nutrition_totals(conn, recipe_ids)
+        # Rows of the batch are written again, so the ones set_totals_many leaves out do not stay behind
+        recipe_nutrition.delete_many(recipe_ids)
+        updated = recipe_nutrition.set_totals_many(calculated)
+        recipe_nutrition.clear_dirty(recipe_ids)
+        return len(recipe_ids), updated, skipped
+    return recompute
+
 
+def recompute_dirty_nutrition(db_path=None, batch_size=RECOMPUTE_BATCH_SIZE):
+    """
+    Drains the dirty queue through the database's writer thread, one batch per
+    transaction, so the work scales with what changed rather than with the
+    number of recipes. Returns (recipes updated, {recipe id: missing
+    categories}).
+    """
+    writer = get_writer(db_path)
+    updated = 0
+    skipped = {}
+    while True:
+        taken, batch_updated, batch_skipped = writer.submit(recompute_nutrition_batch(batch_size)).result()
+        if taken == 0:
+            break
+        updated += batch_updated
+        skipped.update(batch_skipped)
+    if updated or skipped:
+        print(f"Nutrition values recalculated for {updated} recipe(s); {len(skipped)} recipe(s) lack nutrition data.")
+    return updated, skipped
 
+if __name__ == "__main__":
+    calculate_all_recipe_nutrition()
@@ -1,54 +1,48 @@
 import sqlite3
-from collections import Counter
+import numpy as np
 import pandas as pd
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
+import database
+from database import connect, get_db_path
+from repositories import CookedRecipesRepository, RecipesRepository
+from recipe_index import RecipeVectorIndex
+from recipe_lsh import ApproximateRecipeIndex
 
 
-def get_top_3_cooked_recipes(db_path):
-    # Connect to the SQLite database
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
+def get_top_3_cooked_recipes(db_path=None):
+    # The three recipes cooked most often, read from 'cookedrecipes' through the shared connection
+    top_3 = []
     try:
-        # Execute SQL query to get all recipe names
-        cursor.execute("SELECT name FROM cookedrecipes")
-        
-        # Fetch all results
-        recipes = cursor.fetchall()
-        
-        # Count occurrences of each recipe name
-        recipe_counts = Counter(recipe[0] for recipe in recipes)
-        
-        # Sort recipes by count in descending order and get top 3
-        top_3_recipes = recipe_counts.most_common(3)
-        
-        top_3 = []
-        # Print results
+        top_3_recipes = CookedRecipesRepository(connect(db_path)).most_cooked(3)
+
         print("Top 3 most cooked recipes:")
         for i, (recipe, count) in enumerate(top_3_recipes, 1):
-            print(f"{i}. {recipe}: cooked {count} time{'s' if count > 1 else ''}")
+            print(f"{i}. {recipe}: cooked {count:g} time{'s' if count != 1 else ''}")
             top_3.append(recipe)
 
     except sqlite3.Error as e:
         print(f"An error occurred: {e}")
-    
-    finally:
-        # Close the database connection
-        conn.close()
-    
+
     return top_3
 
 
 
 class RecipeSimilarityCalculator:
     # Calculating the similarity between recipes based on ingredients
-    def __init__(self, db_path):
-        self.conn = sqlite3.connect(db_path)
+    def __init__(self, db_path=None, approximate=False):
+        # Shared connection to the SQLite database (one per thread, see database.py)
+        self.db_path = get_db_path(db_path)
+        self.conn = connect(self.db_path)
         self.cursor = self.conn.cursor()
+        self.recipes = RecipesRepository(self.conn)
         self.recipes_df = None
         self.tfidf_matrix = None
         self.vectorizer = None
+        # Opt-in MinHash/LSH mode for very large recipe tables (see recipe_lsh.py)
+        self.approximate = approximate
+        self.recipe_index = RecipeVectorIndex(self.db_path)
+        self.approximate_index = ApproximateRecipeIndex(self.recipe_index)
 
     def load_recipes(self):
         query = "SELECT name, ingredients FROM recipes"
@@ -60,6 +54,51 @@ class RecipeSimilarityCalculator:
         self.tfidf_matrix = self.vectorizer.fit_transform(self.recipes_df['ingredients'])
 
     def get_recipe_similarity(self, recipe_name, top_n=5):
+        # Read the precomputed neighbours (see recipe_neighbors.py) with a single indexed lookup
+        try:
+            self.cursor.execute("""
+                SELECT r.name, n.similarity, r.ingredients
+                FROM recipes q
+                JOIN recipe_neighbors n ON n.recipe_id = q.id
+                JOIN recipes r ON r.id = n.neighbor_id
+                WHERE q.name = ?
+                ORDER BY n.rank
+                LIMIT ?
+            """, (recipe_name, top_n))
+            neighbors = self.cursor.fetchall()
+        except sqlite3.OperationalError:
+            # The neighbour table has not been built yet
+            neighbors = []
+
+        if neighbors:
+            return [{'name': name, 'similarity': similarity, 'ingredients': ingredients}
+                    for name, similarity, ingredients in neighbors]
+
+        # Not precomputed (yet), compare against all recipes (or the LSH candidates) instead
+        if self.approximate:
+            return self.approximate_recipe_similarity(recipe_name, top_n)
+        return self.compute_recipe_similarity(recipe_name, top_n)
+
+    def approximate_recipe_similarity(self, recipe_name, top_n=5):
+        recipe_id = self.recipes.get_id(recipe_name)
+        if recipe_id is None:
+            print(f"Recipe '{recipe_name}' not found in the database.")
+            return []
+
+        self.recipe_index.ensure_current(self.conn)
+        row = int(np.searchsorted(self.recipe_index.ids, recipe_id))
+        rows, scores = self.approximate_index.neighbors_of_row(row, top_n)
+
+        similar_recipes = []
+        for recipe_id, similarity_score in zip(self.recipe_index.ids[rows], scores):
+            similar_recipes.append({
+                'name': self.recipes.get_name(recipe_id),
+                'similarity': similarity_score,
+                'ingredients': self.recipes.get_ingredients(recipe_id)
+            })
+        return similar_recipes
+
+    def compute_recipe_similarity(self, recipe_name, top_n=5):
         if self.recipes_df is None or self.tfidf_matrix is None:
             self.load_recipes()
             self.vectorize_ingredients()
@@ -87,7 +126,8 @@ class RecipeSimilarityCalculator:
         return similar_recipes
 
     def close_connection(self):
-        self.conn.close()
+        # Closes this thread's shared connection; the next connect() opens a new one
+        database.close_connection(self.db_path)
 
 def print_similar_recipes(similar_recipes):
     print("\nSimilar Recipes:")
@@ -100,7 +140,7 @@ def print_similar_recipes(similar_recipes):
 
 
 if __name__ == "__main__":
-    db_path = 'groceries.db' 
+    db_path = get_db_path()
     top_3 = get_top_3_cooked_recipes(db_path)
     calculator = RecipeSimilarityCalculator(db_path)
 
@@ -1,26 +1,80 @@
 """Easy recommendation system based on cosine similarity between ingredients"""
 
+import json
 import sqlite3
+import numpy as np
 import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from amount_comparison import extract_value_and_unit, convert_to_common_unit
+from amount_comparison import extract_value_and_unit, convert_to_common_unit, parse_base_amount, base_amount_columns
+from recipe_index import RecipeVectorIndex, IncrementalQueryScores
+from recipe_lsh import ApproximateRecipeIndex
+from ingredient_index import InvertedIngredientIndex
+from recipe_feasibility import FeasibilityEngine
+from recipe_bitsets import CategoryBitsets
+from purchase_planner import PurchasePlanner
+from meal_planner import MealPlanner
+from nutrient_index import NutrientIndex, NUTRIENTS
+from database import connect, close_connection, get_db_path, get_writer
+from repositories import (GroceriesRepository, HomeRepository, RecipesRepository, ShoppingListRepository,
+                          CookedRecipesRepository, ChosenForRecipeRepository, RecipeIngredientsRepository,
+                          RecipeNutritionRepository)
+from recipe_ingredients import backfill_recipe_ingredients, format_amount
+from change_tracking import table_version
+from full_text_search import DEFAULT_SEARCH_LIMIT
 
 class RecipeRecommender:
-    def __init__(self, db_path):
-        # Initialize the connection to the SQLite database
-        self.conn = sqlite3.connect(db_path)
+    def __init__(self, db_path=None):
+        # Shared connection to the SQLite database (one per thread, set up once per process)
+        db_path = get_db_path(db_path)
+        self.db_path = db_path
+        self.conn = connect(db_path)
         self.cursor = self.conn.cursor()
+        self.groceries = GroceriesRepository(self.conn)
+        self.home = HomeRepository(self.conn)
+        self.recipes = RecipesRepository(self.conn)
+        self.recipe_ingredients = RecipeIngredientsRepository(self.conn)
+        self.recipe_ingredients_version = None
+        self.recipe_nutrition = RecipeNutritionRepository(self.conn)
+        # Per-serving nutrients as NumPy columns, for range queries
+        self.nutrient_index = NutrientIndex(self.conn)
+        self.shopping_list = ShoppingListRepository(self.conn)
+        self.cooked_recipes = CookedRecipesRepository(self.conn)
+        self.chosen_for_recipe = ChosenForRecipeRepository(self.conn)
+        # TF-IDF vectors of all recipes, loaded lazily from disk and kept up to date incrementally
+        self.recipe_index = RecipeVectorIndex(db_path)
+        # Similarities to the home inventory, updated with the changed categories only
+        self.home_scores = IncrementalQueryScores(self.recipe_index)
+        # MinHash/LSH buckets over the same index, only built when approximate mode is used
+        self.approximate_index = ApproximateRecipeIndex(self.recipe_index)
+        # Category -> recipe ids posting lists, kept in SQLite and mirrored in memory
+        self.ingredient_index = InvertedIngredientIndex(self.conn)
+        # Recipes x categories amounts vs. home inventory, for vectorized availability checks
+        self.feasibility = FeasibilityEngine(self.conn, prepare=self.ensure_recipe_ingredients)
+        # Recipe category sets as bitsets, for "missing at most k categories" searches
+        self.category_bitsets = CategoryBitsets(self.conn)
+        # Per-category grocery pack tables and the cheapest-purchase solver
+        self.purchase_planner = PurchasePlanner(self.conn, self.feasibility)
+        # Several recipes planned together, sharing the packs bought for them
+        self.meal_planner = MealPlanner(self.conn, self.feasibility, self.purchase_planner)
+
+    def write(self, job):
+        # Runs a job (a function of the writer's connection) on the database's writer thread, once committed
+        return get_writer(self.db_path).submit(job).result()
+
+    def search_groceries(self, text, limit=DEFAULT_SEARCH_LIMIT):
+        # (name, category) of the grocery items best matching the text
+        return self.groceries.search(text, limit=limit, select='t.name, t.category')
+
+    def search_recipes(self, text, limit=DEFAULT_SEARCH_LIMIT):
+        # (id, name) of the recipes best matching the text
+        return self.recipes.search(text, limit=limit)
 
     def get_home_ingredients(self):
         # Fetch all ingredients available at home from the 'home' table
-        self.cursor.execute("SELECT name, category FROM home")
-        return self.cursor.fetchall()
+        return self.home.get_all()
 
     def get_recipes(self):
         # Fetch all recipes from the 'recipes' table
-        self.cursor.execute("SELECT id, name, ingredients FROM recipes")
-        return self.cursor.fetchall()
+        return self.recipes.get_all()
 
 
     def prepare_recipe_data(self):
@@ -33,43 +87,135 @@ class RecipeRecommender:
         # Convert the recipe data to a pandas DataFrame for easier manipulation
         return pd.DataFrame(recipe_data, columns=['id', 'name', 'ingredients'])
 
-    def recommend_recipes(self, top_n=5):
+    def get_recipe_names(self, recipe_ids):
+        # Fetch the names of the given recipes, keyed by id
+        return self.recipes.get_names(recipe_ids)
+
+    def get_recipes_with_categories(self, categories):
+        # Ids of all recipes that contain every one of the given categories
+        return self.ingredient_index.recipes_with_all(categories)
+
+    def get_recipes_missing_at_most(self, k=1):
+        # Recipes missing at most k ingredient categories at home, grouped by the missing categories
+        return self.category_bitsets.missing_at_most(k)
+
+    def recommend_recipes(self, top_n=5, approximate=False):
         # Get ingredients available at home
         home_ingredients = self.get_home_ingredients()
         # Create a space-separated string of home ingredient categories
         home_ingredients_string = ' '.join([category for _, category in home_ingredients])
 
-        # Prepare recipe data
-        recipe_df = self.prepare_recipe_data()
-
-        # Create a TF-IDF vectorizer
-        # This will convert our ingredient lists into numerical vectors
-        tfidf = TfidfVectorizer(token_pattern=r'\b\w+\b')
-
-        # Fit the vectorizer on recipe ingredients and transform them to TF-IDF vectors
-        recipe_vectors = tfidf.fit_transform(recipe_df['ingredients'])
-
-        # Transform the home ingredients to a TF-IDF vector
-        home_vector = tfidf.transform([home_ingredients_string])
-
-        # Calculate cosine similarity between home ingredients and all recipes
-        # This measures how similar each recipe is to the ingredients we have at home
-        cosine_similarities = cosine_similarity(home_vector, recipe_vectors).flatten()
-
-        # Add similarity scores to the recipe DataFrame
-        recipe_df['similarity'] = cosine_similarities
+        # Make sure the persistent TF-IDF index reflects added or changed recipes
+        self.recipe_index.ensure_current(self.conn)
 
-        # Sort recipes by similarity score (descending) and select top N
-        recommended_recipes = recipe_df.sort_values('similarity', ascending=False).head(top_n)
+        # Cosine similarity between the home ingredients and all recipes, kept from the
+        # previous call and only adjusted for the categories added to or removed from home
+        # (or, in approximate mode, only against the recipes in matching LSH buckets)
+        if approximate:
+            recipe_ids, similarities = self.approximate_index.top_matches(home_ingredients_string, top_n)
+        else:
+            recipe_ids, similarities = self.home_scores.top_matches(home_ingredients_string, top_n)
+        names = self.get_recipe_names(recipe_ids)
 
         # Return the ids, names and similarity scores of the top N recipes
-        return recommended_recipes[['id', 'name', 'similarity']]
-    
+        return pd.DataFrame({
+            'id': recipe_ids,
+            'name': [names.get(int(recipe_id)) for recipe_id in recipe_ids],
+            'similarity': similarities
+        })
+
+
+    def recommend_cookable_recipes(self, top_n=5, servings=None):
+        # Rank recipes by the share of their ingredients available at home in sufficient
+        # amounts, using the TF-IDF similarity to break ties
+        recipe_ids, coverage, _, _ = self.feasibility.evaluate(servings)
+        self.recipe_index.ensure_current(self.conn)
+        home_ingredients_string = ' '.join([category for _, category in self.get_home_ingredients()])
+        scores = self.home_scores.scores(home_ingredients_string)
+
+        # Align the similarity scores with the feasibility rows (both are sorted by id)
+        similarities = np.zeros(len(recipe_ids))
+        positions = np.minimum(np.searchsorted(self.recipe_index.ids, recipe_ids), max(len(scores) - 1, 0))
+        if len(scores):
+            found = self.recipe_index.ids[positions] == recipe_ids
+            similarities[found] = scores[positions[found]]
+
+        best = np.lexsort((-similarities, -coverage))[:top_n]
+        names = self.get_recipe_names(recipe_ids[best])
+        return pd.DataFrame({
+            'id': recipe_ids[best],
+            'name': [names.get(int(recipe_id)) for recipe_id in recipe_ids[best]],
+            'cookable': coverage[best],
+            'similarity': similarities[best]
+        })
+
+    def recommend_recipes_by_nutrition(self, ranges, top_n=5, order_by=None, descending=True):
+        """
+        Recipes whose per-serving nutrients lie within `ranges`, e.g.
+        {'protein': (30, None), 'calories': (None, 600)}, ranked by the
+        `order_by` nutrient or, without one, by TF-IDF similarity to the home
+        ingredients as in recommend_recipes.
+        """
+        self.recipe_index.ensure_current(self.conn)
+        home_ingredients_string = ' '.join([category for _, category in self.get_home_ingredients()])
+        scores = self.home_scores.scores(home_ingredients_string)
+        if order_by is not None:
+            recipe_ids, values = self.nutrient_index.query(ranges, order_by, descending, top_n)
+        else:
+            # Only the recipes within range compete on similarity
+            in_range = self.nutrient_index.contains(self.recipe_index.ids, ranges)
+            recipe_ids, _ = self.recipe_index.top_of_scores(np.where(in_range, scores, -np.inf), top_n)
+            recipe_ids = recipe_ids[self.nutrient_index.contains(recipe_ids, ranges)]
+            values = self.nutrient_index.values[np.searchsorted(self.nutrient_index.ids, recipe_ids)]
+
+        # Similarity of the selected recipes, aligned as in recommend_cookable_recipes
+        similarities = np.zeros(len(recipe_ids))
+        if len(scores):
+            positions = np.minimum(np.searchsorted(self.recipe_index.ids, recipe_ids), len(scores) - 1)
+            found = self.recipe_index.ids[positions] == recipe_ids
+            similarities[found] = scores[positions[found]]
+        names = self.get_recipe_names(recipe_ids)
+        result = pd.DataFrame({
+            'id': recipe_ids,
+            'name': [names.get(int(recipe_id)) for recipe_id in recipe_ids],
+            'similarity': similarities
+        })
+        for column, nutrient in enumerate(NUTRIENTS):
+            result[nutrient] = values[:, column]
+        return result
+
+    def get_insufficient_ingredients(self, recipe_id, servings=None):
+        # Categories of a recipe that are missing or not available in sufficient amounts
+        return [category for category, _, _ in self.feasibility.shortfalls(recipe_id, servings)]
+
+    def plan_cheapest_purchase(self, recipe_id, servings=None):
+        # Cheapest grocery packs covering what is missing at home for the recipe
+        return self.purchase_planner.plan_recipe(recipe_id, servings)
+
+    def recommend_cheapest_recipes(self, top_n=5, budget=None, servings=None):
+        # Recipes that are cheapest to cook right now, given what is already at home
+        recipe_ids, costs = self.purchase_planner.cheapest_recipes(top_n, budget, servings)
+        names = self.get_recipe_names(recipe_ids)
+        return pd.DataFrame({
+            'id': recipe_ids,
+            'name': [names.get(int(recipe_id)) for recipe_id in recipe_ids],
+            'cost': costs
+        })
+
+    def plan_week(self, n_recipes=7, servings=None, nutrition_targets=None, time_budget=5.0):
+        return self.meal_planner.plan_week(n_recipes, servings, nutrition_targets, time_budget)
+
+    def add_meal_plan_to_shopping_list(self, plan):
+        # All packs of a meal plan go to the shopping list in a single upsert
+        packs = [(pack['id'], count) for purchase in plan['purchases'].values() for pack, count in purchase['packs']]
+        try:
+            self.write(lambda conn: ShoppingListRepository(conn).add_packs(packs))
+        except sqlite3.Error as e:
+            print(f"An error occurred: {e}")
 
     def get_home_ingredient_amount(self, ingredient):
-        self.cursor.execute("SELECT amount FROM home WHERE category = ?", (ingredient,))
-        result = self.cursor.fetchone()
-        return result[0] if result else "0g"
+        amount = self.home.get_amount(ingredient)
+        return amount if amount is not None else "0g"
 
     def is_sufficient_amount(self, home_amount, required_amount):
         home_value, home_unit = extract_value_and_unit(home_amount)
@@ -80,173 +226,154 @@ class RecipeRecommender:
         
         return home_common >= required_common
 
+    def has_enough_at_home(self, ingredient, required_amount):
+        # Sufficiency check on the stored base amounts of the home inventory
+        value, unit = base_amount_columns(required_amount)
+        return value is not None and self.home.has_enough(ingredient, value, unit)
+
     def get_grocery_item_amount(self, name):
-        self.cursor.execute("SELECT amount FROM groceries WHERE name = ?", (name,))
-        result = self.cursor.fetchone()
-        return result[0] if result else "0g"
+        amount = self.groceries.get_amount(name)
+        return amount if amount is not None else "0g"
     
+    def get_grocery_item_base_amount(self, name):
+        # (value, unit) of a grocery item in grams, millilitres or pieces; (0.0, '') if unknown or unreadable
+        row = self.groceries.get_base_amount(name)
+        if row is None or row[0] is None:
+            return 0.0, ''
+        return row
+
     def get_grocery_item_price(self, name):
-        self.cursor.execute("SELECT price FROM groceries WHERE name = ?", (name,))
-        result = self.cursor.fetchone()
-        return result[0] if result else 0.0
+        price = self.groceries.get_price(name)
+        return price if price is not None else 0.0
 
     def get_recipe_ingredients(self, recipe_id):
         # Fetch ingredients for a specific recipe
-        self.cursor.execute("SELECT ingredients FROM recipes WHERE id = ?", (int(recipe_id),))
-        return set(self.cursor.fetchone()[0].split())
+        return set(self.recipes.get_ingredients(recipe_id).split())
     
     def get_home_ingredients_by_category(self, category):
         # Fetch all home ingredients of a specific category
-        self.cursor.execute("SELECT name, price, amount FROM home WHERE category = ?", (category,))
-        return self.cursor.fetchall()
+        return self.home.get_by_category(category)
 
     def get_grocery_items_by_category(self, category):
         # Fetch all grocery items of a specific category
-        self.cursor.execute("SELECT id, name, price, amount FROM groceries WHERE category = ?", (category,))
-        return self.cursor.fetchall()
+        return self.groceries.get_by_category(category)
 
     def add_to_chosen_for_recipe(self, name, category, price, athome, amount):
         # Add a chosen ingredient to the 'chosenforrecipe' table
-        self.cursor.execute("""
-            INSERT INTO chosenforrecipe (name, category, price, athome, amount)
-            VALUES (?, ?, ?, ?, ?)
-        """, (name, category, price, athome, amount))
-        self.conn.commit()
+        self.write(lambda conn: ChosenForRecipeRepository(conn).add(name, category, price, athome, amount))
 
     def get_total_prices(self):
         # Calculate both the total price and the price for items not at home
-        self.cursor.execute("""
-            SELECT 
-                SUM(price) as total_price,
-                SUM(CASE WHEN athome = 0 THEN price ELSE 0 END) as to_buy_price
-            FROM chosenforrecipe
-        """)
-        return self.cursor.fetchone()
+        return self.chosen_for_recipe.get_total_prices()
     
     def clear_chosen_for_recipe(self):
         # Clear all entries from the 'chosenforrecipe' table
-        self.cursor.execute("DELETE FROM chosenforrecipe")
-        self.conn.commit()
+        self.write(lambda conn: ChosenForRecipeRepository(conn).clear())
 
 
     def add_to_shopping_list(self, name=None, category=None, price=None, amount=None, quantity=None):
         try:
             if name is None:  # This is the original bulk add from chosenforrecipe
-                self.cursor.execute("SELECT name, category, price, amount FROM chosenforrecipe WHERE athome = 0")
-                items_to_buy = self.cursor.fetchall()
+                # One INSERT ... SELECT ... ON CONFLICT DO UPDATE for all items not at home
+                added = self.write(lambda conn: ShoppingListRepository(conn).add_chosen_for_recipe())
 
-                if not items_to_buy:
+                if not added:
                     print("No items need to be added to the shopping list.")
                     return
 
-                for name, category, price, amount in items_to_buy:
-                    self._add_or_update_shopping_list_item(name, category, price, amount)
-
-                print(f"Updated shopping list with {len(items_to_buy)} item(s).")
+                print(f"Updated shopping list with {added} item(s).")
             else:  # This is for adding a single item from the shopping list dialog
-                self._add_or_update_shopping_list_item(name, category, price, amount, quantity)
-
-            self.conn.commit()
+                self.write(lambda conn: self._add_or_update_shopping_list_item(conn, name, category, price,
+                                                                               amount, quantity))
 
         except sqlite3.Error as e:
             print(f"An error occurred: {e}")
-            self.conn.rollback()
-
-    def _add_or_update_shopping_list_item(self, name, category, price, amount, quantity=None):
-        # Get the original amount from the groceries table
-        self.cursor.execute("SELECT amount FROM groceries WHERE name = ?", (name,))
-        original_amount = self.cursor.fetchone()
-
-        if original_amount:
-            original_amount = original_amount[0]
-            # Calculate the quantity ratio
-            current_amount_value = self.get_amount_value(amount)
-            original_amount_value = self.get_amount_value(original_amount)
-            quantity_ratio = current_amount_value / original_amount_value if original_amount_value != 0 else 0
-
-            # Use provided quantity if available, otherwise use calculated ratio
-            quantity_to_add = quantity if quantity is not None else quantity_ratio
-
-            # Check if the item already exists in the shopping list
-            self.cursor.execute("SELECT amount, price, quantity FROM shoppinglist WHERE name = ?", (name,))
-            existing_item = self.cursor.fetchone()
-
-            if existing_item:
-                existing_amount, existing_price, existing_quantity = existing_item
-                # Add the amounts together
-                new_amount_value = self.get_amount_value(existing_amount) + current_amount_value
-                new_amount = f"{new_amount_value}{self.get_amount_unit(existing_amount)}"
-                new_price = existing_price + price
-                new_quantity = existing_quantity + quantity_to_add
-
-                # Update the existing item
-                self.cursor.execute("""
-                    UPDATE shoppinglist 
-                    SET amount = ?, price = ?, quantity = ?
-                    WHERE name = ?
-                """, (new_amount, new_price, new_quantity, name))
-            else:
-                # Insert new item
-                self.cursor.execute("""
-                    INSERT INTO shoppinglist (name, category, price, amount, quantity)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (name, category, price, amount, quantity_to_add))
 
+    def set_shopping_list_quantity(self, name, quantity):
+        # Amount and price are scaled with the quantity in SQL; quantity 0 removes the item
+        self.write(lambda conn: ShoppingListRepository(conn).set_quantity(name, quantity))
 
+    def _add_or_update_shopping_list_item(self, conn, name, category, price, amount, quantity=None):
+        # Single upsert; without a quantity the number of packs is computed from the groceries pack size
+        ShoppingListRepository(conn).merge(name, category, price, amount, quantity)
 
     def get_amount_value(self, amount_str):
-        return float(''.join(char for char in amount_str if char.isdigit() or char == '.'))
-
-    def get_amount_unit(self, amount_str):
-        return ''.join(char for char in amount_str if char.isalpha())
+        # Numeric amount in grams, millilitres or pieces
+        return parse_base_amount(amount_str)[0]
 
     def add_to_cooked_recipes(self, recipe_id):
         # Get the recipe name from the 'recipes' table
-        self.cursor.execute("SELECT name FROM recipes WHERE id = ?", (int(recipe_id),))
-        recipe_name = self.cursor.fetchone()[0]
-        
-        # Check if the recipe already exists in the 'cookedrecipes' table
-        self.cursor.execute("SELECT quantity FROM cookedrecipes WHERE name = ?", (recipe_name,))
-        existing_recipe = self.cursor.fetchone()
-        
-        if existing_recipe:
-            # If the recipe exists, update the quantity
-            new_quantity = existing_recipe[0] + 1
-            self.cursor.execute("UPDATE cookedrecipes SET quantity = ? WHERE name = ?", (new_quantity, recipe_name))
-        else:
-            # If the recipe doesn't exist, insert a new row with quantity 1
-            self.cursor.execute("INSERT INTO cookedrecipes (name, quantity) VALUES (?, 1)", (recipe_name,))
+        recipe_name = self.recipes.get_name(recipe_id)
         
-        self.conn.commit()
+        # Insert the recipe into 'cookedrecipes', or increase how often it was cooked
+        self.write(lambda conn: CookedRecipesRepository(conn).increment(recipe_name))
+
+    def ensure_recipe_ingredients(self):
+        version = table_version(self.conn, 'recipes')
+        if version != self.recipe_ingredients_version:
+            # Recipes added since the last call (e.g. by a CSV import) get their rows now
+            self.write(backfill_recipe_ingredients)
+            self.recipe_ingredients_version = version
+
+    def get_recipe_ingredient_rows(self, recipe_id):
+        # (category, original_text, value, unit) of every ingredient, from 'recipe_ingredients'
+        self.ensure_recipe_ingredients()
+        return self.recipe_ingredients.get_ingredients(recipe_id)
+
+    def save_recipe_summary(self, recipe_id, summary):
+        self.write(lambda conn: RecipesRepository(conn).set_summary(recipe_id, summary))
+
+    def get_recipe_nutrition(self, recipe_id):
+        # (calories, fat, protein, carbs, sugar, fiber) per serving, or None when not calculated yet
+        return self.recipe_nutrition.get(recipe_id)
+
+    def cook_session(self, recipes):
+        # JSON of [recipe_id, servings] pairs; recipes is {recipe_id: servings} or pairs, servings None = as written
+        pairs = recipes.items() if isinstance(recipes, dict) else recipes
+        return json.dumps([[int(recipe_id), servings] for recipe_id, servings in pairs])
+
+    def cook_recipes(self, recipes):
+        """
+        Finishes cooking one or more recipes ({recipe_id: servings}) in a single
+        transaction: the combined, scaled consumption per category is taken off
+        'home' with set-based updates and every recipe is counted in
+        'cookedrecipes'. Either all of it is recorded or nothing is. Returns the
+        (category, unit, missing amount) of what home did not hold enough of.
+        """
+        self.ensure_recipe_ingredients()
+        session = self.cook_session(recipes)
+
+        def write(conn):
+            home = HomeRepository(conn)
+            shortfalls = home.shortfalls(session)
+            home.consume(session)
+            CookedRecipesRepository(conn).add_session(session)
+            return shortfalls
+        try:
+            return self.write(write)
+        except sqlite3.Error as e:
+            print(f"An error occurred: {e}")
+            raise
 
     def get_recipe_amounts(self, recipe_id):
-        self.cursor.execute("SELECT ingredients, amount FROM recipes WHERE id = ?", (int(recipe_id),))
-        result = self.cursor.fetchone()
-        print(result)
-        if result:
-            ingredients = result[0].split(' ')
-            amounts = result[1].split(' ')
-            return dict(zip(ingredients, amounts)) 
-        return {}
+        return {category: format_amount(value, unit)
+                for category, _, value, unit in self.get_recipe_ingredient_rows(recipe_id)}
 
 
 
     def get_recipe_ingredients_and_amounts(self, recipe_id):
-        self.cursor.execute("SELECT ingredients, amount, servings FROM recipes WHERE id = ?", (recipe_id,))
-        result = self.cursor.fetchone()
+        result = self.recipes.get_ingredients_and_amounts(recipe_id)
         if result:
-            ingredients = result[0].split()  # Split by whitespace
-            amounts = result[1].split()  # Split by whitespace
+            rows = self.get_recipe_ingredient_rows(recipe_id)
             original_servings = result[2]
-            return list(zip(ingredients, amounts)), original_servings
+            return [(category, format_amount(value, unit)) for category, _, value, unit in rows], original_servings
         return [], 1
 
-    def update_home_ingredients(self, recipe_id, cooked_servings):
-        recipe_ingredients, original_servings = self.get_recipe_ingredients_and_amounts(recipe_id)
-        scaling_factor = cooked_servings / original_servings
-        for ingredient, amount in recipe_ingredients:
-            scaled_amount = self.scale_amount(amount, scaling_factor)
-            self.subtract_ingredient_from_home(ingredient, scaled_amount)
+    def update_home_ingredients(self, recipe_id, cooked_servings=None):
+        # Only the home part of cook_recipes, for one recipe
+        self.ensure_recipe_ingredients()
+        session = self.cook_session({recipe_id: cooked_servings})
+        self.write(lambda conn: HomeRepository(conn).consume(session))
 
     def scale_amount(self, amount, factor):
         value, unit = extract_value_and_unit(amount)
@@ -254,17 +381,9 @@ class RecipeRecommender:
         return f"{new_value:.2f}{unit}"
 
     def subtract_ingredient_from_home(self, ingredient, amount):
-        self.cursor.execute("SELECT amount FROM home WHERE category = ?", (ingredient,))
-        result = self.cursor.fetchone()
-        if result:
-            home_amount = result[0]
-            new_amount = self.calculate_new_amount(home_amount, amount, subtract=True)
-            if new_amount[0] <= 0:
-                self.cursor.execute("DELETE FROM home WHERE category = ?", (ingredient,))
-            else:
-                new_amount = f"{new_amount[0]:.2f}{new_amount[1]}"
-                self.cursor.execute("UPDATE home SET amount = ? WHERE category = ?", (new_amount, ingredient))
-            self.conn.commit()
+        value, unit = base_amount_columns(amount)
+        if value is not None:
+            self.write(lambda conn: HomeRepository(conn).consume_amounts([(ingredient, unit, value)]))
 
     def calculate_new_amount(self, amount1, amount2, subtract=False):
         value1, unit1 = extract_value_and_unit(amount1)
@@ -359,12 +478,12 @@ class RecipeRecommender:
         self.clear_chosen_for_recipe()
 
     def close_connection(self):
-        # Close the database connection
-        self.conn.close()
+        # Close this thread's shared connection; the next connect() opens a new one
+        close_connection(self.db_path)
 
 if __name__ == "__main__":
     # Create a RecipeRecommender instance
-    recommender = RecipeRecommender('groceries.db')
+    recommender = RecipeRecommender()
     
     # Let the user choose a recipe
     chosen_recipe_id, chosen_recipe_name = recommender.interactive_recipe_selection()
@@ -0,0 +1,621 @@
+"""
+Data access for the tables of groceries.db. Every query of the scripts and of
+RecipeRecommender goes through these classes, on the shared per-thread
+connection from database.connect(). Repositories never commit: the caller
+decides where a transaction ends.
+"""
+
+import json
+from database import connect
+from amount_comparison import base_amount_columns, UNIT_FACTORS
+from full_text_search import search, DEFAULT_SEARCH_LIMIT
+
+
+def amount_text(value_expression):
+    # SQL expression for the amount string of a new base value, e.g. 700 and 'g' -> '700g'
+    return f"CASE WHEN amount_value IS NULL THEN amount ELSE printf('%g', {value_expression}) || amount_unit END"
+
+
+# Recipes of a cook session, passed as JSON [[recipe_id, servings or null], ...] in :session
+COOK_SESSION = """
+    session(recipe_id, servings) AS (
+        SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]') FROM json_each(:session)
+    )
+"""
+
+# Factor to the base unit of every unit recipe amounts are written in (no unit counts pieces)
+UNIT_ROWS = ', '.join(f"('{unit}', {factor}, '{base_unit}')"
+                      for unit, (factor, base_unit) in [('', (1, 'piece'))] + list(UNIT_FACTORS.items()))
+
+# Combined consumption of a cook session per (category, base unit), scaled to the servings cooked
+SESSION_CONSUMPTION = COOK_SESSION + f""",
+    units(unit, factor, base_unit) AS (VALUES {UNIT_ROWS}),
+    consumption(category, amount_unit, needed) AS (
+        SELECT ri.category, u.base_unit, SUM(ri.value * u.factor * COALESCE(s.servings / r.servings, 1))
+        FROM session s
+        JOIN recipes r ON r.id = s.recipe_id
+        JOIN recipe_ingredients ri ON ri.recipe_id = s.recipe_id
+        JOIN units u ON u.unit = ri.unit
+        WHERE ri.value IS NOT NULL
+        GROUP BY ri.category, u.base_unit
+    )
+"""
+
+# Amounts to take off the home inventory, passed as JSON [[category, base unit, value], ...] in :amounts
+AMOUNTS_CONSUMPTION = """
+    consumption(category, amount_unit, needed) AS (
+        SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]'), SUM(json_extract(value, '$[2]'))
+        FROM json_each(:amounts)
+        GROUP BY 1, 2
+    )
+"""
+
+
+class Repository:
+    table = None
+    # Tables whose 'amount' strings are also stored as amount_value/amount_unit in base units
+    base_amounts = False
+
+    def __init__(self, conn=None):
+        self.conn = conn if conn is not None else connect()
+
+    def insert_many(self, columns, rows, upsert_key=None):
+        """
+        Inserts rows (sequences of values in `columns` order) with one prepared
+        statement. With `upsert_key`, a row whose key already exists updates the
+        other columns instead; the key needs a unique index.
+        """
+        if self.base_amounts and 'amount' in columns:
+            position = list(columns).index('amount')
+            columns = list(columns) + ['amount_value', 'amount_unit']
+            rows = (tuple(row) + base_amount_columns(row[position]) for row in rows)
+        placeholders = ', '.join('?' for _ in columns)
+        sql = f"INSERT INTO {self.table} ({', '.join(columns)}) VALUES ({placeholders})"
+        if upsert_key is not None:
+            updates = ', '.join(f"{column} = excluded.{column}" for column in columns if column != upsert_key)
+            sql += f" ON CONFLICT ({upsert_key}) DO UPDATE SET {updates}"
+        return self.conn.executemany(sql, rows).rowcount
+
+    def count(self):
+        return self.conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+class GroceriesRepository(Repository):
+    table = 'groceries'
+    base_amounts = True
+
+    def search(self, search_term, search_type='both', limit=DEFAULT_SEARCH_LIMIT, select='t.*'):
+        # Full-text search (see full_text_search.py): 'both' also searches brand and description
+        columns = [search_type] if search_type in ('name', 'category') else None
+        return search(self.conn, 'groceries', search_term, limit, columns=columns, select=select)
+
+    def get_item(self, item_id):
+        # (name, category, price) of a grocery item, or None
+        return self.conn.execute("SELECT name, category, price FROM groceries WHERE id = ?", (item_id,)).fetchone()
+
+    def exists(self, name):
+        return self.conn.execute("SELECT 1 FROM groceries WHERE name = ?", (name,)).fetchone() is not None
+
+    def get_all(self):
+        # (id, name, category, price) of every grocery item
+        return self.conn.execute("SELECT id, name, category, price FROM groceries").fetchall()
+
+    def clear(self):
+        self.conn.execute("DELETE FROM groceries")
+
+    def add(self, name, category, price, amount):
+        self.conn.execute("""
+            INSERT INTO groceries (name, category, price, amount, amount_value, amount_unit)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (name, category, price, amount) + base_amount_columns(amount))
+
+    def get_amount(self, name):
+        row = self.conn.execute("SELECT amount FROM groceries WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def get_base_amount(self, name):
+        # (amount_value, amount_unit) of a grocery item, or None
+        return self.conn.execute("SELECT amount_value, amount_unit FROM groceries WHERE name = ?", (name,)).fetchone()
+
+    def get_price(self, name):
+        row = self.conn.execute("SELECT price FROM groceries WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def get_by_category(self, category):
+        # (id, name, price, amount) of every grocery item of a category
+        return self.conn.execute("SELECT id, name, price, amount FROM groceries WHERE category = ?",
+                                 (category,)).fetchall()
+
+
+class HomeRepository(Repository):
+    table = 'home'
+    base_amounts = True
+
+    def add(self, name, category, price, amount):
+        self.conn.execute("""
+            INSERT INTO home (name, category, price, amount, amount_value, amount_unit)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (name, category, price, amount) + base_amount_columns(amount))
+
+    def get_all(self):
+        # (name, category) of everything at home
+        return self.conn.execute("SELECT name, category FROM home").fetchall()
+
+    def get_amount(self, category):
+        row = self.conn.execute("SELECT amount FROM home WHERE category = ?", (category,)).fetchone()
+        return row[0] if row else None
+
+    def get_by_category(self, category):
+        # (name, price, amount) of every home item of a category
+        return self.conn.execute("SELECT name, price, amount FROM home WHERE category = ?", (category,)).fetchall()
+
+    def get_totals(self):
+        # (category, total amount_value, amount_unit) of everything at home with a readable amount
+        return self.conn.execute("""
+            SELECT category, SUM(amount_value), amount_unit FROM home
+            WHERE amount_value IS NOT NULL
+            GROUP BY category, amount_unit
+        """).fetchall()
+
+    def has_enough(self, category, value, unit):
+        # Whether the home inventory holds at least `value` (in base unit `unit`) of a category
+        row = self.conn.execute("""
+            SELECT COALESCE(SUM(amount_value), 0) >= ? FROM home
+            WHERE category = ? AND amount_unit = ?
+        """, (value, category, unit)).fetchone()
+        return bool(row[0])
+
+    def update_amount(self, category, amount):
+        self.conn.execute("UPDATE home SET amount = ?, amount_value = ?, amount_unit = ? WHERE category = ?",
+                          (amount,) + base_amount_columns(amount) + (category,))
+
+    def shortfalls(self, session):
+        # (category, base unit, missing amount) of what a cook session needs beyond the home inventory
+        return self.conn.execute(f"""
+            WITH {SESSION_CONSUMPTION},
+            available(category, amount_unit, total) AS (
+                SELECT category, amount_unit, SUM(amount_value) FROM home GROUP BY category, amount_unit
+            )
+            SELECT c.category, c.amount_unit, c.needed - COALESCE(a.total, 0)
+            FROM consumption c
+            LEFT JOIN available a ON a.category = c.category AND a.amount_unit = c.amount_unit
+            WHERE c.needed > COALESCE(a.total, 0)
+        """, {'session': session}).fetchall()
+
+    def consume(self, session):
+        # Takes the combined consumption of a cook session off the home inventory
+        return self.use_up(SESSION_CONSUMPTION, {'session': session})
+
+    def consume_amounts(self, amounts):
+        # Takes (category, base unit, value) amounts off the home inventory
+        return self.use_up(AMOUNTS_CONSUMPTION, {'amounts': json.dumps(
+            [[category, unit, value] for category, unit, value in amounts])})
+
+    def use_up(self, consumption, params):
+        """
+        Takes the `consumption` CTE (category, amount_unit, needed) off the home
+        inventory in one UPDATE: the rows of a category are used up in id
+        order, using the running total of the rows before them, and rows that
+        reach zero are deleted. Returns the number of rows changed.
+        """
+        changed = self.conn.execute(f"""
+            WITH {consumption},
+            taken(id, amount) AS (
+                SELECT h.id, MIN(h.amount_value, MAX(c.needed - COALESCE(SUM(h.amount_value) OVER (
+                    PARTITION BY h.category, h.amount_unit ORDER BY h.id
+                    ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING), 0), 0))
+                FROM home h
+                JOIN consumption c ON c.category = h.category AND c.amount_unit = h.amount_unit
+            )
+            UPDATE home
+            SET amount_value = home.amount_value - taken.amount,
+                amount = printf('%g', home.amount_value - taken.amount) || home.amount_unit
+            FROM taken
+            WHERE home.id = taken.id AND taken.amount > 0
+        """, params).rowcount
+        self.conn.execute("DELETE FROM home WHERE amount_value <= 0")
+        return changed
+
+    def delete_category(self, category):
+        self.conn.execute("DELETE FROM home WHERE category = ?", (category,))
+
+
+class RecipesRepository(Repository):
+    table = 'recipes'
+
+    def get_all(self):
+        # (id, name, ingredients) of every recipe
+        return self.conn.execute("SELECT id, name, ingredients FROM recipes").fetchall()
+
+    def search(self, text, limit=DEFAULT_SEARCH_LIMIT):
+        # (id, name) of the recipes whose name, ingredients or summary match, best match first
+        return search(self.conn, 'recipes', text, limit, select='t.id, t.name')
+
+    def get_names(self, recipe_ids):
+        # {id: name} of the given recipes
+        ids = [int(recipe_id) for recipe_id in recipe_ids]
+        if not ids:
+            return {}
+        placeholders = ', '.join('?' for _ in ids)
+        return dict(self.conn.execute(f"SELECT id, name FROM recipes WHERE id IN ({placeholders})", ids))
+
+    def get_name(self, recipe_id):
+        row = self.conn.execute("SELECT name FROM recipes WHERE id = ?", (int(recipe_id),)).fetchone()
+        return row[0] if row else None
+
+    def get_ingredients(self, recipe_id):
+        row = self.conn.execute("SELECT ingredients FROM recipes WHERE id = ?", (int(recipe_id),)).fetchone()
+        return row[0] if row else None
+
+    def get_ingredients_and_amounts(self, recipe_id):
+        # (ingredients, amount, servings) of a recipe, or None
+        return self.conn.execute("SELECT ingredients, amount, servings FROM recipes WHERE id = ?",
+                                 (int(recipe_id),)).fetchone()
+
+    def get_id(self, name):
+        # First recipe of that name, as used by the name-based lookups
+        row = self.conn.execute("SELECT MIN(id) FROM recipes WHERE name = ?", (name,)).fetchone()
+        return row[0]
+
+    def set_summary(self, recipe_id, summary):
+        self.conn.execute("UPDATE recipes SET summary = ? WHERE id = ?", (summary, int(recipe_id)))
+
+
+class RecipeIngredientsRepository(Repository):
+    table = 'recipe_ingredients'
+
+    def get_ingredients(self, recipe_id):
+        # (category, original_text, value, unit) of every ingredient of a recipe, in recipe order
+        return self.conn.execute("""
+            SELECT category, original_text, value, unit FROM recipe_ingredients
+            WHERE recipe_id = ?
+            ORDER BY position
+        """, (int(recipe_id),)).fetchall()
+
+    def get_all_amounts(self, recipe_ids=None):
+        # (recipe_id, category, value, unit) of every ingredient of every recipe, or of the given recipes only
+        if recipe_ids is None:
+            return self.conn.execute("""
+                SELECT recipe_id, category, value, unit FROM recipe_ingredients
+                ORDER BY recipe_id, position
+            """).fetchall()
+        return self.conn.execute("""
+            SELECT recipe_id, category, value, unit FROM recipe_ingredients
+            WHERE recipe_id IN (SELECT value FROM json_each(?))
+            ORDER BY recipe_id, position
+        """, (json.dumps([int(recipe_id) for recipe_id in recipe_ids]),)).fetchall()
+
+
+class RecipeNutritionRepository(Repository):
+    table = 'recipe_nutrition'
+
+    columns = ['calories', 'fat', 'protein', 'carbs', 'sugar', 'fiber']
+
+    def get(self, recipe_id):
+        # (calories, fat, protein, carbs, sugar, fiber) per serving of a recipe, or None
+        return self.conn.execute(f"SELECT {', '.join(self.columns)} FROM recipe_nutrition WHERE recipe_id = ?",
+                                 (int(recipe_id),)).fetchone()
+
+    def get_all(self):
+        # (recipe_id, calories, fat, protein, carbs, sugar, fiber) per serving of every recipe, by id
+        return self.conn.execute(
+            f"SELECT recipe_id, {', '.join(self.columns)} FROM recipe_nutrition ORDER BY recipe_id").fetchall()
+
+    def get_recipe_totals(self):
+        # {recipe_id: nutrients of the whole recipe}, i.e. per serving times the recipe's servings
+        totals = ', '.join(f"n.{column} * r.servings" for column in self.columns)
+        return {row[0]: row[1:] for row in self.conn.execute(f"""
+            SELECT n.recipe_id, {totals}
+            FROM recipe_nutrition n
+            JOIN recipes r ON r.id = n.recipe_id
+        """)}
+
+    def delete_many(self, recipe_ids):
+        return self.conn.execute("DELETE FROM recipe_nutrition WHERE recipe_id IN (SELECT value FROM json_each(?))",
+                                 (json.dumps([int(recipe_id) for recipe_id in recipe_ids]),)).rowcount
+
+    def get_dirty(self, limit):
+        # Recipes queued for recomputation by the triggers on nutrition and recipes, oldest id first
+        return [row[0] for row in self.conn.execute(
+            "SELECT recipe_id FROM recipe_nutrition_dirty ORDER BY recipe_id LIMIT ?", (limit,))]
+
+    def clear_dirty(self, recipe_ids=None):
+        # Takes the given recipes, or all of them, off the queue
+        if recipe_ids is None:
+            self.conn.execute("DELETE FROM recipe_nutrition_dirty")
+            return
+        self.conn.execute("DELETE FROM recipe_nutrition_dirty WHERE recipe_id IN (SELECT value FROM json_each(?))",
+                          (json.dumps([int(recipe_id) for recipe_id in recipe_ids]),))
+
+    def set_totals_many(self, rows):
+        """
+        Stores (recipe id, nutrients of the whole recipe) pairs as values per
+        serving. Returns the number of recipes written.
+        """
+        per_serving = ', '.join(f":{column} / servings" for column in self.columns)
+        updates = ', '.join(f"{column} = excluded.{column}" for column in self.columns)
+        return self.conn.executemany(f"""
+            INSERT INTO recipe_nutrition (recipe_id, {', '.join(self.columns)})
+            SELECT id, {per_serving} FROM recipes WHERE id = :recipe_id AND servings > 0
+            ON CONFLICT (recipe_id) DO UPDATE SET {updates}
+        """, [dict(zip(self.columns, map(float, totals)), recipe_id=int(recipe_id))
+              for recipe_id, totals in rows]).rowcount
+
+
+class ProductNutritionRepository(Repository):
+    table = 'product_nutrition'
+
+    # Ranking columns: price per 100g/ml, nutrients per 100g/ml and nutrients per currency unit
+    columns = (['price_per_100'] + RecipeNutritionRepository.columns
+               + [f"{nutrient}_per_price" for nutrient in RecipeNutritionRepository.columns])
+
+    def top(self, column, category=None, limit=10, ascending=None):
+        """
+        (name, category, value) of the `limit` best products by a ranking
+        column, optionally within one category: "protein_per_price" gives the
+        most protein per currency unit, "sugar" with ascending=True the least
+        sugar per 100g. Only price_per_100 ranks ascending by default.
+        """
+        if column not in self.columns:
+            raise ValueError(f"Unknown ranking '{column}', expected one of {', '.join(self.columns)}")
+        if ascending is None:
+            ascending = column == 'price_per_100'
+        where = "WHERE category = ?" if category is not None else ""
+        params = ([category] if category is not None else []) + [limit]
+        return self.conn.execute(f"""
+            SELECT name, category, {column} FROM product_nutrition
+            {where}
+            ORDER BY {column} {'ASC' if ascending else 'DESC'}
+            LIMIT ?
+        """, params).fetchall()
+
+
+class NutritionRepository(Repository):
+    table = 'nutrition'
+
+    def get_all_values(self):
+        # {category: (calories, fat, protein, carbs, sugar, fiber)}, from the first nutrition row of each category
+        return {row[0]: row[1:] for row in self.conn.execute("""
+            SELECT category, calories, fat, protein, carbs, sugar, fiber
+            FROM nutrition
+            WHERE id IN (SELECT MIN(id) FROM nutrition GROUP BY category)
+        """)}
+
+    def get_values(self, category):
+        # (calories, fat, protein, carbs, sugar, fiber) per 100g/ml of a category, or None
+        return self.conn.execute("""
+            SELECT calories, fat, protein, carbs, sugar, fiber
+            FROM nutrition
+            WHERE category = ?
+        """, (category,)).fetchone()
+
+    def get_recipe_totals(self, recipe_name):
+        """
+        Nutrition of a whole recipe in one query over its recipe_ingredients rows
+        (nutrition values are per 100g/ml, amounts are converted to grams or
+        millilitres). Returns (totals, skipped, missing):
+        the six summed nutrients, the categories skipped for lack of a unit, and
+        the categories without nutrition information.
+        """
+        row = self.conn.execute(f"""
+            WITH units(unit, factor, base_unit) AS (VALUES {UNIT_ROWS}),
+            items AS (
+                SELECT ri.category, CASE WHEN u.base_unit <> 'piece' THEN ri.value * u.factor END AS value,
+                       n.id AS nutrition_id, n.calories, n.fat, n.protein, n.carbs, n.sugar, n.fiber
+                FROM recipe_ingredients ri
+                LEFT JOIN units u ON u.unit = ri.unit
+                LEFT JOIN nutrition n ON n.id = (SELECT MIN(id) FROM nutrition WHERE category = ri.category)
+                WHERE ri.recipe_id = (SELECT MIN(id) FROM recipes WHERE name = ?)
+            )
+            SELECT
+                SUM(value * calories) / 100, SUM(value * fat) / 100, SUM(value * protein) / 100,
+                SUM(value * carbs) / 100, SUM(value * sugar) / 100, SUM(value * fiber) / 100,
+                group_concat(CASE WHEN value IS NULL THEN category END, ','),
+                group_concat(CASE WHEN value IS NOT NULL AND nutrition_id IS NULL THEN category END, ','),
+                COUNT(*)
+            FROM items
+        """, (recipe_name,)).fetchone()
+        if row[8] == 0:
+            return None
+        totals = [value or 0.0 for value in row[:6]]
+        skipped = row[6].split(',') if row[6] else []
+        missing = row[7].split(',') if row[7] else []
+        return totals, skipped, missing
+
+
+    def replace_many(self, rows):
+        # (name, category, amount, calories, fat, protein, carbs, sugar, fiber) rows, replacing rows of the same name
+        rows = list(rows)
+        self.conn.executemany("DELETE FROM nutrition WHERE name = ?", [(row[0],) for row in rows])
+        self.conn.executemany("""
+            INSERT INTO nutrition (name, category, amount, calories, fat, protein, carbs, sugar, fiber)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+
+
+class GroceryNutritionRepository(Repository):
+    table = 'grocery_nutrition'
+
+    def replace_many(self, rows):
+        # (grocery name, calories, fat, protein, carbs, sugar, fiber) rows per 100g/ml, replacing the product's label
+        return self.conn.executemany("""
+            INSERT OR REPLACE INTO grocery_nutrition (grocery_id, calories, fat, protein, carbs, sugar, fiber)
+            SELECT id, ?, ?, ?, ?, ?, ? FROM groceries WHERE name = ?
+        """, [tuple(row[1:]) + (row[0],) for row in rows]).rowcount
+
+
+# Number of packs of grocery item g that an amount corresponds to (0 when the units differ)
+PACK_QUANTITY = ("CASE WHEN g.amount_unit = {unit} AND g.amount_value > 0 "
+                 "THEN {value} / g.amount_value ELSE 0 END")
+
+# Merges an item that is already on the shopping list: base amounts, prices and quantities are summed
+SHOPPING_LIST_UPSERT = f"""
+    ON CONFLICT (name) DO UPDATE SET
+        amount_value = CASE WHEN amount_unit = excluded.amount_unit
+                            THEN amount_value + excluded.amount_value ELSE amount_value END,
+        amount = CASE WHEN amount_unit = excluded.amount_unit
+                      THEN {amount_text('amount_value + excluded.amount_value')} ELSE amount END,
+        price = price + excluded.price,
+        quantity = quantity + excluded.quantity
+"""
+
+
+class ShoppingListRepository(Repository):
+    table = 'shoppinglist'
+    base_amounts = True
+
+    def get_item(self, name):
+        # (amount, price, quantity) of an item on the shopping list, or None
+        return self.conn.execute("SELECT amount, price, quantity FROM shoppinglist WHERE name = ?",
+                                 (name,)).fetchone()
+
+    def add(self, name, category, price, amount, quantity):
+        self.conn.execute("""
+            INSERT INTO shoppinglist (name, category, price, amount, quantity, amount_value, amount_unit)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (name, category, price, amount, quantity) + base_amount_columns(amount))
+
+    def merge(self, name, category, price, amount, quantity=None):
+        """
+        Adds an item of the groceries table to the list in one upsert: an item
+        already on the list gets the amount (in base units), price and quantity
+        added. Without a quantity, it is the amount divided by the pack size.
+        Items missing from the groceries table are ignored.
+        """
+        value, unit = base_amount_columns(amount)
+        packs = PACK_QUANTITY.format(value=':value', unit=':unit')
+        return self.conn.execute(f"""
+            INSERT INTO shoppinglist (name, category, price, amount, quantity, amount_value, amount_unit)
+            SELECT :name, :category, :price, :amount, COALESCE(:quantity, {packs}), :value, :unit
+            FROM groceries g
+            WHERE g.id = (SELECT MIN(id) FROM groceries WHERE name = :name)
+            {SHOPPING_LIST_UPSERT}
+        """, {'name': name, 'category': category, 'price': price, 'amount': amount, 'quantity': quantity,
+              'value': value, 'unit': unit}).rowcount
+
+    def add_packs(self, packs):
+        """
+        Adds whole packs of grocery items ((grocery id, count) pairs) to the list
+        in a single INSERT ... SELECT ... ON CONFLICT DO UPDATE, taking name,
+        category, price and pack size from the groceries rows. Returns the
+        number of items inserted or updated.
+        """
+        return self.conn.execute(f"""
+            WITH packs(grocery_id, count) AS (
+                SELECT json_extract(value, '$[0]'), SUM(json_extract(value, '$[1]'))
+                FROM json_each(:packs)
+                GROUP BY 1
+            )
+            INSERT INTO shoppinglist (name, category, price, amount, quantity, amount_value, amount_unit)
+            SELECT g.name, g.category, g.price * p.count,
+                   printf('%g', g.amount_value * p.count) || CASE WHEN g.amount_unit = 'piece' THEN '' ELSE g.amount_unit END,
+                   p.count, g.amount_value * p.count, g.amount_unit
+            FROM packs p
+            JOIN groceries g ON g.id = p.grocery_id
+            WHERE true
+            {SHOPPING_LIST_UPSERT}
+        """, {'packs': json.dumps([[int(grocery_id), count] for grocery_id, count in packs])}).rowcount
+
+    def add_chosen_for_recipe(self):
+        """
+        Moves the chosen items that are not at home to the shopping list with a
+        single INSERT ... SELECT ... ON CONFLICT DO UPDATE, summing amounts,
+        prices and pack quantities per item in SQL. Returns the number of items
+        inserted or updated.
+        """
+        packs = PACK_QUANTITY.format(value='c.amount_value', unit='c.amount_unit')
+        return self.conn.execute(f"""
+            INSERT INTO shoppinglist (name, category, price, amount, quantity, amount_value, amount_unit)
+            SELECT c.name, MIN(c.category), SUM(c.price),
+                   CASE WHEN SUM(c.amount_value) IS NULL THEN MIN(c.amount)
+                        ELSE printf('%g', SUM(c.amount_value)) || MIN(c.amount_unit) END,
+                   SUM({packs}), SUM(c.amount_value), MIN(c.amount_unit)
+            FROM chosenforrecipe c
+            JOIN groceries g ON g.id = (SELECT MIN(id) FROM groceries WHERE name = c.name)
+            WHERE c.athome = 0
+            GROUP BY c.name
+            {SHOPPING_LIST_UPSERT}
+        """).rowcount
+
+    def set_quantity(self, name, quantity):
+        # Scales amount and price of an item to a new quantity; quantity 0 removes it
+        if quantity <= 0:
+            self.conn.execute("DELETE FROM shoppinglist WHERE name = ?", (name,))
+            return
+        self.conn.execute(f"""
+            UPDATE shoppinglist
+            SET amount_value = amount_value * :quantity / quantity,
+                amount = {amount_text('amount_value * :quantity / quantity')},
+                price = price * :quantity / quantity,
+                quantity = :quantity
+            WHERE name = :name AND quantity > 0
+        """, {'quantity': quantity, 'name': name})
+
+
+class CookedRecipesRepository(Repository):
+    table = 'cookedrecipes'
+
+    def increment(self, name):
+        # One more time cooked; the first time inserts the recipe with quantity 1
+        self.conn.execute("""
+            INSERT INTO cookedrecipes (name, quantity) VALUES (?, 1)
+            ON CONFLICT (name) DO UPDATE SET quantity = quantity + 1
+        """, (name,))
+
+    def add_session(self, session):
+        # Counts every recipe of a cook session (JSON, see COOK_SESSION) as cooked once more
+        self.conn.execute(f"""
+            WITH {COOK_SESSION}
+            INSERT INTO cookedrecipes (name, quantity)
+            SELECT r.name, COUNT(*) FROM session s JOIN recipes r ON r.id = s.recipe_id
+            WHERE true
+            GROUP BY r.name
+            ON CONFLICT (name) DO UPDATE SET quantity = quantity + excluded.quantity
+        """, {'session': session})
+
+    def most_cooked(self, limit):
+        # (name, times cooked) of the `limit` recipes cooked most often
+        return self.conn.execute("SELECT name, quantity FROM cookedrecipes ORDER BY quantity DESC, name LIMIT ?",
+                                 (limit,)).fetchall()
+
+
+class ChosenForRecipeRepository(Repository):
+    table = 'chosenforrecipe'
+    base_amounts = True
+
+    def add(self, name, category, price, athome, amount):
+        self.conn.execute("""
+            INSERT INTO chosenforrecipe (name, category, price, athome, amount, amount_value, amount_unit)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (name, category, price, athome, amount) + base_amount_columns(amount))
+
+    def get_total_prices(self):
+        # Total price and the price of the items not at home
+        return self.conn.execute("""
+            SELECT
+                SUM(price) as total_price,
+                SUM(CASE WHEN athome = 0 THEN price ELSE 0 END) as to_buy_price
+            FROM chosenforrecipe
+        """).fetchone()
+
+    def get_items_to_buy(self):
+        return self.conn.execute("SELECT name, category, price, amount FROM chosenforrecipe WHERE athome = 0").fetchall()
+
+    def clear(self):
+        self.conn.execute("DELETE FROM chosenforrecipe")
+
+
+class GroceryListRepository(Repository):
+    table = 'grocerylist'
+
+    def add(self, name, category, price):
+        self.conn.execute("INSERT INTO grocerylist (name, category, price) VALUES (?, ?, ?)", (name, category, price))
+
+    def get_all(self):
+        return self.conn.execute("SELECT * FROM grocerylist").fetchall()
+
+    def total_price(self):
+        return self.conn.execute("SELECT SUM(price) FROM grocerylist").fetchone()[0]
+
+    def clear(self):
+        self.conn.execute("DELETE FROM grocerylist")
@@ -0,0 +1,296 @@
+"""Streaming import of tesco_groceries_dataset.csv into the 'groceries' and 'grocery_nutrition' tables"""
+
+import re
+import ast
+import csv
+import sys
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+from database import get_writer
+from amount_comparison import parse_base_amount
+from recipe_ingredients import format_amount
+from repositories import GroceriesRepository, GroceryNutritionRepository
+
+# Products parsed and written per transaction
+BATCH_SIZE = 500
+
+# Pack size units of the dataset that are weights or volumes; others (e.g. 'SHT' sheets) are not food
+PACK_UNITS = {'mg': 'mg', 'g': 'g', 'kg': 'kg', 'ml': 'ml', 'cl': 'cl', 'l': 'l', 'ltr': 'l'}
+
+PACK_SIZE_PATTERN = re.compile(r"^\s*Pack size:\s*(\d+(?:\.\d+)?)\s*([A-Za-z]+)\s*$")
+# Size at the end of a product name, used when pack_size is empty: "Schwartz Fish Seasoning 55G"
+NAME_SIZE_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*(MG|G|KG|ML|CL|L|LTR)$", re.IGNORECASE)
+NUMBER_PATTERN = re.compile(r"(\d+(?:\.\d+)?)")
+KCAL_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*kcal", re.IGNORECASE)
+KJ_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*kj", re.IGNORECASE)
+
+# Nutrient of a (normalized) nutrition label, checked in order: 'of which sugars' before 'carbohydrate'
+NUTRITION_LABELS = [
+    ('saturat', None),
+    ('sugar', 'sugar'),
+    ('fibre', 'fiber'),
+    ('fiber', 'fiber'),
+    ('carbohydrate', 'carbs'),
+    ('protein', 'protein'),
+    ('fat', 'fat'),
+]
+
+# Top-level Tesco departments without food (category is 'Department~Aisle~Shelf')
+NON_FOOD_DEPARTMENTS = {'Home & Ents', 'Health & Beauty', 'Household', 'Pets'}
+
+# Nutrients every imported nutrition row needs; sugar and fibre default to 0 when not listed
+REQUIRED_NUTRIENTS = ['calories', 'fat', 'protein', 'carbs']
+
+# Store brands that lead a product name without being in its brand column
+HOUSE_BRANDS = {'tesco', 'finest'}
+
+# Words of a size or pack count after the head noun: "6 X 70Ml", "1 Litre", "4 Pack"
+SIZE_WORDS = {'x', 'pack', 'packs', 'litre', 'litres', 'ltr', 'g', 'kg', 'mg', 'ml', 'cl', 'l'}
+
+# Words that may come before the head noun without changing what the product is
+DESCRIPTORS = {
+    'organic', 'british', 'english', 'scottish', 'welsh', 'irish', 'spanish', 'italian', 'greek', 'french',
+    'dijon', 'wholegrain', 'serrano', 'parma',
+    'fresh', 'frozen', 'chilled', 'natural', 'original', 'plain', 'pure', 'classic', 'wild',
+    'smooth', 'crunchy', 'creamy', 'thick', 'thin', 'mild', 'medium', 'mature', 'extra', 'vintage', 'strong', 'hot',
+    'very', 'low', 'reduced', 'fat', 'free', 'range', 'skimmed', 'semi', 'whole', 'uht', 'soft', 'hard',
+    'light', 'dark', 'white', 'brown', 'black', 'red', 'green', 'yellow', 'golden',
+    'sweet', 'salted', 'unsalted', 'smoked', 'unsmoked', 'processed', 'ground', 'crushed', 'sliced', 'diced',
+    'chopped', 'grated', 'cooked', 'roast', 'roasted', 'seedless', 'large', 'small', 'mini', 'baby',
+}
+
+_word_to_category = None
+
+
+class RejectedRow(Exception):
+    pass
+
+
+def word_to_category():
+    # Built once per process (worker processes build their own)
+    global _word_to_category
+    if _word_to_category is None:
+        from recipe_adder import category_mapping, create_word_to_category_mapping
+        _word_to_category = create_word_to_category_mapping(category_mapping)
+    return _word_to_category
+
+
+def parse_pack_size(pack_size, name=''):
+    # 'Pack size: 266G' -> ('266g', 266.0, 'g'): amount string in the base unit, value and base unit
+    match = PACK_SIZE_PATTERN.match(pack_size or '') or NAME_SIZE_PATTERN.search((name or '').strip())
+    if not match:
+        raise RejectedRow(f"no pack size: {pack_size!r}")
+    unit = PACK_UNITS.get(match.group(2).lower())
+    if unit is None:
+        raise RejectedRow(f"pack size is not a weight or volume: {pack_size!r}")
+    value, base_unit = parse_base_amount(f"{match.group(1)}{unit}")
+    if value <= 0:
+        raise RejectedRow(f"empty pack size: {pack_size!r}")
+    return format_amount(value, base_unit), value, base_unit
+
+
+def map_category(name, brand=''):
+    """
+    Category of the head noun of a product name, the ingredient phrase that
+    ends it once the brand words in front and the size at the end are taken
+    off ("Tesco Finest Mature Cheddar 400G" -> cheddar). Any word before the
+    head other than a plain descriptor makes the name ambiguous, so "Meridian
+    Smooth Peanut Butter", "Butter Chicken Cooking Sauce" and "Stock Cubes
+    Mushroom" are rejected instead of being filed under butter, chicken or
+    mushroom.
+    """
+    words = re.findall(r"[a-z0-9.]+", name.lower())
+    brand_words = set(re.findall(r"[a-z0-9.]+", (brand or '').lower())) | HOUSE_BRANDS
+    while words and words[0] in brand_words:
+        words.pop(0)
+    while words and (words[-1] in SIZE_WORDS or any(char.isdigit() for char in words[-1])):
+        words.pop()
+    if not words:
+        raise RejectedRow("no product name besides brand and size")
+    mapping = word_to_category()
+    # Longest phrase first, so "brown sugar" is not matched as "sugar"
+    for length in (3, 2, 1):
+        head = words[-length:]
+        category = mapping.get(' '.join(head)) if len(head) == length else None
+        if category is not None:
+            break
+    else:
+        raise RejectedRow(f"no category for the head noun {words[-1]!r}")
+    modifiers = [word for word in words[:-length] if word not in DESCRIPTORS]
+    if modifiers:
+        raise RejectedRow(f"ambiguous product name: {' '.join(modifiers)!r} before {' '.join(head)!r}")
+    return category
+
+
+def normalize_label(label):
+    return re.sub(r"[^a-z ]", ' ', label.lower()).strip()
+
+
+def parse_nutrition(text):
+    """
+    Parses the dataset's nutrition literal (a list of one-entry dicts such as
+    {' - kcal': '274kcal'}, {'Fat ': '15g'}, {'- of which Sugars ': '3.0g'},
+    values per 100g/ml) into {calories, fat, protein, carbs, sugar, fiber}. The
+    first value of each nutrient wins; energy given only in kJ is converted.
+    """
+    try:
+        entries = ast.literal_eval(text) if text else []
+    except (ValueError, SyntaxError):
+        raise RejectedRow("unreadable nutrition")
+    values = {}
+    kilojoules = None
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        for label, value in entry.items():
+            value = str(value)
+            kcal = KCAL_PATTERN.search(value)
+            if kcal:
+                values.setdefault('calories', float(kcal.group(1)))
+                continue
+            kj = KJ_PATTERN.search(value)
+            if kj:
+                kilojoules = kilojoules if kilojoules is not None else float(kj.group(1))
+                continue
+            label = normalize_label(str(label))
+            number = NUMBER_PATTERN.search(value)
+            # Unit in the label instead of the value: {'Energy (kcal)': '596'}
+            if number and 'kcal' in label.split():
+                values.setdefault('calories', float(number.group(1)))
+                continue
+            if number and 'kj' in label.split():
+                kilojoules = kilojoules if kilojoules is not None else float(number.group(1))
+                continue
+            for keyword, nutrient in NUTRITION_LABELS:
+                if keyword in label:
+                    if nutrient is not None and number:
+                        values.setdefault(nutrient, float(number.group(1)))
+                    break
+    if 'calories' not in values and kilojoules is not None:
+        values['calories'] = round(kilojoules / 4.184, 1)
+    missing = [nutrient for nutrient in REQUIRED_NUTRIENTS if nutrient not in values]
+    if missing:
+        raise RejectedRow(f"nutrition without {', '.join(missing)}")
+    values.setdefault('sugar', 0.0)
+    values.setdefault('fiber', 0.0)
+    return values
+
+
+def parse_row(item):
+    """
+    Parses one CSV row (line number, dict) into (line, name, grocery row or
+    None, nutrition row or None, rejection reasons).
+    Runs in the worker processes, so it only uses module-level state.
+    """
+    line, row = item
+    name = (row.get('name') or '').strip()
+    reasons = []
+    try:
+        if not name:
+            raise RejectedRow("no name")
+        department = (row.get('category') or '').split('~')[0]
+        if department in NON_FOOD_DEPARTMENTS:
+            raise RejectedRow(f"not a food department: {department}")
+        try:
+            price = float(row.get('price') or '')
+        except ValueError:
+            raise RejectedRow(f"invalid price: {row.get('price')!r}")
+        amount, amount_value, amount_unit = parse_pack_size(row.get('pack_size'), name)
+        category = map_category(name, row.get('brand'))
+    except RejectedRow as e:
+        return line, name, None, None, [str(e)]
+
+    grocery = (name, category, price, amount, amount_value, amount_unit,
+               (row.get('brand') or '').strip() or None, (row.get('description') or '').strip() or None)
+    nutrition = None
+    try:
+        values = parse_nutrition(row.get('nutrition'))
+        nutrition = (name, values['calories'], values['fat'], values['protein'], values['carbs'], values['sugar'],
+                     values['fiber'])
+    except RejectedRow as e:
+        reasons.append(f"nutrition: {e}")
+    return line, name, grocery, nutrition, reasons
+
+
+def read_rows(csv_file_path):
+    # Lazily yields (line number, row dict); the header is line 1
+    with open(csv_file_path, 'r', newline='', encoding='utf-8') as csv_file:
+        for line, row in enumerate(csv.DictReader(csv_file), start=2):
+            yield line, row
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def write_batch(groceries, nutrition):
+    # Writer job: upserts the products by name and replaces their nutrition labels
+    def write(conn):
+        GroceriesRepository(conn).insert_many(
+            ['name', 'category', 'price', 'amount', 'amount_value', 'amount_unit', 'brand', 'description'],
+            groceries, upsert_key='name')
+        GroceryNutritionRepository(conn).replace_many(nutrition)
+        return len(groceries), len(nutrition)
+    return write
+
+
+def import_tesco_dataset(csv_file_path='tesco_groceries_dataset.csv', db_path=None, workers=None,
+                         batch_size=BATCH_SIZE, reject_report='tesco_rejects.csv'):
+    """
+    Streams the dataset into 'groceries' and 'grocery_nutrition', one writer
+    transaction per batch of batch_size rows. With workers > 1 rows are parsed
+    in a process pool (for large dumps). Rows that do not parse are listed in
+    the reject_report CSV (line, name, reason). Returns (products, nutrition
+    rows, rejected rows).
+    """
+    writer = get_writer(db_path)
+    executor = ProcessPoolExecutor(workers) if workers and workers > 1 else None
+    products = nutrition_rows = 0
+    rejects = []
+    pending = None
+    try:
+        for batch in batches(read_rows(csv_file_path), batch_size):
+            if executor is not None:
+                parsed = executor.map(parse_row, batch, chunksize=max(1, len(batch) // (4 * workers)))
+            else:
+                parsed = map(parse_row, batch)
+            groceries, nutrition = [], []
+            for line, name, grocery, nutrition_row, reasons in parsed:
+                if grocery is not None:
+                    groceries.append(grocery)
+                if nutrition_row is not None:
+                    nutrition.append(nutrition_row)
+                rejects.extend((line, name, reason) for reason in reasons)
+            # At most one batch is waiting for the writer while the next one is parsed
+            if pending is not None:
+                written = pending.result()
+                products, nutrition_rows = products + written[0], nutrition_rows + written[1]
+            pending = writer.submit(write_batch(groceries, nutrition))
+        if pending is not None:
+            written = pending.result()
+            products, nutrition_rows = products + written[0], nutrition_rows + written[1]
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if reject_report:
+        with open(reject_report, 'w', newline='', encoding='utf-8') as report:
+            report_writer = csv.writer(report)
+            report_writer.writerow(['line', 'name', 'reason'])
+            report_writer.writerows(rejects)
+
+    rejected = len({line for line, _, reason in rejects if not reason.startswith('nutrition:')})
+    print(f"Imported {products} products and {nutrition_rows} nutrition labels; {rejected} rows rejected.")
+    if reject_report and rejects:
+        print(f"See {reject_report} for the rows that could not be parsed.")
+    return products, nutrition_rows, rejected
+
+
+if __name__ == "__main__":
+    import_tesco_dataset(sys.argv[1] if len(sys.argv) > 1 else 'tesco_groceries_dataset.csv',
+                         workers=int(sys.argv[2]) if len(sys.argv) > 2 else None)
@@ -0,0 +1,40 @@
+import pytest
+
+from amount_comparison import (parse_base_amount, base_amount_columns, extract_value_and_unit,
+                               is_enough_ingredient)
+
+
+@pytest.mark.parametrize('amount, expected', [
+    ('300g', (300.0, 'g')),
+    ('1.5 kg', (1500.0, 'g')),
+    ('250mg', (0.25, 'g')),
+    ('2l', (2000.0, 'ml')),
+    ('33cl', (330.0, 'ml')),
+    ('4pieces', (4.0, 'piece')),
+    ('1 piece', (1.0, 'piece')),
+    ('1/4', (0.25, 'piece')),
+])
+def test_parse_base_amount_converts_to_the_base_unit(amount, expected):
+    assert parse_base_amount(amount) == expected
+
+
+@pytest.mark.parametrize('amount', ['2head', '1 loaf', 'a pinch', ''])
+def test_parse_base_amount_rejects_unknown_units(amount):
+    with pytest.raises(ValueError):
+        parse_base_amount(amount)
+    assert base_amount_columns(amount) == (None, None)
+
+
+def test_extract_value_and_unit_keeps_unknown_units():
+    assert extract_value_and_unit('1kg') == (1000.0, 'g')
+    assert extract_value_and_unit('1loaf') == (1.0, 'loaf')
+    assert extract_value_and_unit('2 Head') == (2.0, 'head')
+    with pytest.raises(ValueError):
+        extract_value_and_unit('a pinch')
+
+
+def test_is_enough_ingredient():
+    assert is_enough_ingredient('1kg', '500g')
+    assert not is_enough_ingredient('0.5l', '600ml')
+    # Amounts in units that cannot be compared are not enough
+    assert not is_enough_ingredient('1loaf', '500g')
@@ -0,0 +1,48 @@
+import sqlite3
+
+import pytest
+
+from database import DatabaseWriter, connect, close_connection
+
+
+@pytest.fixture
+def writer(tmp_path):
+    db_path = str(tmp_path / 'groceries.db')
+    connect(db_path)
+    writer = DatabaseWriter(db_path)
+    yield writer
+    writer.close()
+    close_connection(db_path)
+
+
+def add_item(name, fail=False):
+    def write(conn):
+        conn.execute("INSERT INTO grocerylist (name, category, price) VALUES (?, 'test', 1.0)", (name,))
+        if fail:
+            raise ValueError(name)
+        return name
+    return write
+
+
+def names(writer):
+    return writer.submit(lambda conn: [row[0] for row in conn.execute("SELECT name FROM grocerylist")]).result()
+
+
+def test_failed_job_alone_is_rolled_back(writer):
+    with pytest.raises(ValueError):
+        writer.submit(add_item('a', fail=True)).result()
+    assert writer.submit(add_item('b')).result() == 'b'
+    assert names(writer) == ['b']
+
+
+def test_failed_job_in_batch_leaves_the_others(writer):
+    # Blocks the writer so the next jobs are queued and committed as one batch
+    blocker = sqlite3.connect(writer.db_path)
+    blocker.execute("BEGIN IMMEDIATE")
+    futures = [writer.submit(add_item('a')), writer.submit(add_item('b', fail=True)), writer.submit(add_item('c'))]
+    blocker.rollback()
+    blocker.close()
+    assert futures[0].result() == 'a' and futures[2].result() == 'c'
+    with pytest.raises(ValueError):
+        futures[1].result()
+    assert names(writer) == ['a', 'c']
@@ -0,0 +1,84 @@
+import sqlite3
+
+import pytest
+
+import migrations
+from migrations import MIGRATIONS, HOT_QUERIES, migrate, schema_version, check_query_plans
+from change_tracking import track_table_changes, table_version
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'groceries.db'))
+    yield conn
+    conn.close()
+
+
+def fill(conn, rows=500):
+    # Enough rows per table that ANALYZE makes the planner prefer the indexes for real
+    migrate(conn)
+    conn.executemany("INSERT INTO groceries (name, category, price, amount) VALUES (?, ?, ?, ?)",
+                     [(f"product {i}", f"category {i % 50}", 1.5, '500g') for i in range(rows)])
+    conn.executemany("INSERT INTO home (name, category, price, amount) VALUES (?, ?, ?, ?)",
+                     [(f"product {i}", f"category {i % 50}", 1.5, '500g') for i in range(rows)])
+    conn.executemany("INSERT INTO nutrition (name, category, amount, calories, fat, protein, carbs, sugar, fiber) "
+                     "VALUES (?, ?, '100g', 100, 1, 2, 3, 4, 5)",
+                     [(f"product {i}", f"category {i % 50}") for i in range(rows)])
+    conn.executemany("INSERT INTO recipes (name, original_ingredients, ingredients, amount, servings, link) "
+                     "VALUES (?, ?, ?, ?, 2, '')",
+                     [(f"recipe {i}", f"category {i % 50}", f"category {i % 50}", '200g') for i in range(rows)])
+    conn.execute("ANALYZE")
+    conn.commit()
+
+
+def test_migrate_applies_every_version_once(conn):
+    assert migrate(conn) == [version for version, _, _ in MIGRATIONS]
+    assert schema_version(conn) == MIGRATIONS[-1][0]
+    assert migrate(conn) == []
+    assert not conn.in_transaction
+
+
+@pytest.mark.parametrize('populated', [False, True])
+def test_hot_queries_use_an_index(conn, populated):
+    if populated:
+        fill(conn)
+    else:
+        migrate(conn)
+    results = check_query_plans(conn)
+    assert len(results) == len(HOT_QUERIES)
+    scans = [f"{query}: {plan}" for query, plan, uses_index in results if not uses_index]
+    assert not scans
+
+
+def test_failed_step_leaves_no_partial_schema(conn, monkeypatch):
+    migrate(conn)
+
+    def failing_step(conn):
+        # A helper that committed here would keep the counter of 'nutrition' after the failure
+        track_table_changes(conn, 'nutrition')
+        raise sqlite3.OperationalError('step failed')
+
+    version = MIGRATIONS[-1][0] + 1
+    monkeypatch.setattr(migrations, 'MIGRATIONS', MIGRATIONS + [(version, 'failing step', failing_step)])
+    with pytest.raises(sqlite3.OperationalError):
+        migrate(conn)
+    assert schema_version(conn) == version - 1
+    assert table_version(conn, 'nutrition') is None
+    assert conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'nutrition_version_insert'").fetchone() is None
+
+
+def test_duplicate_grocery_names_keep_every_pack(conn, monkeypatch, caplog):
+    # Duplicates from before the unique index: exact copies go, other packs are renamed after their amount
+    monkeypatch.setattr(migrations, 'MIGRATIONS', [step for step in MIGRATIONS if step[0] <= 3])
+    migrate(conn)
+    conn.executemany("INSERT INTO groceries (name, category, price, amount) VALUES (?, ?, ?, ?)",
+                     [('pesto', 'pesto', 2.45, '190g'), ('rice', 'rice', 1.0, '1kg'), ('pesto', 'pesto', 3.1, '250g'),
+                      ('pesto', 'pesto', 3.1, '250g'), ('pesto', 'pesto', 3.5, '250g'), ('rice', 'rice', 1.0, '1kg')])
+    conn.commit()
+    monkeypatch.setattr(migrations, 'MIGRATIONS', MIGRATIONS)
+    migrate(conn)
+    assert conn.execute("SELECT id, name, price, amount_value FROM groceries ORDER BY id").fetchall() == [
+        (1, 'pesto', 2.45, 190.0), (2, 'rice', 1.0, 1000.0), (3, 'pesto (250g)', 3.1, 250.0),
+        (5, 'pesto (250g) #5', 3.5, 250.0)]
+    assert any(row[1] == 'idx_groceries_name' and row[2] for row in conn.execute("PRAGMA index_list(groceries)"))
+    assert 'pesto' in caplog.text
@@ -0,0 +1,43 @@
+import pytest
+
+from database import close_all
+from recommender import RecipeRecommender
+
+
+@pytest.fixture
+def recommender(tmp_path):
+    recommender = RecipeRecommender(str(tmp_path / 'groceries.db'))
+    recommender.write(lambda conn: conn.executemany(
+        "INSERT INTO home (name, category, price, amount, amount_value, amount_unit) VALUES (?, ?, 1.0, ?, ?, ?)",
+        [('flour', 'flour', '1kg', 1000.0, 'g'), ('milk', 'milk', '100ml', 100.0, 'ml')]))
+    yield recommender
+    close_all()
+
+
+def add_recipe(recommender, name, ingredients, amounts, servings=2):
+    def write(conn):
+        return conn.execute("INSERT INTO recipes (name, original_ingredients, ingredients, amount, servings, link) "
+                            "VALUES (?, ?, ?, ?, ?, '')", (name, ingredients, ingredients, amounts, servings)).lastrowid
+    return recommender.write(write)
+
+
+def test_matrix_comes_from_the_parsed_recipe_ingredients(recommender):
+    pancakes = add_recipe(recommender, 'pancakes', 'flour milk egg', '200g 0.3l 2')
+
+    assert recommender.feasibility.shortfalls(pancakes, servings=4) == [
+        ('milk', 500.0, 'ml'), ('egg', 4.0, 'piece')]
+    # The engine reads the amounts of 'recipe_ingredients', not the recipe's amount string
+    assert recommender.conn.execute("SELECT COUNT(*) FROM recipe_ingredients WHERE recipe_id = ?",
+                                    (pancakes,)).fetchone()[0] == 3
+
+
+def test_recipes_added_later_are_parsed_before_the_rebuild(recommender):
+    add_recipe(recommender, 'pancakes', 'flour milk egg', '200g 300ml 2')
+    recommender.feasibility.evaluate()
+
+    bread = add_recipe(recommender, 'bread', 'flour yeast', '1.5kg 7g', servings=1)
+    recipe_ids, coverage, _, _ = recommender.feasibility.evaluate()
+
+    assert list(recipe_ids) == [1, bread]
+    assert coverage.tolist() == [pytest.approx(1 / 3), 0.0]
+    assert recommender.feasibility.shortfalls(bread) == [('flour', 500.0, 'g'), ('yeast', 7.0, 'g')]
@@ -0,0 +1,83 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from recipe_index import RecipeVectorIndex
+
+RECIPES = [
+    'flour milk egg butter',
+    'rice chicken garlic onion',
+    'pasta tomato garlic basil',
+    'chicken curry rice coconut milk',
+    'potato leek onion butter',
+    'tomato basil mozzarella',
+    'lentil onion carrot cumin',
+    'egg bacon bread',
+    'salmon rice soy ginger',
+    'apple flour butter sugar',
+]
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'groceries.db'))
+    conn.execute("CREATE TABLE recipes (id INTEGER PRIMARY KEY, ingredients TEXT)")
+    conn.executemany("INSERT INTO recipes (ingredients) VALUES (?)", [(text,) for text in RECIPES])
+    yield conn
+    conn.close()
+
+
+def document_frequencies(index):
+    return {term: int(index.doc_freq[column]) for term, column in index.vocabulary.items() if index.doc_freq[column]}
+
+
+def row_terms(index):
+    terms = sorted(index.vocabulary, key=index.vocabulary.get)
+    return [{terms[column] for column in index.matrix[row].indices} for row in range(index.matrix.shape[0])]
+
+
+def test_refresh_matches_a_full_rebuild(conn, tmp_path):
+    index = RecipeVectorIndex('groceries.db', index_path=str(tmp_path / 'incremental.npz'), rebuild_ratio=0.5)
+    assert index.refresh(conn)
+
+    conn.execute("UPDATE recipes SET ingredients = 'pasta tomato garlic chilli' WHERE id = 3")
+    conn.execute("DELETE FROM recipes WHERE id IN (5, 10)")
+    # The deleted id 10 is used again by a new recipe
+    conn.execute("INSERT INTO recipes (ingredients) VALUES ('tofu rice ginger')")
+    conn.execute("INSERT INTO recipes (ingredients) VALUES ('chickpea tomato cumin')")
+    rice_idf = index.idf[index.vocabulary['rice']]
+    assert index.refresh(conn)
+    # The incremental path ran: the idf of a known term stays frozen although its document frequency changed
+    assert index.idf[index.vocabulary['rice']] == rice_idf
+
+    rebuilt = RecipeVectorIndex('groceries.db', index_path=str(tmp_path / 'rebuilt.npz'))
+    rebuilt.refresh(conn)
+
+    np.testing.assert_array_equal(index.ids, rebuilt.ids)
+    np.testing.assert_array_equal(index.checksums, rebuilt.checksums)
+    assert index.n_docs == rebuilt.n_docs
+    assert document_frequencies(index) == document_frequencies(rebuilt)
+    assert row_terms(index) == row_terms(rebuilt)
+    # Every row is still a unit vector
+    np.testing.assert_allclose(np.sqrt(index.matrix.multiply(index.matrix).sum(axis=1)).A.ravel(), 1.0)
+
+    # The saved index loads back to the same state, and nothing is left to refresh
+    reloaded = RecipeVectorIndex('groceries.db', index_path=str(tmp_path / 'incremental.npz'))
+    assert reloaded.load()
+    np.testing.assert_array_equal(reloaded.ids, index.ids)
+    assert (reloaded.matrix != index.matrix).nnz == 0
+    assert not reloaded.refresh(conn)
+
+
+def test_refresh_rebuilds_after_many_changes(conn, tmp_path):
+    index = RecipeVectorIndex('groceries.db', index_path=str(tmp_path / 'incremental.npz'), rebuild_ratio=0.2)
+    index.refresh(conn)
+    conn.execute("UPDATE recipes SET ingredients = ingredients || ' salt' WHERE id <= 5")
+    index.refresh(conn)
+
+    rebuilt = RecipeVectorIndex('groceries.db', index_path=str(tmp_path / 'rebuilt.npz'))
+    rebuilt.refresh(conn)
+    assert index.vocabulary == rebuilt.vocabulary
+    np.testing.assert_allclose(index.idf, rebuilt.idf)
+    np.testing.assert_allclose(index.matrix.toarray(), rebuilt.matrix.toarray())
@@ -0,0 +1,86 @@
+import pytest
+
+from database import close_all, connect, get_writer
+from recipe_neighbors import build_recipe_neighbors, update_recipe_neighbors
+
+RECIPES = [
+    'flour milk egg butter sugar',
+    'rice chicken garlic onion',
+    'pasta tomato garlic basil olive',
+    'chicken curry rice coconut milk onion',
+    'potato leek onion butter stock',
+    'tomato basil mozzarella olive',
+    'lentil onion carrot cumin stock',
+    'egg bacon bread butter',
+    'salmon rice soy ginger',
+    'apple flour butter sugar cinnamon',
+    'beef onion carrot potato stock',
+    'pasta bacon egg parmesan',
+]
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    db_path = str(tmp_path / 'groceries.db')
+    connect(db_path)
+    execute(db_path, [("INSERT INTO recipes (name, original_ingredients, ingredients, amount, servings, link) "
+                       "VALUES (?, ?, ?, '', 2, '')", (f"recipe {i}", text, text)) for i, text in enumerate(RECIPES)])
+    yield db_path
+    close_all()
+
+
+def execute(db_path, statements):
+    def write(conn):
+        for sql, params in statements:
+            conn.execute(sql, params)
+    get_writer(db_path).submit(write).result()
+
+
+def neighbor_lists(db_path):
+    lists = {}
+    for recipe_id, neighbor_id, similarity in connect(db_path).execute(
+            "SELECT recipe_id, neighbor_id, similarity FROM recipe_neighbors ORDER BY recipe_id, rank"):
+        lists.setdefault(recipe_id, []).append((neighbor_id, round(similarity, 9)))
+    return lists
+
+
+def test_update_after_edits_matches_a_full_build(db_path):
+    build_recipe_neighbors(db_path, k=3)
+    last_id = len(RECIPES)
+    execute(db_path, [
+        ("UPDATE recipes SET ingredients = 'salmon rice soy ginger chilli garlic' WHERE id = 9", ()),
+        ("UPDATE recipes SET ingredients = 'pasta tomato chilli garlic' WHERE id = 3", ()),
+        ("DELETE FROM recipes WHERE id IN (5, ?)", (last_id,)),
+        # The deleted last id is taken by a new recipe, which must not keep the old recipe's list
+        ("INSERT INTO recipes (name, original_ingredients, ingredients, amount, servings, link) "
+         "VALUES ('fried rice', '', 'rice egg soy onion garlic', '', 2, '')", ()),
+    ])
+    assert connect(db_path).execute("SELECT MAX(id) FROM recipes").fetchone()[0] == last_id
+
+    update_recipe_neighbors(db_path, k=3)
+    updated = neighbor_lists(db_path)
+    build_recipe_neighbors(db_path, k=3)
+
+    assert updated == neighbor_lists(db_path)
+    assert 5 not in updated
+    assert connect(db_path).execute("SELECT COUNT(*) FROM recipe_neighbor_checksums").fetchone()[0] == len(updated)
+
+
+def test_update_without_changes_keeps_every_list(db_path):
+    build_recipe_neighbors(db_path, k=3)
+    built = neighbor_lists(db_path)
+    update_recipe_neighbors(db_path, k=3)
+    assert neighbor_lists(db_path) == built
+
+
+def test_update_after_one_edit_matches_a_full_build(db_path, capsys):
+    # Few enough changes for the vector index to be updated in place, with its idf weights frozen
+    build_recipe_neighbors(db_path, k=3)
+    execute(db_path, [("UPDATE recipes SET ingredients = 'apple flour butter sugar cinnamon egg' WHERE id = 10", ())])
+
+    update_recipe_neighbors(db_path, k=3)
+    updated = neighbor_lists(db_path)
+    assert "(0 new, 1 edited)" in capsys.readouterr().out
+    build_recipe_neighbors(db_path, k=3)
+
+    assert updated == neighbor_lists(db_path)
@@ -0,0 +1,76 @@
+import pytest
+
+from database import DatabaseWriter, connect, close_connection
+from recipe_nutrition_calculator import recompute_nutrition_batch
+
+
+@pytest.fixture
+def writer(tmp_path):
+    db_path = str(tmp_path / 'groceries.db')
+    connect(db_path)
+    writer = DatabaseWriter(db_path)
+    yield writer
+    writer.close()
+    close_connection(db_path)
+
+
+def run(writer, sql, params=()):
+    return writer.submit(lambda conn: conn.execute(sql, params).fetchall()).result()
+
+
+def recompute(writer):
+    # Drains the queue as recompute_dirty_nutrition does, on the test's writer
+    while writer.submit(recompute_nutrition_batch()).result()[0]:
+        pass
+
+
+def queue(writer):
+    return [row[0] for row in run(writer, "SELECT recipe_id FROM recipe_nutrition_dirty ORDER BY recipe_id")]
+
+
+def nutrition(writer):
+    return run(writer, "SELECT recipe_id, calories, protein FROM recipe_nutrition ORDER BY recipe_id")
+
+
+@pytest.fixture
+def recipes(writer):
+    # Two recipes using flour and one without; 100g flour: 360 kcal, 10g protein; 100ml milk: 60 kcal, 3g protein
+    def seed(conn):
+        conn.executemany("INSERT INTO nutrition (name, category, amount, calories, fat, protein, carbs, sugar, fiber) "
+                         "VALUES (?, ?, '100g', ?, 1, ?, 70, 1, 3)",
+                         [('flour', 'flour', 360, 10), ('milk', 'milk', 60, 3)])
+        conn.executemany("INSERT INTO recipes (name, original_ingredients, ingredients, amount, servings, link) "
+                         "VALUES (?, ?, ?, ?, ?, '')",
+                         [('bread', 'flour', 'flour', '500g', 5),
+                          ('pancakes', 'flour milk', 'flour milk', '200g 500ml', 2),
+                          ('milkshake', 'milk', 'milk', '300ml', 1)])
+    writer.submit(seed).result()
+    recompute(writer)
+
+
+def test_recompute_clears_the_queue_and_stores_values_per_serving(writer, recipes):
+    assert queue(writer) == []
+    assert nutrition(writer) == [(1, 360.0, 10.0), (2, 510.0, 17.5), (3, 180.0, 9.0)]
+
+
+def test_nutrition_update_queues_the_recipes_using_the_category(writer, recipes):
+    run(writer, "UPDATE nutrition SET calories = 340 WHERE category = 'flour'")
+    assert queue(writer) == [1, 2]
+
+    recompute(writer)
+    assert queue(writer) == []
+    assert nutrition(writer) == [(1, 340.0, 10.0), (2, 490.0, 17.5), (3, 180.0, 9.0)]
+
+
+def test_servings_update_queues_the_recipe(writer, recipes):
+    run(writer, "UPDATE recipes SET servings = 0 WHERE name = 'bread'")
+    recompute(writer)
+    # Without servings there is no value per serving
+    assert [row[0] for row in nutrition(writer)] == [2, 3]
+
+    run(writer, "UPDATE recipes SET servings = 4 WHERE name = 'bread'")
+    assert queue(writer) == [1]
+
+    recompute(writer)
+    assert queue(writer) == []
+    assert nutrition(writer)[0] == (1, 450.0, 12.5)
@@ -0,0 +1,95 @@
+import pytest
+
+from database import close_all, get_writer
+from recommender import RecipeRecommender
+from repositories import ShoppingListRepository
+
+
+@pytest.fixture
+def recommender(tmp_path):
+    recommender = RecipeRecommender(str(tmp_path / 'groceries.db'))
+    yield recommender
+    close_all()
+
+
+def seed(recommender, home):
+    def write(conn):
+        conn.execute("INSERT INTO recipes (name, original_ingredients, ingredients, amount, servings, link) "
+                     "VALUES ('pancakes', 'flour milk egg', 'flour milk egg', '200g 300ml 2', 2, '')")
+        conn.executemany("INSERT INTO home (name, category, price, amount, amount_value, amount_unit) "
+                         "VALUES (?, ?, 1.0, ?, ?, ?)", home)
+        return conn.execute("SELECT id FROM recipes WHERE name = 'pancakes'").fetchone()[0]
+    return recommender.write(write)
+
+
+def read(recommender, sql):
+    return get_writer(recommender.db_path).submit(lambda conn: conn.execute(sql).fetchall()).result()
+
+
+def test_cook_recipes_takes_the_scaled_amounts_off_home(recommender):
+    recipe_id = seed(recommender, [
+        ('flour', 'flour', '150g', 150.0, 'g'),
+        ('more flour', 'flour', '500g', 500.0, 'g'),
+        ('milk', 'milk', '1000ml', 1000.0, 'ml'),
+        ('egg', 'egg', '1', 1.0, 'piece'),
+    ])
+
+    # Four servings of a recipe written for two: 400g flour, 600ml milk and 4 eggs
+    shortfalls = recommender.cook_recipes({recipe_id: 4})
+
+    assert shortfalls == [('egg', 'piece', 3.0)]
+    # The first flour row is used up and deleted, the rest comes off the second one
+    assert read(recommender, "SELECT name, amount, amount_value FROM home ORDER BY id") == [
+        ('more flour', '250g', 250.0),
+        ('milk', '400ml', 400.0),
+    ]
+    assert read(recommender, "SELECT name, quantity FROM cookedrecipes") == [('pancakes', 1)]
+
+
+def test_cooking_again_counts_the_recipe_in_one_row(recommender):
+    recipe_id = seed(recommender, [('flour', 'flour', '1000g', 1000.0, 'g')])
+
+    recommender.cook_recipes({recipe_id: None})
+    shortfalls = recommender.cook_recipes([(recipe_id, None), (recipe_id, 2)])
+
+    assert sorted(shortfalls) == [('egg', 'piece', 4.0), ('milk', 'ml', 600.0)]
+    assert read(recommender, "SELECT amount_value FROM home") == [(400.0,)]
+    assert read(recommender, "SELECT name, quantity FROM cookedrecipes") == [('pancakes', 3)]
+
+
+def shopping_list(recommender, write):
+    # Runs a write on a shopping list over one grocery product, rice at 2.00 per 1000g pack
+    def job(conn):
+        conn.execute("INSERT INTO groceries (name, category, price, amount, amount_value, amount_unit) "
+                     "VALUES ('rice', 'rice', 2.0, '1000g', 1000.0, 'g')")
+        write(ShoppingListRepository(conn), conn.execute("SELECT id FROM groceries").fetchone()[0])
+    recommender.write(job)
+    return read(recommender, "SELECT name, amount, amount_value, price, quantity FROM shoppinglist")
+
+
+def test_merge_sums_the_same_item_into_one_row(recommender):
+    def write(shopping_list, grocery_id):
+        shopping_list.merge('rice', 'rice', 1.0, '500g')
+        shopping_list.merge('rice', 'rice', 1.5, '750g')
+    assert shopping_list(recommender, write) == [('rice', '1250g', 1250.0, 2.5, 1.25)]
+
+
+def test_add_packs_sums_the_same_item_into_one_row(recommender):
+    def write(shopping_list, grocery_id):
+        shopping_list.add_packs([(grocery_id, 1), (grocery_id, 2)])
+        shopping_list.add_packs([(grocery_id, 1)])
+    assert shopping_list(recommender, write) == [('rice', '4000g', 4000.0, 8.0, 4.0)]
+
+
+def test_set_quantity_scales_the_item(recommender):
+    def write(shopping_list, grocery_id):
+        shopping_list.add_packs([(grocery_id, 2)])
+        shopping_list.set_quantity('rice', 3)
+    assert shopping_list(recommender, write) == [('rice', '3000g', 3000.0, 6.0, 3.0)]
+
+
+def test_set_quantity_zero_removes_the_item(recommender):
+    def write(shopping_list, grocery_id):
+        shopping_list.add_packs([(grocery_id, 2)])
+        shopping_list.set_quantity('rice', 0)
+    assert shopping_list(recommender, write) == []
@@ -0,0 +1,53 @@
+import pytest
+
+from database import DatabaseWriter, connect, close_connection
+from repositories import NutritionRepository
+from tesco_importer import RejectedRow, map_category, write_batch
+
+
+@pytest.fixture
+def writer(tmp_path):
+    db_path = str(tmp_path / 'groceries.db')
+    connect(db_path)
+    writer = DatabaseWriter(db_path)
+    yield writer
+    writer.close()
+    close_connection(db_path)
+
+
+@pytest.mark.parametrize('name, brand, category', [
+    ('Cathedral City Mature Cheddar 550G', 'CATHEDRAL CITY', 'cheddar'),
+    ('Tesco Organic Raspberries 150G', 'TESCO', 'raspberry'),
+    ('Billingtons Light Brown Sugar 500G', 'BILLINGTONS', 'brown_sugar'),
+    ('Tesco Ground Black Pepper 50G', 'TESCO', 'pepper'),
+])
+def test_head_noun_gives_the_category(name, brand, category):
+    assert map_category(name, brand) == category
+
+
+@pytest.mark.parametrize('name, brand', [
+    ('Sharwoods Butter Chicken Cooking Sauce 420G', 'SHARWOODS'),
+    ('Meridian Smooth Peanut Butter 1Kg', 'MERIDIAN'),
+    ('Kallo Organic Stock Cubes Mushroom 66G', 'KALLO'),
+    ('Tesco Milk Chocolate Ices 6 X 70Ml', 'TESCO'),
+])
+def test_ambiguous_names_are_rejected(name, brand):
+    with pytest.raises(RejectedRow):
+        map_category(name, brand)
+
+
+def test_product_labels_stay_out_of_the_category_nutrition(writer):
+    writer.submit(lambda conn: conn.execute(
+        "INSERT INTO nutrition (name, category, amount, calories, fat, protein, carbs, sugar, fiber) "
+        "VALUES ('cheddar', 'cheddar', '100g', 410, 34, 25, 0.1, 0.1, 0)")).result()
+    product = ('Acme Mature Cheddar 200G', 'cheddar', 2.0, '200g', 200.0, 'g', 'ACME', None)
+    writer.submit(write_batch([product], [(product[0], 380, 31, 26, 0.2, 0.1, 0)])).result()
+
+    def read(conn):
+        return (NutritionRepository(conn).get_all_values(),
+                conn.execute("SELECT calories FROM grocery_nutrition").fetchall(),
+                conn.execute("SELECT name, calories FROM product_nutrition").fetchall())
+    category_values, labels, ranking = writer.submit(read).result()
+    assert category_values == {'cheddar': (410, 34, 25, 0.1, 0.1, 0)}
+    assert labels == [(380,)]
+    assert ranking == [('Acme Mature Cheddar 200G', 380)]